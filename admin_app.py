@@ -1,4 +1,7 @@
 
+import itertools
+import os
+
 import streamlit as st
 import pandas as pd
 from datetime import date
@@ -7,9 +10,23 @@ from core.shared import (
     LANG_OPTIONS,
     labels,
     load_drivers_from_db,
-    load_trips_from_db,
+    query_trips,
     ADMIN_CODE,
+    with_datetimes,
 )
+from aggregation import group_frame
+from forecast import with_forecast
+from events import LiveAggregates
+from jobs import get_job, submit
+from snapshot import get_snapshot, snapshot_trip_aggregates
+from demand_grid import get_demand_grid, DAY_NAMES, FINE_RESOLUTION
+from presence import get_presence
+from sketches import trip_sketch_summary, RELATIVE_ACCURACY
+from leaderboard import get_leaderboard, PERIODS, PERIOD_LABELS, METRICS, METRIC_LABELS
+from lazy_views import cached, compute, view_tabs
+
+LIVE_REFRESH_SECONDS = 2
+RAW_TABLE_ROWS = 500
 
 st.set_page_config(page_title="Mali Ride – Admin Dashboard", layout="wide")
 
@@ -38,30 +55,55 @@ st.sidebar.success(
 # Always treat admin as authenticated in this demo
 st.session_state["admin_ok"] = True
 
+# ----------------------------
+# LIVE FEED (EVENT LOG)
+# ----------------------------
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_feed():
+    # Built once per session, then only new events from the log are applied;
+    # run_every paces the updates, so this never waits for events
+    live = st.session_state.get("live_aggregates")
+    if live is None:
+        live = st.session_state["live_aggregates"] = LiveAggregates.build()
+    else:
+        live.refresh()
+
+    st.markdown("### ⚡ Live (all cities)")
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric(L("metric_drivers"), live.n_drivers)
+    c2.metric(L("metric_available"), live.drivers_by_status.get(L("status_options")[0], 0))
+    c3.metric(L("metric_trips"), live.n_trips)
+    c4.metric(L("metric_revenue"), f"{live.totals['gross_xof']:,.0f}")
+    c5.metric(L("metric_platform_revenue"), f"{live.totals['platform_xof']:,.0f}")
+    if live.recent:
+        with st.expander(f"Latest events (seq {live.last_seq})"):
+            st.dataframe(pd.DataFrame(
+                [{"seq": e["seq"], "ts": e["ts"], "type": e["type"]} for e in reversed(live.recent)]
+            ))
+
+live_feed()
+
 # ----------------------------
 # LOAD DATA
 # ----------------------------
 drivers = load_drivers_from_db()
-trips = load_trips_from_db()
-
-df_trips = pd.DataFrame(trips) if trips else pd.DataFrame()
-if not df_trips.empty and "created_at" in df_trips.columns:
-    df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-    df_trips["date_only"] = df_trips["created_at"].dt.date
+# Typed columns and precomputed aggregates shared by all app processes
+snap = get_snapshot(stale_ok=True)
+facets = snap.aggregates["facets"]
 
 # ----------------------------
 # FILTERS
 # ----------------------------
-if not df_trips.empty:
+city_filter = provider_filter = None
+start_date = end_date = None
+
+if facets.get("n_trips"):
     st.markdown("### 🔎 Filters (trips)")
 
     colf1, colf2, colf3 = st.columns(3)
 
     with colf1:
-        if "city" in df_trips.columns:
-            city_options = sorted([c for c in df_trips["city"].dropna().unique()])
-        else:
-            city_options = []
+        city_options = sorted(facets.get("city", {}))
         city_filter = st.multiselect(
             "City (from trips)",
             city_options,
@@ -69,10 +111,9 @@ if not df_trips.empty:
         )
 
     with colf2:
-        if "created_at" in df_trips.columns and df_trips["created_at"].notna().any():
-            dates = df_trips["created_at"].dropna()
-            min_date = dates.min().date()
-            max_date = dates.max().date()
+        if facets.get("min_date"):
+            min_date = date.fromisoformat(facets["min_date"])
+            max_date = date.fromisoformat(facets["max_date"])
         else:
             today = date.today()
             min_date = max_date = today
@@ -83,31 +124,42 @@ if not df_trips.empty:
         )
 
     with colf3:
-        if "routing_provider" in df_trips.columns:
-            provider_options = sorted([p for p in df_trips["routing_provider"].dropna().unique()])
-        else:
-            provider_options = []
+        provider_options = sorted(facets.get("routing_provider", {}))
         provider_filter = st.multiselect(
             "Routing provider",
             provider_options,
             default=provider_options if provider_options else None,
         )
 
-    df_trips_filtered = df_trips.copy()
-
-    if city_options and city_filter:
-        df_trips_filtered = df_trips_filtered[df_trips_filtered["city"].isin(city_filter)]
-
-    if "created_at" in df_trips_filtered.columns and df_trips_filtered["created_at"].notna().any():
-        df_trips_filtered = df_trips_filtered[
-            (df_trips_filtered["created_at"].dt.date >= start_date)
-            & (df_trips_filtered["created_at"].dt.date <= end_date)
-        ]
-
-    if provider_options and provider_filter and "routing_provider" in df_trips_filtered.columns:
-        df_trips_filtered = df_trips_filtered[df_trips_filtered["routing_provider"].isin(provider_filter)]
-else:
-    df_trips_filtered = df_trips
+filters = {
+    "cities": city_filter or None,
+    "start_date": start_date if facets.get("min_date") else None,
+    "end_date": end_date if facets.get("min_date") else None,
+    "providers": provider_filter or None,
+}
+
+# The filtered KPIs (unfiltered ones come precomputed) and the sketch summary
+# are independent: computed together, in parallel in the aggregation process
+# pool, once per store version and filter set.
+filtered = compute({
+    "agg": (snapshot_trip_aggregates, filters["cities"], filters["start_date"], filters["end_date"],
+            filters["providers"], True),
+    "sketch": (trip_sketch_summary, filters["cities"], filters["start_date"], filters["end_date"]),
+}, snap.version, filters)
+agg = filtered["agg"]
+
+
+def filtered_trips(columns=None):
+    """
+    Lazy query of the trips matching the filters; the views that show rows
+    read only the columns and rows they need.
+    """
+    return query_trips(
+        city=filters["cities"],
+        date_range=(start_date, end_date) if facets.get("min_date") else None,
+        provider=filters["providers"],
+        columns=columns,
+    )
 
 # ----------------------------
 # TOP-LEVEL METRICS
@@ -122,21 +174,20 @@ status_available = status_options[0]
 status_busy = status_options[1]
 status_offline = status_options[2] if len(status_options) > 2 else "Offline"
 
-n_available = sum(1 for d in drivers if d.get("status") == status_available)
-n_busy = sum(1 for d in drivers if d.get("status") == status_busy)
-n_offline = sum(1 for d in drivers if d.get("status") == status_offline)
+# Live presence counters (heartbeats + auto-offline), no scan of the drivers
+presence = get_presence()
+by_status = presence.counts()
+n_available = by_status.get(status_available, 0)
+n_busy = by_status.get(status_busy, 0)
+n_offline = by_status.get(status_offline, 0)
 
-if not df_trips_filtered.empty:
-    total_gross = float(df_trips_filtered.get("price_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    total_platform = float(df_trips_filtered.get("platform_commission_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    total_driver = float(df_trips_filtered.get("driver_earnings_xof", pd.Series([0]*len(df_trips_filtered))).sum())
-    n_trips = len(df_trips_filtered)
-else:
-    total_gross = total_platform = total_driver = 0.0
-    n_trips = 0
+n_trips = agg.get("n_trips", 0)
+total_gross = agg.get("gross_xof", 0.0)
+total_platform = agg.get("platform_xof", 0.0)
+total_driver = agg.get("driver_xof", 0.0)
 
 with col_a:
-    st.metric(L("metric_drivers"), len(drivers))
+    st.metric(L("metric_drivers"), presence.n_drivers())
 with col_b:
     st.metric(L("metric_available"), n_available)
 with col_c:
@@ -152,18 +203,48 @@ with col_g:
 with col_h:
     st.metric(L("metric_driver_earnings") + " (filtered)", f"{total_driver:,.0f}")
 
+# Quantiles and distinct counts merged from per-(day, city) sketches
+sketch = filtered["sketch"]
+
+def _fmt(value, pattern):
+    return "–" if value is None else pattern.format(value)
+
+col_q1, col_q2, col_q3, col_q4 = st.columns(4)
+with col_q1:
+    st.metric("Median fare (XOF)", _fmt(sketch["price_xof_p50"], "{:,.0f}"))
+    st.caption(f"p90 {_fmt(sketch['price_xof_p90'], '{:,.0f}')} · p99 {_fmt(sketch['price_xof_p99'], '{:,.0f}')}")
+with col_q2:
+    st.metric("Median distance (mi)", _fmt(sketch["distance_miles_p50"], "{:.2f}"))
+    st.caption(f"p90 {_fmt(sketch['distance_miles_p90'], '{:.2f}')} · p99 {_fmt(sketch['distance_miles_p99'], '{:.2f}')}")
+with col_q3:
+    st.metric("Distinct drivers (≈)", f"{sketch['distinct_drivers']:,}")
+with col_q4:
+    st.metric("Distinct routes (≈)", f"{sketch['distinct_routes']:,}")
+    st.caption(f"Referral codes used ≈ {sketch['distinct_referral_codes']:,}")
+st.caption(
+    f"Quantiles within ±{RELATIVE_ACCURACY:.0%} of the exact value, distinct counts ±3% (2σ); "
+    "city and date filters apply, the provider filter does not."
+)
+
+with st.expander("Drivers by city & status (live)"):
+    st.dataframe(pd.DataFrame(
+        {city: presence.counts(city) for city in sorted(presence.by_city_status)}
+    ).T)
+
 # ----------------------------
 # APP MODULES OVERVIEW TABS
 # ----------------------------
 st.markdown("---")
 st.subheader("📱 App modules overview (Driver, Passenger, Promotions, Mobile)")
 
-tab_driver, tab_passenger, tab_promos, tab_mobile = st.tabs(
-    ["🚖 Driver app", "🚕 Passenger app", "💸 Promotions", "📱 Mobile usage"]
+# Only the selected view is built on a rerun
+TAB_DRIVER, TAB_PASSENGER, TAB_PROMOS, TAB_MOBILE, TAB_DEMAND = (
+    "🚖 Driver app", "🚕 Passenger app", "💸 Promotions", "📱 Mobile usage", "🗺️ Demand map"
 )
+view = view_tabs([TAB_DRIVER, TAB_PASSENGER, TAB_PROMOS, TAB_MOBILE, TAB_DEMAND], key="admin_view")
 
 # ---------- DRIVER APP VIEW ----------
-with tab_driver:
+if view == TAB_DRIVER:
     st.markdown("### 🚖 Driver app – supply, earnings & ratings")
 
     if drivers:
@@ -173,109 +254,75 @@ with tab_driver:
         st.markdown("**Registered drivers (from Driver app)**")
         st.dataframe(df_drivers[cols])
 
-        if not df_trips_filtered.empty and "driver_username" in df_trips_filtered.columns:
-            df_d = df_trips_filtered.copy()
-            agg = df_d.groupby("driver_username").agg(
-                trips_count=("price_xof", "count"),
-                total_revenue_xof=("price_xof", "sum"),
-                driver_earnings_xof=("driver_earnings_xof", "sum")
-                if "driver_earnings_xof" in df_d.columns
-                else ("price_xof", "sum"),
-            ).reset_index()
-
-            if "username" in df_drivers.columns:
-                join_cols = ["username", "first_name", "last_name", "city", "transport_type", "rating", "cancel_count"]
-                join_cols = [c for c in join_cols if c in df_drivers.columns]
-                df_info = df_drivers[join_cols].copy()
-                agg = agg.merge(df_info, how="left", left_on="driver_username", right_on="username")
-
-                agg["driver_name"] = agg.apply(
-                    lambda r: f"{r.get('first_name', '')} {r.get('last_name', '')}".strip()
-                    if (pd.notna(r.get('first_name', '')) or pd.notna(r.get('last_name', '')))
-                    else r["driver_username"],
-                    axis=1
-                )
-            else:
-                agg["driver_name"] = agg["driver_username"]
-
-            agg = agg.sort_values("driver_earnings_xof", ascending=False)
+        if agg.get("by_driver"):
+            board = get_leaderboard()
+            c1, c2 = st.columns(2)
+            with c1:
+                period = st.selectbox("Period", PERIODS, format_func=PERIOD_LABELS.get, key="top_driver_period")
+            with c2:
+                metric = st.selectbox("Rank by", METRICS, format_func=METRIC_LABELS.get, key="top_driver_metric")
+            city = city_filter[0] if city_filter and len(city_filter) == 1 else None
 
-            st.markdown("**Top drivers by earnings (filtered)**")
+            st.markdown(f"**Top drivers by {METRIC_LABELS[metric].lower()} ({city or 'all cities'})**")
             top_n = st.slider("Top N drivers (Driver app view)", 3, 50, 10, key="top_driver_tab")
-            top_drivers = agg.head(top_n)
+            top_drivers = board.top(metric, top_n, period=period, city=city)
             st.dataframe(top_drivers)
+            st.caption("Maintained leaderboard: a single selected city applies, the date and provider filters do not.")
 
-            st.markdown("**Earnings by driver (XOF)**")
-            st.bar_chart(top_drivers.set_index("driver_name")["driver_earnings_xof"])
+            if len(top_drivers):
+                st.markdown(f"**{METRIC_LABELS[metric]} by driver**")
+                st.bar_chart(top_drivers.set_index("driver_name")[metric])
         else:
             st.info("No trips for drivers in the current filter range.")
     else:
         st.info("No drivers registered yet – use the Driver app to add some.")
 
 # ---------- PASSENGER APP VIEW ----------
-with tab_passenger:
+if view == TAB_PASSENGER:
     st.markdown("### 🚕 Passenger app – demand & trips view")
 
-    if not df_trips_filtered.empty:
-        if "date_only" in df_trips_filtered.columns:
-            trips_by_day = df_trips_filtered.groupby("date_only").agg(
-                trips_count=("price_xof", "count"),
-                revenue_xof=("price_xof", "sum"),
-            ).reset_index()
+    if n_trips:
+        if agg.get("by_day"):
+            trips_by_day = group_frame(agg["by_day"], "date_only")
 
             col_p1, col_p2 = st.columns(2)
             with col_p1:
-                st.markdown("**Trips per day (Passenger app)**")
-                st.line_chart(trips_by_day.set_index("date_only")["trips_count"])
+                st.markdown("**Trips per day (Passenger app)** – next days: forecast")
+                forecast_city = city_filter[0] if city_filter and len(city_filter) == 1 else None
+                st.line_chart(with_forecast(trips_by_day, forecast_city))
             with col_p2:
                 st.markdown("**Revenue per day (XOF)**")
                 st.line_chart(trips_by_day.set_index("date_only")["revenue_xof"])
 
-        if "city" in df_trips_filtered.columns:
-            df_city = df_trips_filtered.dropna(subset=["city"]).copy()
-            city_group = df_city.groupby("city").agg(
-                trips_count=("price_xof", "count"),
-                avg_fare_xof=("price_xof", "mean"),
-                total_revenue_xof=("price_xof", "sum"),
-            ).reset_index()
-            city_group["avg_fare_xof"] = city_group["avg_fare_xof"].round(0)
+        if agg.get("by_city"):
+            city_group = group_frame(agg["by_city"], "city")[
+                ["city", "trips_count", "avg_fare_xof", "total_revenue_xof"]
+            ]
 
             st.markdown("**Trips by city (Passenger demand)**")
             st.dataframe(city_group)
             st.bar_chart(city_group.set_index("city")["trips_count"])
 
-        if "distance_miles" in df_trips_filtered.columns:
-            st.markdown("**Distance vs fare (per trip)**")
-            dist_fare = df_trips_filtered[["distance_miles", "price_xof"]].dropna()
-            if not dist_fare.empty:
-                st.scatter_chart(dist_fare, x="distance_miles", y="price_xof")
-            else:
-                st.info("No valid distance/fare data to plot.")
+        st.markdown("**Distance vs fare (per trip)**")
+        dist_fare = cached(
+            "distance_fare", snap.version,
+            lambda: filtered_trips(["distance_miles", "price_xof"]).frame().dropna(), filters,
+        )
+        if not dist_fare.empty:
+            st.scatter_chart(dist_fare, x="distance_miles", y="price_xof")
+        else:
+            st.info("No valid distance/fare data to plot.")
     else:
         st.info("No passenger trips in the current filter range.")
 
 # ---------- PROMOTIONS & REFERRALS ----------
-with tab_promos:
+if view == TAB_PROMOS:
     st.markdown("### 💸 Promotions & referrals – campaign performance")
 
-    if not df_trips_filtered.empty:
-        if "promo_code" in df_trips_filtered.columns:
-            df_promo = df_trips_filtered.copy()
-            df_promo = df_promo[df_promo["promo_code"].notna() & (df_promo["promo_code"] != "")]
-            if not df_promo.empty:
-                promo_group = df_promo.groupby("promo_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_gross_before_xof=("price_before_discount_xof", "sum")
-                    if "price_before_discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_discount_xof=("discount_xof", "sum")
-                    if "discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_net_xof=("price_xof", "sum"),
-                ).reset_index()
-                promo_group["avg_discount_per_trip_xof"] = (
-                    promo_group["total_discount_xof"] / promo_group["trips_count"]
-                ).round(2)
+    if n_trips:
+        if "by_promo" in agg:
+            if agg.get("by_promo"):
+                promo_group = group_frame(agg["by_promo"], "promo_code")
 
                 st.markdown("**Promo performance (from Passenger app)**")
                 st.dataframe(promo_group)
@@ -294,16 +341,11 @@ with tab_promos:
 
         st.markdown("---")
 
-        if "referral_code" in df_trips_filtered.columns:
-            df_ref = df_trips_filtered.copy()
-            df_ref = df_ref[df_ref["referral_code"].notna() & (df_ref["referral_code"] != "")]
-            if not df_ref.empty:
-                ref_group = df_ref.groupby("referral_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_revenue_xof=("price_xof", "sum"),
-                    avg_fare_xof=("price_xof", "mean"),
-                ).reset_index()
-                ref_group["avg_fare_xof"] = ref_group["avg_fare_xof"].round(0)
+        if "by_referral" in agg:
+            if agg.get("by_referral"):
+                ref_group = group_frame(agg["by_referral"], "referral_code")[
+                    ["referral_code", "trips_count", "total_revenue_xof", "avg_fare_xof"]
+                ]
 
                 st.markdown("**Referral performance**")
                 st.dataframe(ref_group)
@@ -317,13 +359,12 @@ with tab_promos:
         st.info("No trips available for promotion/referral analysis.")
 
 # ---------- MOBILE USAGE ----------
-with tab_mobile:
+if view == TAB_MOBILE:
     st.markdown("### 📱 Mobile usage – client apps overview")
 
-    if not df_trips_filtered.empty and "client_app" in df_trips_filtered.columns:
-        df_ch = df_trips_filtered.dropna(subset=["client_app"]).copy()
-        if not df_ch.empty:
-            ch_group = df_ch.groupby("client_app").size().reset_index(name="trips_count")
+    if n_trips and "by_client_app" in agg:
+        if agg.get("by_client_app"):
+            ch_group = group_frame(agg["by_client_app"], "client_app").rename(columns={"count": "trips_count"})
             st.markdown("**Trips by platform (Passenger / Driver / Web)**")
             st.dataframe(ch_group)
             st.bar_chart(ch_group.set_index("client_app")["trips_count"])
@@ -338,6 +379,64 @@ with tab_mobile:
 # ----------------------------
 # RAW TABLES AT BOTTOM
 # ----------------------------
+def export_download(label, key, **filters):
+    # The export job (jobs.py) streams shard chunks to a temp file, in the
+    # worker when one is up; the download serves the file once it is done.
+    fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, key=f"{key}_fmt")
+    if st.button(label, key=f"{key}_prepare"):
+        st.session_state[f"{key}_job"] = submit("export", {"kind": key, "fmt": fmt, **filters})["id"]
+
+    job_id = st.session_state.get(f"{key}_job")
+    job = get_job(job_id) if job_id is not None else None
+    if job is None:
+        return
+    if job["status"] in ("queued", "running"):
+        st.info("Export in progress in the background…")
+        if st.button("Refresh", key=f"{key}_refresh"):
+            st.rerun()
+    elif job["status"] == "failed":
+        st.error(job["error"].strip().splitlines()[-1])
+    elif os.path.exists(job["result"]["path"]):
+        path, fmt = job["result"]["path"], job["params"]["fmt"]
+        with open(path, "rb") as f:
+            st.download_button(
+                f"⬇️ {key}.{fmt} ({job['result']['rows']} rows)",
+                data=f,
+                file_name=f"{key}.{fmt}",
+                key=f"{key}_download",
+            )
+
+# ---------- DEMAND MAP ----------
+if view == TAB_DEMAND:
+    st.markdown("### 🗺️ Demand heatmap & flows")
+    st.caption("All trips, binned by grid cell and hour of week (the trip filters above do not apply).")
+
+    grid = get_demand_grid()
+    col_k, col_r, col_d = st.columns(3)
+    with col_k:
+        heat_kind = st.radio("Demand", ["pickup", "drop"], horizontal=True, key="admin_heat_kind")
+    with col_r:
+        heat_res = st.slider("Cell size (finer →)", 3, FINE_RESOLUTION, FINE_RESOLUTION - 1, key="admin_heat_res")
+    with col_d:
+        heat_days = st.multiselect("Days", DAY_NAMES, default=DAY_NAMES, key="admin_heat_days")
+    heat_hours = st.slider("Hours (UTC)", 0, 23, (0, 23), key="admin_heat_hours")
+    hours = [
+        DAY_NAMES.index(d) * 24 + h
+        for d in heat_days
+        for h in range(heat_hours[0], heat_hours[1] + 1)
+    ]
+
+    cells = grid.heatmap(heat_kind, heat_res, hours)
+    if not cells.empty:
+        cells["size"] = 200 * cells["trips"] ** 0.5
+        st.map(cells, latitude="lat", longitude="lon", size="size")
+        st.markdown("**Trips by hour of week (UTC)**")
+        st.dataframe(grid.by_hour_of_week(heat_kind))
+        st.markdown("**Top origin → destination flows**")
+        st.dataframe(grid.flows(hours))
+    else:
+        st.info("No trips with coordinates for this selection.")
+
 st.markdown("---")
 st.subheader(L("drivers_table_header"))
 if drivers:
@@ -345,12 +444,20 @@ if drivers:
     pref_cols = ["username", "first_name", "last_name", "city", "transport_type", "rating", "cancel_count"]
     cols = [c for c in pref_cols if c in df_dr.columns] + [c for c in df_dr.columns if c not in pref_cols]
     st.dataframe(df_dr[cols])
+    export_download(L("download_drivers"), "drivers")
 else:
     st.info(L("no_drivers"))
 
 st.markdown("---")
 st.subheader(L("trips_table_header") + " (filtered)")
-if not df_trips_filtered.empty:
-    st.dataframe(df_trips_filtered)
+trips_query = filtered_trips()
+n_rows = trips_query.count()
+if n_rows:
+    # paged: the full table is in the export below
+    n_pages = -(-n_rows // RAW_TABLE_ROWS)
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+    rows = itertools.islice(trips_query, (page - 1) * RAW_TABLE_ROWS, page * RAW_TABLE_ROWS)
+    st.dataframe(with_datetimes(pd.DataFrame.from_records(list(rows))))
+    export_download(L("download_trips"), "trips", **filters)
 else:
     st.info("No trips (for current filters).")
@@ -0,0 +1,246 @@
+"""
+Cross-city aggregation over the per-city shards.
+
+Each shard is reduced to a small "partial aggregate" (plain dicts of sums and
+counts) in a worker process, and the partials are merged here. Adding a city
+adds a shard that is reduced in parallel with the others; adding a core adds a
+worker. Tiny stores are reduced inline because starting work in the pool would
+cost more than it saves.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core.shared import shard_paths, shard_exists, read_shard
+from core.schema import DAY_MS, date_range_ms, day_labels
+
+PARALLEL_MIN_BYTES = 2_000_000
+
+_POOL = None
+
+
+def _pool():
+    global _POOL
+    if _POOL is None:
+        # spawn: the Streamlit server is multi-threaded, forking it is unsafe
+        _POOL = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _POOL
+
+
+def map_shards(fn, kind, cities=None, *args):
+    """
+    Runs fn(shard_path, *args) for every existing shard and returns the list
+    of results. Runs in the process pool once the shards are big enough.
+    """
+    paths = [p for _, p in shard_paths(kind, cities) if shard_exists(p)]
+    total_bytes = sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+    if len(paths) > 1 and total_bytes >= PARALLEL_MIN_BYTES:
+        return list(_pool().map(fn, paths, *[[a] * len(paths) for a in args]))
+    return [fn(p, *args) for p in paths]
+
+
+def merge_partials(parts):
+    """
+    Merges partial aggregates: numbers are added, nested dicts merged key by
+    key, and keys starting with min_/max_ keep the smallest/largest value.
+    """
+    out = {}
+    for part in parts:
+        for key, val in (part or {}).items():
+            if val is None:
+                continue
+            cur = out.get(key)
+            if cur is None:
+                out[key] = merge_partials([val]) if isinstance(val, dict) else val
+            elif isinstance(val, dict):
+                out[key] = merge_partials([cur, val])
+            elif key.startswith("min_"):
+                out[key] = min(cur, val)
+            elif key.startswith("max_"):
+                out[key] = max(cur, val)
+            else:
+                out[key] = cur + val
+    return out
+
+
+def group_frame(groups, index_name):
+    """
+    {key: {col: value}} or {key: count} -> DataFrame with `index_name` column.
+    """
+    if not groups:
+        return pd.DataFrame(columns=[index_name])
+    first = next(iter(groups.values()))
+    if isinstance(first, dict):
+        df = pd.DataFrame.from_dict(groups, orient="index")
+    else:
+        df = pd.DataFrame({"count": pd.Series(groups)})
+    df.index.name = index_name
+    return df.reset_index().sort_values(index_name).reset_index(drop=True)
+
+
+# ----------------------------
+# PER-SHARD REDUCERS (run in workers)
+# ----------------------------
+def with_date_only(df):
+    days = df["created_at"] // DAY_MS
+    df["date_only"] = days.map(day_labels(pd.unique(df["created_at"]).tolist()))
+    return df
+
+
+def _trips_frame(path):
+    # Records are normalized at write time (core/schema.py): no coercion needed.
+    df = pd.DataFrame.from_records(read_shard(path))
+    if df.empty:
+        return df
+    return with_date_only(df)
+
+
+def _counts(series):
+    counts = series[series.notna() & (series != "")].value_counts()
+    return {str(k): int(v) for k, v in counts.items() if v}
+
+
+def _sum_by(df, key, aggs):
+    sub = df[df[key].notna() & (df[key] != "")]
+    if sub.empty:
+        return {}
+    grouped = sub.groupby(key, observed=True).agg(**aggs)
+    return {str(k): {c: v.item() if hasattr(v, "item") else v for c, v in row.items()}
+            for k, row in grouped.to_dict(orient="index").items()}
+
+
+def _trip_facets(path):
+    return frame_facets(_trips_frame(path))
+
+
+def frame_facets(df):
+    if df.empty:
+        return {}
+    dates = df["date_only"].dropna()
+    return {
+        "n_trips": len(df),
+        "city": _counts(df["city"]),
+        "routing_provider": _counts(df["routing_provider"]),
+        "min_date": dates.min() if not dates.empty else None,
+        "max_date": dates.max() if not dates.empty else None,
+    }
+
+
+def _trip_partial(path, filters):
+    return frame_partial(_trips_frame(path), filters)
+
+
+def frame_partial(df, filters):
+    """
+    Partial aggregate of a trips DataFrame (with `date_only`) under the
+    dashboard filters. Used per shard and on the mapped snapshot columns.
+    """
+    if df.empty:
+        return {}
+
+    cities = filters.get("cities")
+    if cities:
+        df = df[df["city"].isin(cities)]
+    providers = filters.get("providers")
+    if providers:
+        df = df[df["routing_provider"].isin(providers)]
+    start_ms, end_ms = date_range_ms(filters.get("start_date"), filters.get("end_date"))
+    if start_ms is not None:
+        df = df[df["created_at"] >= start_ms]
+    if end_ms is not None:
+        df = df[df["created_at"] < end_ms]
+    if df.empty:
+        return {}
+
+    return {
+        "n_trips": len(df),
+        "gross_xof": int(df["price_xof"].sum()),
+        "platform_xof": int(df["platform_commission_xof"].sum()),
+        "driver_xof": int(df["driver_earnings_xof"].sum()),
+        "cancellation_fees_xof": int(df["cancellation_fee_xof"].sum()),
+        "by_day": _sum_by(df, "date_only", {
+            "trips_count": ("price_xof", "size"),
+            "revenue_xof": ("price_xof", "sum"),
+            "platform_xof": ("platform_commission_xof", "sum"),
+        }),
+        "by_city": _sum_by(df, "city", {
+            "trips_count": ("price_xof", "size"),
+            "total_revenue_xof": ("price_xof", "sum"),
+        }),
+        "by_driver": _sum_by(df, "driver_username", {
+            "trips_count": ("price_xof", "size"),
+            "total_revenue_xof": ("price_xof", "sum"),
+            "driver_earnings_xof": ("driver_earnings_xof", "sum"),
+        }),
+        "by_promo": _sum_by(df, "promo_code", {
+            "trips_count": ("price_xof", "size"),
+            "total_gross_before_xof": ("price_before_discount_xof", "sum"),
+            "total_discount_xof": ("discount_xof", "sum"),
+            "total_net_xof": ("price_xof", "sum"),
+        }),
+        "by_referral": _sum_by(df, "referral_code", {
+            "trips_count": ("price_xof", "size"),
+            "total_revenue_xof": ("price_xof", "sum"),
+        }),
+        "by_status": _counts(df["status"]),
+        "by_client_app": _counts(df["client_app"]),
+    }
+
+
+def _driver_partial(path):
+    drivers = read_shard(path)
+    by_status = {}
+    for d in drivers:
+        status = d.get("status")
+        by_status[status] = by_status.get(status, 0) + 1
+    return {"n_drivers": len(drivers), "by_status": by_status}
+
+
+# ----------------------------
+# PUBLIC API
+# ----------------------------
+def trip_facets():
+    """
+    Filter options for the dashboards: cities, routing providers and the
+    created_at date range (ISO strings) across all trips.
+    """
+    return merge_partials(map_shards(_trip_facets, "trips"))
+
+
+def make_filters(cities=None, start_date=None, end_date=None, providers=None):
+    return {
+        "cities": list(cities) if cities else None,
+        "providers": list(providers) if providers else None,
+        "start_date": str(start_date) if start_date else None,
+        "end_date": str(end_date) if end_date else None,
+    }
+
+
+def finish_aggregates(agg):
+    """
+    Derived columns that cannot be merged (averages), computed after merging.
+    """
+    for groups in (agg.get("by_city", {}), agg.get("by_referral", {})):
+        for row in groups.values():
+            row["avg_fare_xof"] = round(row["total_revenue_xof"] / row["trips_count"]) if row["trips_count"] else 0
+    for row in agg.get("by_promo", {}).values():
+        row["avg_discount_per_trip_xof"] = round(row["total_discount_xof"] / row["trips_count"], 2) if row["trips_count"] else 0
+    return agg
+
+
+def trip_aggregates(cities=None, start_date=None, end_date=None, providers=None):
+    """
+    KPIs and group-bys over the trips matching the filters. Only the shards
+    of the selected cities are read. Dates are datetime.date or ISO strings.
+    """
+    filters = make_filters(cities, start_date, end_date, providers)
+    return finish_aggregates(merge_partials(map_shards(_trip_partial, "trips", filters["cities"], filters)))
+
+
+def driver_aggregates():
+    return merge_partials(map_shards(_driver_partial, "drivers"))
@@ -0,0 +1,272 @@
+"""
+Headless render-time benchmark for the four Streamlit apps.
+
+For every store size, a synthetic store is generated in a temporary data
+directory (datagen.py) and each app runs in its own process through
+Streamlit's testing API (streamlit.testing.v1.AppTest), no browser needed.
+Each scripted step (first run, filter change, confirming a ride,
+cancelling, ...) is timed, and the peak RSS of the app process is recorded.
+
+    python benchmarks/bench_apps.py                       # 1k, 100k, 1M trips
+    python benchmarks/bench_apps.py --sizes 1000 100000 --apps admin investor
+    python benchmarks/bench_apps.py --compare benchmarks/results/<old>.json
+
+Reports are written to benchmarks/results/<date>-<git rev>.json and printed
+as a table; with --compare, each step shows the change against an older
+report. A step that raises or leaves an exception in the app ends that app's
+scenario; the errors are listed at the end and the exit status is 1, so a
+broken path never goes unnoticed behind partial timings.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+APPS = {
+    "passenger": "passenger_app.py",
+    "driver": "driver_app.py",
+    "admin": "admin_app.py",
+    "investor": "investor_dashboard.py",
+}
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+RUN_TIMEOUT = 900
+
+
+# ----------------------------
+# SCENARIOS (run inside the app process)
+# ----------------------------
+def _widget(widgets, label):
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"no widget labelled {label!r}")
+
+
+def passenger_scenario(at, step):
+    step("first run", at.run)
+    step("rerun (warm)", at.run)
+    step("edit promo code", lambda: _widget(at.text_input, "Promo code (optional)").input("MALI10").run())
+    step("edit pickup", lambda: _widget(at.number_input, "Pickup latitude").set_value(12.65).run())
+    step("confirm ride", lambda: _widget(at.button, "Confirm ride").click().run())
+    step("cancel trip", lambda: _widget(at.button, "Cancel selected trip").click().run())
+
+
+def driver_scenario(at, step):
+    step("first run", at.run)
+    step("rerun (warm)", at.run)
+    step("log in", lambda: _widget(at.button, "Log in as this driver").click().run())
+    step("cancel trip", lambda: _widget(at.button, "Cancel selected scheduled trip").click().run())
+
+
+def admin_scenario(at, step):
+    step("first run", at.run)
+    step("rerun (warm)", at.run)
+    step("filter city", lambda: _widget(at.multiselect, "City (from trips)").set_value(["Bamako"]).run())
+    step("filter provider", lambda: _widget(at.multiselect, "Routing provider").set_value(["osrm"]).run())
+    step("open demand map", lambda: _widget(at.radio, "View").set_value("🗺️ Demand map").run())
+
+
+def investor_scenario(at, step):
+    step("first run", at.run)
+    step("rerun (warm)", at.run)
+    step("open drivers tab", lambda: _widget(at.radio, "View").set_value("Drivers").run())
+    step("open tiers tab", lambda: _widget(at.radio, "View").set_value("Commission what-if").run())
+    step("simulate tiers", lambda: _widget(at.button, "Simulate").click().run())
+
+
+SCENARIOS = {
+    "passenger": passenger_scenario,
+    "driver": driver_scenario,
+    "admin": admin_scenario,
+    "investor": investor_scenario,
+}
+
+
+class _Abort(Exception):
+    pass
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_child(app):
+    """
+    Runs one app's scenario in this process (MALI_RIDE_DATA_DIR is already
+    set by the parent) and prints a JSON result line.
+    """
+    sys.path.insert(0, REPO_DIR)
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_DIR, APPS[app]), default_timeout=RUN_TIMEOUT)
+    steps = []
+
+    def step(name, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+            error = "; ".join(str(e.value) for e in at.exception) or None
+        except Exception as e:  # a missing widget or a crash ends the scenario
+            error = f"{type(e).__name__}: {e}"
+        steps.append({"step": name, "seconds": round(time.perf_counter() - started, 4), "error": error})
+        if error:
+            raise _Abort()
+
+    try:
+        SCENARIOS[app](at, step)
+    except _Abort:
+        pass
+    print(json.dumps({"app": app, "steps": steps, "peak_rss_mb": _peak_rss_mb()}))
+
+
+# ----------------------------
+# PARENT: DATA, PROCESSES, REPORT
+# ----------------------------
+def _git_rev():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_app(app, data_dir):
+    env = {**os.environ, "MALI_RIDE_DATA_DIR": data_dir}
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", app],
+        env=env, capture_output=True, text=True, cwd=REPO_DIR,
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"app": app, "steps": [], "peak_rss_mb": None,
+            "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]}
+
+
+def run_benchmarks(sizes, apps, keep_data=False):
+    from datagen import generate_store
+
+    report = {
+        "rev": _git_rev(),
+        "date": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "results": [],
+    }
+    for size in sizes:
+        base_dir = tempfile.mkdtemp(prefix=f"mali_bench_{size}_")
+        try:
+            seed_dir = os.path.join(base_dir, "seed")
+            started = time.perf_counter()
+            generate_store(seed_dir, size)
+            print(f"[{size} trips] generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for app in apps:
+                # every app starts from the same untouched store
+                data_dir = os.path.join(base_dir, app)
+                shutil.copytree(seed_dir, data_dir)
+                result = run_app(app, data_dir)
+                result["trips"] = size
+                report["results"].append(result)
+                total = sum(s["seconds"] for s in result["steps"])
+                print(f"[{size} trips] {app}: {total:.2f}s, peak {result['peak_rss_mb']} MB", file=sys.stderr)
+                shutil.rmtree(data_dir, ignore_errors=True)
+        finally:
+            if not keep_data:
+                shutil.rmtree(base_dir, ignore_errors=True)
+    return report
+
+
+def _step_index(report):
+    return {
+        (r["trips"], r["app"], s["step"]): s["seconds"]
+        for r in report["results"]
+        for s in r["steps"]
+    }
+
+
+def report_errors(report):
+    """
+    ["<trips> trips, <app>, <step>: <error>"] for every failed step or app
+    process.
+    """
+    errors = []
+    for r in report["results"]:
+        for s in r["steps"]:
+            if s["error"]:
+                errors.append(f"{r['trips']:,} trips, {r['app']}, {s['step']}: {s['error']}")
+        if r.get("error"):
+            errors.append(f"{r['trips']:,} trips, {r['app']}: {r['error']}")
+    return errors
+
+
+def format_report(report, baseline=None):
+    old = _step_index(baseline) if baseline else {}
+    lines = [f"rev {report['rev']} ({report['date']})", ""]
+    header = "| trips | app | step | seconds |" + (f" vs {baseline['rev']} |" if baseline else "")
+    lines += [header, "|" + "---|" * (header.count("|") - 1)]
+    for r in report["results"]:
+        for s in r["steps"]:
+            row = f"| {r['trips']:,} | {r['app']} | {s['step']} | {s['seconds']:.3f} |"
+            if baseline:
+                prev = old.get((r["trips"], r["app"], s["step"]))
+                row += f" {(s['seconds'] - prev) / prev:+.0%} |" if prev else " – |"
+            if s["error"]:
+                row += f" ⚠ {s['error']}"
+            lines.append(row)
+        peak = r["peak_rss_mb"]
+        lines.append(f"| {r['trips']:,} | {r['app']} | peak memory | {peak} MB |" + (" |" if baseline else ""))
+        if r.get("error"):
+            lines.append(f"| {r['trips']:,} | {r['app']} | ⚠ {r['error']} | |")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless render-time benchmark of the Streamlit apps.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="trip counts")
+    parser.add_argument("--apps", nargs="+", choices=list(APPS), default=list(APPS))
+    parser.add_argument("--compare", help="older report (JSON) to compare with")
+    parser.add_argument("--output", help="report path (default: benchmarks/results/<date>-<rev>.json)")
+    parser.add_argument("--keep-data", action="store_true")
+    parser.add_argument("--child", choices=list(APPS), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    report = run_benchmarks(args.sizes, args.apps, args.keep_data)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['date'][:10]}-{report['rev']}.json"
+    )
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+    print(f"\nreport written to {output}")
+
+    errors = report_errors(report)
+    if errors:
+        print(f"\n{len(errors)} failed step(s):", file=sys.stderr)
+        for error in errors:
+            print(f"  {error}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
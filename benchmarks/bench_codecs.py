@@ -0,0 +1,78 @@
+"""
+Store codec benchmark: file size, encode and decode throughput of every
+available store format (shared.CODECS) on synthetic drivers and trips, next
+to the original pretty-printed JSON.
+
+    python benchmarks/bench_codecs.py --trips 100000 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+
+def _legacy_encode(data):
+    return json.dumps(data, ensure_ascii=False, indent=2, default=str).encode("utf-8")
+
+
+def _records(n_trips, seed=0):
+    from datagen import CITIES, make_drivers, _trip_chunk
+    from core.schema import now_ms
+
+    rng = np.random.default_rng(seed)
+    drivers = make_drivers(int(min(5_000, max(20, n_trips // 200))), rng)
+    usernames = [d["username"] for d in drivers]
+    trips = list(_trip_chunk(CITIES[0], n_trips, usernames, rng, now_ms()))
+    return {"drivers": drivers, "trips": trips}
+
+
+def _time(fn, *args):
+    started = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - started
+
+
+def run(sizes):
+    # core.shared reads the data directory at import time
+    os.environ.setdefault("MALI_RIDE_DATA_DIR", tempfile.mkdtemp(prefix="mali_codecs_"))
+    from core import shared
+
+    codecs = {"json (indent=2, before)": (_legacy_encode, json.loads)}
+    for name in shared.CODECS:
+        try:
+            shared.encode_records([], name)
+        except RuntimeError as e:
+            print(f"skipping {name}: {e}", file=sys.stderr)
+            continue
+        codecs[name] = (lambda data, name=name: shared.encode_records(data, name), shared.decode_records)
+    if shared.orjson is not None:
+        print("json codec: orjson", file=sys.stderr)
+
+    print("| records | kind | codec | MB | encode s | decode s | decode records/s |")
+    print("|---|---|---|---|---|---|---|")
+    for n in sizes:
+        for kind, data in _records(n).items():
+            for name, (encode, decode) in codecs.items():
+                raw, enc_s = _time(encode, data)
+                _, dec_s = _time(decode, raw)
+                print(f"| {len(data):,} | {kind} | {name} | {len(raw) / 1e6:.1f} | {enc_s:.3f} | {dec_s:.3f} "
+                      f"| {len(data) / dec_s:,.0f} |")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store codec benchmark.")
+    parser.add_argument("--trips", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args(argv)
+    run(args.trips)
+
+
+if __name__ == "__main__":
+    main()
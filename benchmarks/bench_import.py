@@ -0,0 +1,70 @@
+"""
+Import-time benchmark for the headless entry points: each module is imported
+in a fresh interpreter (`python -c "import <module>"`, bytecode already
+compiled) several times and the median wall time is reported, together with
+the heavy packages the import pulled in. Modules in HEADLESS must not load
+any of HEAVY; the exit status is 1 if one does.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --runs 20 --modules core.pricing jobs
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+HEADLESS = ["core.pricing", "core.schema", "core.shared", "jobs", "driver_search", "bulk_import"]
+HEAVY = ["streamlit", "pandas", "numpy", "msgpack"]
+DEFAULT_RUNS = 10
+
+_PROBE = "import sys; import {module}; print(__import__('json').dumps([m for m in {heavy!r} if m in sys.modules]))"
+
+
+def _import_once(module, env):
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return time.perf_counter() - started, json.loads(out.strip().splitlines()[-1])
+
+
+def run(modules, runs):
+    env = dict(os.environ, MALI_RIDE_DATA_DIR=tempfile.mkdtemp(prefix="mali_import_"))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_DIR, env.get("PYTHONPATH")]))
+    baseline = statistics.median(_import_once("os", env)[0] for _ in range(runs))
+
+    print(f"interpreter start-up: {baseline * 1000:.1f} ms (median of {runs})")
+    print("| module | median ms | import only ms | heavy packages loaded |")
+    print("|---|---|---|---|")
+    failed = False
+    for module in modules:
+        timings, loaded = [], []
+        for _ in range(runs):
+            seconds, loaded = _import_once(module, env)
+            timings.append(seconds)
+        median = statistics.median(timings)
+        print(f"| {module} | {median * 1000:.1f} | {(median - baseline) * 1000:.1f} | {', '.join(loaded) or '-'} |")
+        failed |= module in HEADLESS and bool(loaded)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time of the headless modules.")
+    parser.add_argument("--modules", nargs="+", default=HEADLESS)
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    args = parser.parse_args(argv)
+    if run(args.modules, args.runs):
+        print(f"a headless module imported one of {', '.join(HEAVY)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
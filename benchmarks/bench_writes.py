@@ -0,0 +1,68 @@
+"""
+Sustained write throughput of the store: several threads book trips through
+save_trip_to_db() against a generated store, as concurrent sessions of the
+Passenger app would, and the rate of durable writes is reported.
+
+    python benchmarks/bench_writes.py --trips 100000 --threads 8 --writes 2000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+
+def run(n_trips, n_threads, n_writes):
+    from datagen import generate_store
+
+    data_dir = tempfile.mkdtemp(prefix=f"mali_writes_{n_trips}_")
+    try:
+        generate_store(data_dir, n_trips)
+        from core.config import configure
+
+        configure(data_dir)  # before core.shared is imported
+        from core import shared
+
+        shared.load_drivers_from_db()  # recovery and schema check out of the timing
+        per_thread = n_writes // n_threads
+
+        def book(t):
+            for i in range(per_thread):
+                shared.save_trip_to_db({
+                    "city": "Bamako",
+                    "driver_username": f"drv{(t * per_thread + i) % 100:05d}",
+                    "price_xof": 1500,
+                    "status": "scheduled",
+                })
+
+        threads = [threading.Thread(target=book, args=(t,)) for t in range(n_threads)]
+        started = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        seconds = time.perf_counter() - started
+        total = per_thread * n_threads
+        print(f"{total:,} writes from {n_threads} threads on {n_trips:,} trips: "
+              f"{seconds:.2f}s, {total / seconds:,.0f} writes/s")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store write throughput benchmark.")
+    parser.add_argument("--trips", type=int, default=100_000, help="size of the generated store")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--writes", type=int, default=2_000)
+    args = parser.parse_args(argv)
+    run(args.trips, args.threads, args.writes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Synthetic store for benchmarks: drivers and normalized trips written straight
+into the city shards of a data directory (no events, no per-record writes).
+
+    python benchmarks/datagen.py /tmp/mali_1m --trips 1000000
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.schema import (  # noqa: E402
+    SCHEMA_VERSION,
+    DAY_MS,
+    TRIP_STATUSES,
+    DRIVER_STATUSES,
+    now_ms,
+)
+
+CITIES = ["Bamako", "Sikasso", "Kayes", "Mopti", "Ségou"]
+CITY_WEIGHTS = [0.6, 0.12, 0.1, 0.1, 0.08]
+CITY_CENTERS = {
+    "Bamako": (12.6392, -8.0029),
+    "Sikasso": (11.3176, -5.6665),
+    "Kayes": (14.4469, -11.4456),
+    "Mopti": (14.4843, -4.1827),
+    "Ségou": (13.4317, -6.2157),
+}
+TRANSPORT_TYPES = ["Moto", "Car", "Taxi", "Tricycle"]
+PROVIDERS = ["demo_haversine", "osrm"]
+PROMOS = ["", "", "", "", "MALI10", "WELCOME50"]
+STATUS_WEIGHTS = [0.3, 0.6, 0.06, 0.04]
+CHUNK = 50_000
+
+
+def _write_array(path, records_iter):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        for rec in records_iter:
+            f.write("\n" if first else ",\n")
+            f.write(json.dumps(rec, ensure_ascii=False))
+            first = False
+        f.write("\n]")
+
+
+def make_drivers(n, rng):
+    cities = rng.choice(CITIES, n, p=CITY_WEIGHTS)
+    return [
+        {
+            "username": f"drv{i:05d}",
+            "first_name": f"First{i}",
+            "last_name": f"Last{i}",
+            "age": int(rng.integers(20, 60)),
+            "city": str(cities[i]),
+            "transport_type": str(rng.choice(TRANSPORT_TYPES)),
+            "status": str(rng.choice(DRIVER_STATUSES)),
+            "rating": round(float(rng.uniform(3.5, 5.0)), 2),
+            "rating_count": int(rng.integers(0, 200)),
+            "cancel_count": int(rng.integers(0, 5)),
+        }
+        for i in range(n)
+    ]
+
+
+def _trip_chunk(city, n, drivers, rng, now):
+    lat0, lon0 = CITY_CENTERS[city]
+    created = now - rng.integers(0, 90 * DAY_MS, n)
+    scheduled = created + rng.integers(0, 2 * DAY_MS, n)
+    plat = lat0 + rng.normal(0, 0.03, n)
+    plon = lon0 + rng.normal(0, 0.03, n)
+    dlat = lat0 + rng.normal(0, 0.03, n)
+    dlon = lon0 + rng.normal(0, 0.03, n)
+    miles = np.hypot(plat - dlat, plon - dlon) * 69.0
+    before = np.rint(500 + 300 * miles).astype(np.int64)
+    promos = rng.choice(PROMOS, n)
+    discount = np.where(promos == "MALI10", np.rint(before * 0.10), np.where(promos == "WELCOME50", np.rint(before * 0.5), 0)).astype(np.int64)
+    price = before - discount
+    statuses = rng.choice(TRIP_STATUSES, n, p=STATUS_WEIGHTS)
+    platform = np.rint(price * 0.14).astype(np.int64)
+    fee = np.where(statuses == "cancelled_by_passenger", np.rint(price * 0.75), np.where(statuses == "cancelled_by_driver", np.rint(price * 0.35), 0)).astype(np.int64)
+    drv = rng.choice(drivers, n)
+    providers = rng.choice(PROVIDERS, n)
+    trip_ids = rng.integers(0, 1 << 62, n)
+    for i in range(n):
+        cancelled = statuses[i].startswith("cancelled")
+        yield {
+            "trip_id": f"{trip_ids[i]:016x}",
+            "driver_username": str(drv[i]),
+            "city": city,
+            "pickup_neighborhood": "",
+            "drop_city": city,
+            "drop_neighborhood": "",
+            "transport_type": "",
+            "pickup_lat": float(plat[i]),
+            "pickup_lon": float(plon[i]),
+            "drop_lat": float(dlat[i]),
+            "drop_lon": float(dlon[i]),
+            "distance_miles": float(miles[i]),
+            "price_xof": int(price[i]),
+            "price_before_discount_xof": int(before[i]),
+            "discount_xof": int(discount[i]),
+            "promo_code": str(promos[i]),
+            "referral_code": "",
+            "platform_commission_xof": int(fee[i] if cancelled else platform[i]),
+            "driver_earnings_xof": 0 if cancelled else int(price[i] - platform[i]),
+            "platform_pct": 14,
+            "driver_pct": 86,
+            "cancellation_fee_xof": int(fee[i]),
+            "cancellation_reason": "benchmark" if cancelled else "",
+            "routing_provider": str(providers[i]),
+            "route_summary": f"{city} → {city}",
+            "client_app": "passenger_mobile_demo",
+            "status": str(statuses[i]),
+            "created_at": int(created[i]),
+            "scheduled_for": int(scheduled[i]),
+        }
+
+
+def generate_store(data_dir, n_trips, n_drivers=None, seed=0):
+    """
+    Writes drivers/<city>.json, trips/<city>.json and schema_version under
+    `data_dir`. Returns (n_drivers, n_trips).
+    """
+    rng = np.random.default_rng(seed)
+    now = now_ms()
+    n_drivers = n_drivers or int(min(5_000, max(20, n_trips // 200)))
+    drivers = make_drivers(n_drivers, rng)
+    os.makedirs(data_dir, exist_ok=True)
+
+    for city in CITIES:
+        city_drivers = [d for d in drivers if d["city"] == city]
+        _write_array(os.path.join(data_dir, "drivers", f"{city}.json"), iter(city_drivers))
+
+        n_city = int(round(n_trips * CITY_WEIGHTS[CITIES.index(city)]))
+        if city == CITIES[-1]:
+            n_city = n_trips - sum(int(round(n_trips * w)) for w in CITY_WEIGHTS[:-1])
+        usernames = [d["username"] for d in city_drivers] or [drivers[0]["username"]]
+
+        def chunks():
+            for start in range(0, n_city, CHUNK):
+                yield from _trip_chunk(city, min(CHUNK, n_city - start), usernames, rng, now)
+
+        _write_array(os.path.join(data_dir, "trips", f"{city}.json"), chunks())
+
+    with open(os.path.join(data_dir, "schema_version"), "w", encoding="utf-8") as f:
+        f.write(str(SCHEMA_VERSION))
+    return n_drivers, n_trips
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic Mali Ride store.")
+    parser.add_argument("data_dir")
+    parser.add_argument("--trips", type=int, default=1_000)
+    parser.add_argument("--drivers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    n_drivers, n_trips = generate_store(args.data_dir, args.trips, args.drivers, args.seed)
+    print(f"{n_drivers} drivers, {n_trips} trips written to {args.data_dir}")
+
+
+if __name__ == "__main__":
+    main()
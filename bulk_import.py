@@ -0,0 +1,312 @@
+"""
+Bulk import of trips and drivers (previous system, partner fleets).
+
+Input is CSV with a header row or JSON Lines, read as a stream in chunks.
+Every record is cleaned up for the usual export quirks (epoch or ISO
+timestamps, amounts like "1 500 FCFA", status spellings), then normalized
+by core/schema.py. Each chunk goes to the store as one write-ahead log commit and
+a checkpoint, and its events as one batch, so an import costs a few shard
+rewrites per chunk instead of one per record, and memory stays at about a
+chunk plus the largest shard.
+
+- trips: a missing trip_id gets a new one; a trip whose trip_id is already
+  stored (in any city shard) replaces it and is logged as an update, so
+  re-running an import neither duplicates nor double-counts it.
+  Blank city / neighborhood fields are filled from the coordinates
+  (geofence.py).
+- drivers: a username already registered, or seen earlier in the input, is
+  rejected.
+
+Rejected records are written with their line number and the reason to
+data/rejected/import_<kind>_<time>.jsonl.
+
+    python bulk_import.py trips old_trips.csv
+    python bulk_import.py drivers fleet.jsonl --chunk-size 10000 --dry-run
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+
+from core.schema import (
+    DRIVER_STATUSES,
+    TIMESTAMP_FIELDS,
+    TRIP_INT_FIELDS,
+    TRIP_STATUSES,
+    SchemaError,
+    normalize_driver,
+    normalize_trip,
+)
+
+CHUNK_SIZE = 50_000
+
+# Status spellings seen in other systems -> ours (keys lowercased, "_" for
+# spaces and dashes)
+TRIP_STATUS_ALIASES = {
+    "booked": "scheduled",
+    "pending": "scheduled",
+    "accepted": "scheduled",
+    "complete": "completed",
+    "done": "completed",
+    "finished": "completed",
+    "canceled_by_passenger": "cancelled_by_passenger",
+    "cancelled_by_rider": "cancelled_by_passenger",
+    "canceled_by_rider": "cancelled_by_passenger",
+    "canceled_by_driver": "cancelled_by_driver",
+}
+DRIVER_STATUS_ALIASES = {
+    "available": "Available",
+    "online": "Available",
+    "on_trip": "On trip",
+    "busy": "On trip",
+    "offline": "Offline",
+}
+
+_AMOUNT_JUNK = re.compile(r"(?i)\s|,|xof|f?cfa|f$")
+_EPOCH = re.compile(r"^\d+(\.\d+)?$")
+
+
+# ----------------------------
+# INPUT
+# ----------------------------
+def _input_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(path, fmt=None):
+    """
+    Yields (line number, record) from a CSV or JSON Lines file. A JSON line
+    that does not parse yields (line number, SchemaError).
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if _input_format(path, fmt) == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k is not None}
+            return
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                yield line_no, SchemaError(f"json: {e}")
+                continue
+            if not isinstance(rec, dict):
+                yield line_no, SchemaError("json: not an object")
+                continue
+            yield line_no, rec
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ----------------------------
+# CLEAN-UP BEFORE NORMALIZATION
+# ----------------------------
+def _status(value, known, aliases):
+    if not isinstance(value, str) or value in known:
+        return value
+    key = re.sub(r"[\s-]+", "_", value.strip().lower())
+    return aliases.get(key, value.strip())
+
+
+def _timestamp(value):
+    # epoch seconds or milliseconds as text (CSV) -> int ms
+    if isinstance(value, str) and _EPOCH.match(value.strip()):
+        value = float(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 < value < 1e11:
+        value *= 1000
+    return value
+
+
+def _amount(value):
+    return _AMOUNT_JUNK.sub("", value) if isinstance(value, str) else value
+
+
+def clean_trip(rec):
+    rec = dict(rec)
+    for field in TIMESTAMP_FIELDS:
+        rec[field] = _timestamp(rec.get(field))
+    for field in TRIP_INT_FIELDS:
+        rec[field] = _amount(rec.get(field))
+    rec["status"] = _status(rec.get("status"), TRIP_STATUSES, TRIP_STATUS_ALIASES)
+    return rec
+
+
+def clean_driver(rec):
+    rec = dict(rec)
+    rec["status"] = _status(rec.get("status"), DRIVER_STATUSES, DRIVER_STATUS_ALIASES)
+    return rec
+
+
+def _fill_areas(trips):
+    """
+    Blank city / neighborhood fields of the chunk from its coordinates.
+    """
+    from geofence import get_geofences
+
+    blank = [t for t in trips if not (t["city"] and t["drop_city"])]
+    if not blank:
+        return
+    index = get_geofences()
+    nan = float("nan")
+    for side, city_field, neigh_field in (("pickup", "city", "pickup_neighborhood"),
+                                          ("drop", "drop_city", "drop_neighborhood")):
+        lat = [nan if t[f"{side}_lat"] is None else t[f"{side}_lat"] for t in blank]
+        lon = [nan if t[f"{side}_lon"] is None else t[f"{side}_lon"] for t in blank]
+        cities, neighborhoods = index.label(lat, lon)
+        for trip, city, neighborhood in zip(blank, cities, neighborhoods):
+            if not trip[city_field]:
+                trip[city_field] = city
+                trip[neigh_field] = trip[neigh_field] or neighborhood
+
+
+# ----------------------------
+# IMPORT
+# ----------------------------
+class ImportReport:
+    def __init__(self, kind, rejects_path):
+        self.kind = kind
+        self.rejects_path = rejects_path
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.reasons = {}
+        self.seconds = 0.0
+        self._rejects = None
+
+    def reject(self, line_no, rec, error):
+        self.rejected += 1
+        reason = str(error).split(":", 1)[0]
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if self._rejects is None:
+            os.makedirs(os.path.dirname(self.rejects_path), exist_ok=True)
+            self._rejects = open(self.rejects_path, "a", encoding="utf-8")
+        self._rejects.write(json.dumps({"line": line_no, "error": str(error), "record": rec},
+                                       ensure_ascii=False, default=str) + "\n")
+
+    def close(self):
+        if self._rejects is not None:
+            self._rejects.close()
+            self._rejects = None
+
+    def summary(self):
+        rate = self.read / self.seconds if self.seconds else 0
+        lines = [f"{self.kind}: {self.read:,} read, {self.imported:,} imported, {self.rejected:,} rejected "
+                 f"in {self.seconds:.2f}s ({rate:,.0f} records/s)"]
+        for reason, n in sorted(self.reasons.items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {n:,} × {reason}")
+        if self.rejected:
+            lines.append(f"  rejected records: {self.rejects_path}")
+        return "\n".join(lines)
+
+
+def _prepare_trips(chunk, report):
+    trips = []
+    for line_no, rec in chunk:
+        try:
+            if isinstance(rec, Exception):
+                raise rec
+            if rec.get("created_at") in (None, ""):
+                raise SchemaError("created_at: required")  # normalize_trip would use now
+            trip = normalize_trip(clean_trip(rec))
+        except SchemaError as e:
+            report.reject(line_no, rec if isinstance(rec, dict) else None, e)
+            continue
+        trip["trip_id"] = trip["trip_id"] or uuid.uuid4().hex
+        trips.append(trip)
+    _fill_areas(trips)
+    return trips
+
+
+def _prepare_drivers(chunk, report, usernames):
+    drivers = []
+    for line_no, rec in chunk:
+        try:
+            if isinstance(rec, Exception):
+                raise rec
+            driver = normalize_driver(clean_driver(rec))
+            if driver["username"] in usernames:
+                raise SchemaError(f"username: already registered: {driver['username']!r}")
+        except SchemaError as e:
+            report.reject(line_no, rec if isinstance(rec, dict) else None, e)
+            continue
+        usernames.add(driver["username"])
+        drivers.append(driver)
+    return drivers
+
+
+def import_file(kind, path, fmt=None, chunk_size=CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Imports a CSV / JSON Lines file of `kind` ("trips" or "drivers") chunk
+    by chunk. `progress(report)` is called after each chunk. Returns the
+    ImportReport.
+    """
+    from core import shared
+
+    if kind not in ("trips", "drivers"):
+        raise ValueError(f"unknown kind {kind!r}")
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    report = ImportReport(kind, os.path.join(shared.DATA_DIR, "rejected", f"import_{kind}_{stamp}.jsonl"))
+    usernames = {d.get("username") for d in shared.load_drivers_from_db()} if kind == "drivers" else None
+    stored = shared.trip_shards() if kind == "trips" and not dry_run else None
+
+    started = time.perf_counter()
+    try:
+        for chunk in chunked(read_records(path, fmt), chunk_size):
+            report.read += len(chunk)
+            if kind == "trips":
+                records = _prepare_trips(chunk, report)
+            else:
+                records = _prepare_drivers(chunk, report, usernames)
+            if records and not dry_run:
+                if kind == "trips":
+                    shared.import_trips_to_db(records, stored)
+                else:
+                    with shared._wal.appending():
+                        shared._append_sharded(kind, records)
+                        shared.emit_events([("driver_registered", rec) for rec in records])
+                shared.checkpoint()  # keep the log (and readers' view of it) small
+            report.imported += len(records)
+            report.seconds = time.perf_counter() - started
+            if progress is not None:
+                progress(report)
+    finally:
+        report.close()
+        report.seconds = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import of trips or drivers from CSV / JSON Lines.")
+    parser.add_argument("kind", choices=["trips", "drivers"])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--dry-run", action="store_true", help="validate only, write nothing but the rejects")
+    args = parser.parse_args(argv)
+
+    def progress(report):
+        print(f"  {report.read:,} read, {report.rejected:,} rejected, {report.seconds:.1f}s", flush=True)
+
+    report = import_file(args.kind, args.path, args.format, args.chunk_size, args.dry_run, progress)
+    print(report.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+What-if simulator for the commission tier table.
+
+Replays the whole trip history under alternative tier tables: for every trip,
+the tier is picked from the driver's rolling 7-day trip count at booking time
+(the trip itself included, as in the passenger app), and platform commission /
+driver earnings are recomputed from the fare.
+
+Rolling counts are computed for all drivers at once: trips are sorted by
+(driver, created_at) into a single int64 key, and one searchsorted call finds
+where each trip's 7-day window starts. No Python loop runs per trip.
+
+Cancelled trips keep their stored amounts (their commission is the
+cancellation fee, not a tier); unassigned trips are priced at the base tier.
+
+    python commission_sim.py --tiers 60:7,40:9,20:11,0:13
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.pricing import COMMISSION_TIERS
+from core.schema import WEEK_MS
+
+# created_at (epoch ms) fits in 43 bits until the year 2248
+_TIME_BITS = 43
+
+
+def parse_tiers(text):
+    """
+    "60:7,40:9,20:11,0:13" -> [(60, 7), (40, 9), (20, 11), (0, 13)]
+    """
+    tiers = []
+    for part in text.split(","):
+        min_trips, pct = part.split(":")
+        tiers.append((int(min_trips), int(pct)))
+    return check_tiers(tiers)
+
+
+def check_tiers(tiers):
+    """
+    Sorts a tier table highest threshold first and checks it has a 0 tier.
+    """
+    tiers = sorted(((int(m), int(p)) for m, p in tiers), reverse=True)
+    if not tiers or tiers[-1][0] != 0:
+        raise ValueError("the tier table needs a tier starting at 0 trips")
+    if len({m for m, _ in tiers}) != len(tiers):
+        raise ValueError("duplicate tier thresholds")
+    return tiers
+
+
+def rolling_weekly_counts(driver_codes, created_ms):
+    """
+    For each trip: number of trips by the same driver in the 7 days up to
+    and including it. Trips with the same driver and timestamp count in
+    input order.
+    """
+    driver_codes = np.asarray(driver_codes, dtype=np.int64)
+    created_ms = np.asarray(created_ms, dtype=np.int64)
+    keys = (driver_codes << _TIME_BITS) | created_ms
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    window_start = np.searchsorted(sorted_keys, sorted_keys - WEEK_MS, side="left")
+    counts = np.empty(len(keys), dtype=np.int64)
+    counts[order] = np.arange(len(keys)) - window_start + 1
+    return counts
+
+
+def tier_pct(weekly_counts, tiers):
+    """
+    Vectorized get_commission_pct over an array of weekly counts.
+    """
+    tiers = check_tiers(tiers)
+    mins = np.array([m for m, _ in reversed(tiers)])
+    pcts = np.array([p for _, p in reversed(tiers)])
+    return pcts[np.searchsorted(mins, weekly_counts, side="right") - 1]
+
+
+def _history():
+    """
+    Columns needed for the replay, from the shared snapshot.
+    """
+    from snapshot import get_snapshot
+
+    snap = get_snapshot()
+    statuses = snap.categories("status")
+    cancelled = [i for i, s in enumerate(statuses) if s.startswith("cancelled")]
+    unassigned = snap.code_of("driver_username", "")
+    drivers = snap.column("driver_username")
+    return {
+        "driver": drivers,
+        "assigned": drivers != unassigned,
+        "created_at": snap.column("created_at"),
+        "fare": snap.column("price_xof"),
+        "cancelled": np.isin(snap.column("status"), cancelled),
+        "platform_xof": snap.column("platform_commission_xof"),
+        "driver_xof": snap.column("driver_earnings_xof"),
+    }
+
+
+def simulate(tiers, history=None):
+    """
+    Per-trip platform commission and driver earnings under `tiers`:
+    (pct, platform_xof, driver_xof) int arrays in history order.
+    """
+    h = history or _history()
+    counts = rolling_weekly_counts(h["driver"], h["created_at"])
+    counts = np.where(h["assigned"], counts, 1)
+    pct = tier_pct(counts, tiers)
+    platform = np.rint(h["fare"] * pct / 100).astype(np.int64)
+    platform = np.where(h["cancelled"], h["platform_xof"], platform)
+    driver = np.where(h["cancelled"], h["driver_xof"], h["fare"] - platform)
+    return pct, platform, driver
+
+
+def compare_tiers(scenarios, history=None):
+    """
+    Side-by-side totals for {name: tier table}. The first row is the stored
+    history; each scenario gets its deltas against it.
+    """
+    h = history or _history()
+    active = ~h["cancelled"]
+    gross = int(h["fare"][active].sum())
+    stored_platform = int(h["platform_xof"].sum())
+    rows = [{
+        "scenario": "Stored (as charged)",
+        "trips": int(active.sum()),
+        "gross_xof": gross,
+        "platform_xof": stored_platform,
+        "driver_xof": int(h["driver_xof"].sum()),
+        "avg_pct": None,
+    }]
+    for name, tiers in scenarios.items():
+        pct, platform, driver = simulate(tiers, h)
+        rows.append({
+            "scenario": name,
+            "trips": int(active.sum()),
+            "gross_xof": gross,
+            "platform_xof": int(platform.sum()),
+            "driver_xof": int(driver.sum()),
+            "avg_pct": round(float(pct[active].mean()), 2) if active.any() else None,
+        })
+    df = pd.DataFrame(rows)
+    df["platform_delta_xof"] = df["platform_xof"] - stored_platform
+    df["platform_delta_pct"] = (100 * df["platform_delta_xof"] / stored_platform).round(2) if stored_platform else 0.0
+    df["driver_delta_xof"] = df["driver_xof"] - int(h["driver_xof"].sum())
+    return df
+
+
+def tier_mix(tiers, history=None):
+    """
+    Trips per commission % under `tiers` (non-cancelled trips).
+    """
+    h = history or _history()
+    pct, _, _ = simulate(tiers, h)
+    values, counts = np.unique(pct[~h["cancelled"]], return_counts=True)
+    return pd.DataFrame({"pct": values, "trips": counts})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay the trip history under other commission tiers.")
+    parser.add_argument("--tiers", action="append", default=[],
+                        help="tier table as min_trips:pct,... (repeatable)")
+    args = parser.parse_args(argv)
+
+    scenarios = {"Current tiers": COMMISSION_TIERS}
+    for text in args.tiers:
+        scenarios[text] = parse_tiers(text)
+    started = time.perf_counter()
+    df = compare_tiers(scenarios)
+    print(df.to_string(index=False))
+    print(f"simulated in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+"""
+Headless core of the ride apps: pricing rules, record schema and storage,
+importable without Streamlit, pandas or numpy (see README, "Core package").
+"""
@@ -0,0 +1,35 @@
+"""
+Where the store lives.
+
+The data directory is, in order: the one passed to `configure()`, the
+MALI_RIDE_DATA_DIR environment variable (benchmarks, staging), or data/ next
+to the core package. Every module derives its file paths from DATA_DIR when
+it is imported, so `configure()` must run before any store module is
+imported; it raises if one already was.
+
+Nothing is created on import: the directory is made on the first write
+(`ensure_data_dir()`).
+"""
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATA_DIR = os.path.abspath(os.environ.get("MALI_RIDE_DATA_DIR") or os.path.join(BASE_DIR, "data"))
+
+
+def configure(data_dir):
+    """
+    Points this process (and the processes it starts) at another data
+    directory.
+    """
+    global DATA_DIR
+    if "core.shared" in sys.modules:
+        raise RuntimeError("configure() must be called before core.shared is imported")
+    DATA_DIR = os.path.abspath(data_dir)
+    # worker processes (aggregation pool, job worker) read it from the environment
+    os.environ["MALI_RIDE_DATA_DIR"] = DATA_DIR
+
+
+def ensure_data_dir():
+    os.makedirs(DATA_DIR, exist_ok=True)
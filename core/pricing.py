@@ -0,0 +1,184 @@
+"""
+Pricing and business rules: commission tiers, promo codes, fares, and the
+cancellation and rating rules.
+
+Pure functions on plain values and trip / driver dicts, with no storage and
+no heavy imports (numpy is loaded by the vectorized haversine only), so
+scripts and workers that only need a fare or a commission rate start fast.
+core.shared re-exports everything here.
+"""
+from datetime import datetime, timedelta
+from math import radians, sin, cos, atan2, sqrt
+
+from core.schema import from_epoch_ms
+
+# ----------------------------
+# COMMISSION TIERS (HEETCH-BEATING FOR BAMAKO)
+# ----------------------------
+# (minimum trips in the last 7 days, platform commission %), highest first
+COMMISSION_TIERS = [
+    (60, 8),
+    (40, 10),
+    (20, 12),
+    (0, 14),
+]
+
+def get_commission_pct(weekly_trips: int, tiers=None) -> int:
+    """
+    Launch promo tiers (COMMISSION_TIERS):
+    - 60+ trips / week: 8%
+    - 40–59 trips: 10%
+    - 20–39 trips: 12%
+    - 0–19 trips: 14%
+    """
+    tiers = tiers or COMMISSION_TIERS
+    for min_trips, pct in tiers:
+        if weekly_trips >= min_trips:
+            return pct
+    return tiers[-1][1]
+
+# ----------------------------
+# PROMO CODES
+# ----------------------------
+PROMO_CODES = {
+    "WELCOME50": 0.50,
+    "MALI10": 0.10,
+    "EVENING15": 0.15,
+    "STUDENT20": 0.20,
+}
+
+def apply_promo(code: str, fare: float):
+    if not code:
+        return fare, 0.0
+    c = code.strip().upper()
+    disc = PROMO_CODES.get(c)
+    if disc is None:
+        return fare, 0.0
+    discount = round(fare * disc)
+    final = max(0, fare - discount)
+    return final, discount
+
+# ----------------------------
+# GEO / PRICING HELPERS
+# ----------------------------
+EARTH_KM = 6371.0
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    try:
+        lat1, lon1, lat2, lon2 = map(float, (lat1, lon1, lat2, lon2))
+    except Exception:
+        return 0.0
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlon/2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    km = EARTH_KM * c
+    return km * 0.621371
+
+def haversine_miles_vec(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine over numpy arrays (broadcasting like numpy does),
+    e.g. trips[:, None] against drivers[None, :] gives a full distance matrix.
+    """
+    import numpy as np
+
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_KM * c * 0.621371
+
+BASE_FARE_XOF = 500
+PER_MILE_XOF = 300
+
+def compute_fare(distance_miles: float):
+    return round(BASE_FARE_XOF + PER_MILE_XOF * max(distance_miles, 0))
+
+# ----------------------------
+# CANCELLATION & RATING SETTINGS
+# ----------------------------
+PASSENGER_LATE_CANCEL_PCT = 0.75   # 75% of fare
+DRIVER_CANCEL_PENALTY_PCT = 0.35   # 35% penalty -> company
+
+DRIVER_RATING_START = 5.0
+DRIVER_RATING_MIN = 1.0
+DRIVER_RATING_CANCEL_PENALTY = 0.2  # rating drop per bad cancellation
+
+def passenger_can_cancel(trip: dict, now_utc: datetime | None = None) -> bool:
+    """
+    Returns True if passenger is allowed to cancel with no fee.
+    Rule: free cancellation only if >= 4 hours before scheduled time.
+    """
+    if now_utc is None:
+        now_utc = datetime.utcnow()
+
+    sched = trip.get("scheduled_for")
+    if not sched:
+        # if no scheduled time, treat as immediate -> no free window
+        return False
+
+    if isinstance(sched, (int, float)):
+        sched = from_epoch_ms(sched)
+    elif isinstance(sched, str):
+        try:
+            sched = datetime.fromisoformat(sched)
+        except Exception:
+            return False
+
+    return sched - now_utc >= timedelta(hours=4)
+
+def apply_passenger_cancellation(trip: dict) -> dict:
+    """
+    Apply passenger cancellation rule:
+    - If within 4h window => 75% fee of travel fare.
+    - Fee goes to company (platform); driver earns 0 on this trip.
+    """
+    fare = int(trip.get("price_xof") or 0)
+    cancel_fee = round(fare * PASSENGER_LATE_CANCEL_PCT)
+
+    trip["status"] = "cancelled_by_passenger"
+    trip["cancellation_reason"] = "late_passenger"
+    trip["cancellation_fee_xof"] = cancel_fee
+    trip["platform_commission_xof"] = cancel_fee
+    trip["driver_earnings_xof"] = 0
+    return trip
+
+def apply_driver_cancellation(trip: dict) -> dict:
+    """
+    Apply driver cancellation:
+    - Company collects 35% of scheduled fare as penalty.
+    - Driver gets 0 on this trip.
+    """
+    fare = int(trip.get("price_xof") or 0)
+    penalty = round(fare * DRIVER_CANCEL_PENALTY_PCT)
+
+    trip["status"] = "cancelled_by_driver"
+    trip["cancellation_reason"] = "driver_cancel"
+    trip["cancellation_fee_xof"] = penalty
+    trip["platform_commission_xof"] = penalty
+    trip["driver_earnings_xof"] = 0
+    return trip
+
+def apply_rating(rating, rating_count, stars):
+    """
+    (rating, rating_count) after one more rating of `stars` (1-5).
+    The starting 5.0 is a placeholder, replaced by the first real rating;
+    the cancellation penalties already taken off it are kept.
+    """
+    count = int(rating_count or 0)
+    rating = float(DRIVER_RATING_START if rating is None else rating)
+    stars = min(5, max(1, int(stars)))
+    if count == 0:
+        penalties = max(0.0, DRIVER_RATING_START - rating)
+        return round(max(DRIVER_RATING_MIN, stars - penalties), 2), 1
+    return round((rating * count + stars) / (count + 1), 2), count + 1
+
+def penalize_driver_rating(driver: dict) -> dict:
+    """
+    Drop rating a bit each time they cancel a scheduled trip.
+    """
+    rating = float(driver.get("rating", DRIVER_RATING_START))
+    rating -= DRIVER_RATING_CANCEL_PENALTY
+    rating = max(DRIVER_RATING_MIN, rating)
+    driver["rating"] = round(rating, 2)
+    driver["cancel_count"] = int(driver.get("cancel_count", 0)) + 1
+    return driver
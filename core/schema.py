@@ -0,0 +1,299 @@
+"""
+Typed trip and driver schema, applied once at write time.
+
+Stored records always have:
+- timestamps (`created_at`, `scheduled_for`) as integer epoch milliseconds (UTC)
+- XOF amounts as integers
+- `status` from a fixed set of values
+- every schema field present (None / "" / 0 instead of missing keys)
+
+so readers can build typed columns directly instead of coercing on every load.
+Existing data files are migrated once, see `migrate_store()`:
+
+    python -m core.schema migrate
+
+and can be rewritten in another store format (see shared.CODECS):
+
+    python -m core.schema convert --format msgpack
+"""
+import argparse
+from datetime import datetime, timezone
+
+SCHEMA_VERSION = 2
+
+TRIP_STATUSES = ("scheduled", "completed", "cancelled_by_passenger", "cancelled_by_driver")
+DRIVER_STATUSES = ("Available", "On trip", "Offline")
+
+TIMESTAMP_FIELDS = ("created_at", "scheduled_for")
+
+DAY_MS = 86_400_000
+WEEK_MS = 7 * DAY_MS
+
+TRIP_INT_FIELDS = (
+    "price_xof",
+    "price_before_discount_xof",
+    "discount_xof",
+    "platform_commission_xof",
+    "driver_earnings_xof",
+    "cancellation_fee_xof",
+    "platform_pct",
+    "driver_pct",
+)
+TRIP_FLOAT_FIELDS = ("pickup_lat", "pickup_lon", "drop_lat", "drop_lon", "distance_miles")
+TRIP_STR_FIELDS = (
+    "trip_id",
+    "driver_username",
+    "city",
+    "pickup_neighborhood",
+    "drop_city",
+    "drop_neighborhood",
+    "transport_type",
+    "promo_code",
+    "referral_code",
+    "routing_provider",
+    "route_summary",
+    "client_app",
+    "cancellation_reason",
+)
+
+DRIVER_STR_FIELDS = ("username", "first_name", "last_name", "city", "transport_type")
+DRIVER_INT_FIELDS = ("age", "rating_count", "cancel_count")
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# ----------------------------
+# FIELD CONVERSIONS
+# ----------------------------
+def to_epoch_ms(value):
+    """
+    ISO string, datetime, pandas Timestamp or epoch ms -> int epoch ms (UTC).
+    Naive datetimes are taken as UTC, like the apps' utcnow() values.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise SchemaError(f"not a timestamp: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise SchemaError(f"not a timestamp: {value!r}")
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp() * 1000)
+    raise SchemaError(f"not a timestamp: {value!r}")
+
+
+def from_epoch_ms(ms):
+    """
+    Epoch ms -> naive UTC datetime (None stays None).
+    """
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+
+
+def now_ms():
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def date_range_ms(start_date=None, end_date=None):
+    """
+    Inclusive calendar-date range (date or ISO string) -> [start_ms, end_ms)
+    in UTC; a missing bound is None.
+    """
+    start_ms = end_ms = None
+    if start_date:
+        start_ms = to_epoch_ms(datetime.fromisoformat(str(start_date)))
+    if end_date:
+        end_ms = to_epoch_ms(datetime.fromisoformat(str(end_date))) + DAY_MS
+    return start_ms, end_ms
+
+
+def week_start_ms(ms):
+    """
+    Epoch ms (scalar or numpy array) -> start of its Monday-aligned UTC week.
+    """
+    # 1970-01-01 was a Thursday: shift by 3 days so weeks start on Monday
+    return ((ms // DAY_MS + 3) // 7 * 7 - 3) * DAY_MS
+
+
+def day_labels(ms_values):
+    """
+    {day number: "YYYY-MM-DD"} for the distinct UTC days in `ms_values`.
+    """
+    return {d: from_epoch_ms(d * DAY_MS).date().isoformat() for d in {ms // DAY_MS for ms in ms_values}}
+
+
+def _to_int(value, field):
+    if value is None or value == "":
+        return 0
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        raise SchemaError(f"{field}: not a number: {value!r}")
+
+
+def _to_float(value, field):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise SchemaError(f"{field}: not a number: {value!r}")
+
+
+def _to_str(value):
+    return "" if value is None else str(value)
+
+
+# ----------------------------
+# RECORD NORMALIZATION
+# ----------------------------
+def normalize_trip(trip: dict) -> dict:
+    """
+    Returns a normalized copy of `trip` or raises SchemaError.
+    Unknown extra fields are kept as they are.
+    """
+    out = dict(trip)
+    out["created_at"] = to_epoch_ms(trip.get("created_at"))
+    if out["created_at"] is None:
+        out["created_at"] = now_ms()
+    out["scheduled_for"] = to_epoch_ms(trip.get("scheduled_for"))
+
+    status = trip.get("status") or "scheduled"
+    if status not in TRIP_STATUSES:
+        raise SchemaError(f"status: unknown trip status {status!r}")
+    out["status"] = status
+
+    for field in TRIP_INT_FIELDS:
+        out[field] = _to_int(trip.get(field), field)
+    for field in TRIP_FLOAT_FIELDS:
+        out[field] = _to_float(trip.get(field), field)
+    for field in TRIP_STR_FIELDS:
+        out[field] = _to_str(trip.get(field))
+    for field in ("promo_code", "referral_code"):
+        out[field] = out[field].strip().upper()
+    return out
+
+
+def normalize_driver(driver: dict) -> dict:
+    out = dict(driver)
+    for field in DRIVER_STR_FIELDS:
+        out[field] = _to_str(driver.get(field)).strip()
+    if not out["username"]:
+        raise SchemaError("username: required")
+
+    status = driver.get("status") or DRIVER_STATUSES[0]
+    if status not in DRIVER_STATUSES:
+        raise SchemaError(f"status: unknown driver status {status!r}")
+    out["status"] = status
+
+    for field in DRIVER_INT_FIELDS:
+        out[field] = _to_int(driver.get(field), field)
+    rating = _to_float(driver.get("rating"), "rating")
+    out["rating"] = round(5.0 if rating is None else rating, 2)
+    return out
+
+
+def normalize_updates(kind: str, record: dict, updates: dict) -> dict:
+    """
+    Normalizes a partial update by normalizing the updated record and keeping
+    only the fields that were updated.
+    """
+    normalize = normalize_trip if kind == "trips" else normalize_driver
+    merged = normalize({**record, **updates})
+    return {k: merged[k] for k in updates}
+
+
+# ----------------------------
+# MIGRATION
+# ----------------------------
+def migrate_store(dry_run: bool = False):
+    """
+    Normalizes every shard in place. Records that cannot be normalized are
+    moved to data/rejected/<kind>_<shard>.json. Returns {kind: (kept, rejected)}.
+    A shard that does not decode stops the migration with ValueError before
+    it is rewritten, and the schema version is not recorded.
+    """
+    import os
+    import uuid
+    from core import shared
+
+    report = {}
+    for kind, normalize in (("drivers", normalize_driver), ("trips", normalize_trip)):
+        kept_total = rejected_total = 0
+        for key, path in shared.shard_paths(kind, _check_schema=False):
+            kept, rejected = [], []
+            for rec in shared._read_json(path, strict=True):
+                if kind == "trips" and not rec.get("trip_id"):
+                    rec["trip_id"] = uuid.uuid4().hex
+                try:
+                    kept.append(normalize(rec))
+                except SchemaError as e:
+                    rejected.append({"record": rec, "error": str(e)})
+            if not dry_run and os.path.exists(path):
+                shared._write_json(path, kept)
+                if rejected:
+                    rejected_dir = os.path.join(shared.DATA_DIR, "rejected")
+                    os.makedirs(rejected_dir, exist_ok=True)
+                    shared._write_json(os.path.join(rejected_dir, f"{kind}_{key}.json"), rejected)
+            kept_total += len(kept)
+            rejected_total += len(rejected)
+        report[kind] = (kept_total, rejected_total)
+    if not dry_run:
+        shared.write_schema_version(SCHEMA_VERSION)
+    return report
+
+
+def convert_store(fmt: str):
+    """
+    Rewrites every shard (and the admin login file) in store format `fmt`
+    (see shared.CODECS) and records it as the format for later writes.
+    Apps started before the conversion keep writing their format until
+    restarted; files in either format stay readable. Returns
+    {format before: number of files}.
+    """
+    import os
+    from core import shared
+
+    shared.checkpoint()  # pending log entries land in the format the report starts from
+    shared.set_store_format(fmt)
+    paths = [path for kind in ("drivers", "trips") for _, path in shared.shard_paths(kind)]
+    report = {}
+    for path in paths + [shared.ADMIN_LOGINS_PATH]:
+        if not os.path.exists(path):
+            continue
+        before = shared.file_format(path)
+        report[before] = report.get(before, 0) + 1
+        if before != fmt:
+            shared._write_json(path, shared._read_json(path), fmt)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trip/driver schema tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="normalize existing data files in place")
+    migrate.add_argument("--dry-run", action="store_true")
+    convert = sub.add_parser("convert", help="rewrite the data files in another store format")
+    convert.add_argument("--format", required=True, help="json or msgpack")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        for kind, (kept, rejected) in migrate_store(args.dry_run).items():
+            print(f"{kind}: {kept} normalized, {rejected} rejected")
+    elif args.command == "convert":
+        for before, n in convert_store(args.format).items():
+            done = "already in" if before == args.format else "converted from"
+            print(f"{n} file(s) {done} {before}")
+
+
+if __name__ == "__main__":
+    main()
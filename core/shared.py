@@ -0,0 +1,1108 @@
+
+"""
+Storage for drivers, trips and admin logins (city shards, write-ahead log,
+event log, trip queries), plus re-exports of the pricing rules
+(core.pricing) and reference data the apps share.
+
+Importing it loads no third-party package: pandas is imported by the
+functions that return DataFrames, msgpack by the msgpack codec.
+"""
+import itertools
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from core.config import DATA_DIR, ensure_data_dir
+from core.pricing import (  # noqa: F401  re-exported for the apps
+    COMMISSION_TIERS,
+    get_commission_pct,
+    PROMO_CODES,
+    apply_promo,
+    EARTH_KM,
+    haversine_miles,
+    haversine_miles_vec,
+    BASE_FARE_XOF,
+    PER_MILE_XOF,
+    compute_fare,
+    PASSENGER_LATE_CANCEL_PCT,
+    DRIVER_CANCEL_PENALTY_PCT,
+    DRIVER_RATING_START,
+    DRIVER_RATING_MIN,
+    DRIVER_RATING_CANCEL_PENALTY,
+    passenger_can_cancel,
+    apply_passenger_cancellation,
+    apply_driver_cancellation,
+    apply_rating,
+    penalize_driver_rating,
+)
+from core.schema import (
+    SCHEMA_VERSION,
+    TIMESTAMP_FIELDS,
+    DAY_MS,
+    date_range_ms,
+    normalize_trip,
+    normalize_driver,
+    normalize_updates,
+)
+from core.wal import WriteAheadLog, apply_ops, iter_applied
+
+log = logging.getLogger(__name__)
+
+# ----------------------------
+# DATA STORAGE (LOCAL JSON "DB")
+# ----------------------------
+# DATA_DIR: see core.config (MALI_RIDE_DATA_DIR or configure())
+
+DRIVERS_PATH = os.path.join(DATA_DIR, "drivers.json")
+TRIPS_PATH = os.path.join(DATA_DIR, "trips.json")
+ADMIN_LOGINS_PATH = os.path.join(DATA_DIR, "admin_logins.json")
+
+# Drivers and trips are sharded by city: data/drivers/<city>.json and
+# data/trips/<city>.json. Records whose city is not in MALI_CITIES go to
+# the "_other" shard. DRIVERS_PATH / TRIPS_PATH are the legacy single-file
+# stores, split into shards the first time they are touched.
+DRIVERS_SHARD_DIR = os.path.join(DATA_DIR, "drivers")
+TRIPS_SHARD_DIR = os.path.join(DATA_DIR, "trips")
+OTHER_SHARD = "_other"
+
+# Version of the record schema the shards are stored in (see core/schema.py)
+SCHEMA_VERSION_PATH = os.path.join(DATA_DIR, "schema_version")
+
+# Append-only change log: one JSON event per line, see emit_events()
+EVENTS_PATH = os.path.join(DATA_DIR, "events.log")
+
+# Write-ahead log of driver and trip writes, folded into the shards at
+# checkpoints (see core/wal.py and read_shard())
+WAL_PATH = os.path.join(DATA_DIR, "store.wal")
+
+# ----------------------------
+# LANGUAGE LABELS (English only demo)
+# ----------------------------
+LANG_OPTIONS = ["English"]
+
+labels = {
+    "English": {
+        "title_admin": "Mali Ride – Admin Dashboard",
+        "subtitle": "Real-time view of drivers, trips, promotions, and mobile usage for Mali.",
+        "admin_auth": "Admin access",
+        "admin_code_label": "Admin code",
+        "admin_code_hint": "For production you would protect this page with a real secret.",
+        "admin_code_wrong": "Wrong admin code.",
+        "admin_locked": "Admin dashboard locked. Enter the admin code in the sidebar.",
+        "metric_drivers": "Drivers",
+        "metric_available": "Available",
+        "metric_busy": "On trip",
+        "metric_offline": "Offline",
+        "metric_trips": "Trips",
+        "metric_revenue": "Total fares",
+        "metric_platform_revenue": "Platform revenue",
+        "metric_driver_earnings": "Driver earnings",
+        "drivers_table_header": "Registered drivers",
+        "trips_table_header": "Trips",
+        "download_drivers": "Export drivers",
+        "download_trips": "Export trips (filtered)",
+        "no_drivers": "No drivers registered yet.",
+        "status_options": ["Available", "On trip", "Offline"],
+    }
+}
+
+# In case you later want to lock admin:
+ADMIN_CODE = "KaTaaAdmin2027"
+
+# ----------------------------
+# STORE CODECS
+# ----------------------------
+# Store files (shards, admin logins) are written by one of the codecs below
+# and read by any of them: a file's first bytes tell its format. The format
+# for writes is MALI_RIDE_STORE_FORMAT, else the one recorded in
+# data/store_format by `python -m core.schema convert`, else "json".
+try:
+    import orjson  # optional: faster JSON codec
+except ImportError:
+    orjson = None
+msgpack = None  # optional compact binary codec, imported on first use
+
+STORE_FORMAT_PATH = os.path.join(DATA_DIR, "store_format")
+
+def _json_encode(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=str)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+def _json_decode(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def _require_msgpack():
+    global msgpack
+    if msgpack is None:
+        try:
+            import msgpack as _msgpack
+        except ImportError:
+            raise RuntimeError("The msgpack store format needs msgpack: pip install msgpack")
+        msgpack = _msgpack
+
+def _msgpack_encode(data) -> bytes:
+    _require_msgpack()
+    return msgpack.packb(data, use_bin_type=True, default=str)
+
+def _msgpack_decode(raw: bytes):
+    _require_msgpack()
+    return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+
+# name -> (magic prefix, encode, decode). The prefix is written before the
+# payload; the codec with an empty prefix is the fallback for detection.
+CODECS = {
+    "json": (b"", _json_encode, _json_decode),
+    "msgpack": (b"MRMP\x01", _msgpack_encode, _msgpack_decode),
+}
+
+def register_codec(name, magic: bytes, encode, decode):
+    """
+    Adds a store format. `magic` must be a unique non-empty prefix that
+    cannot start a JSON document.
+    """
+    CODECS[name] = (magic, encode, decode)
+
+def _configured_format():
+    fmt = os.environ.get("MALI_RIDE_STORE_FORMAT")
+    if not fmt:
+        try:
+            with open(STORE_FORMAT_PATH, encoding="utf-8") as f:
+                fmt = f.read().strip()
+        except OSError:
+            fmt = ""
+    return fmt or "json"
+
+STORE_FORMAT = _configured_format()
+
+def set_store_format(fmt):
+    """
+    Records `fmt` as the format for writes from now on (all processes).
+    """
+    global STORE_FORMAT
+    if fmt not in CODECS:
+        raise ValueError(f"unknown store format {fmt!r}, expected one of {sorted(CODECS)}")
+    encode_records([], fmt)  # fails here if the codec's library is missing
+    ensure_data_dir()
+    with open(STORE_FORMAT_PATH, "w", encoding="utf-8") as f:
+        f.write(fmt)
+    STORE_FORMAT = fmt
+
+def detect_format(head: bytes):
+    for name, (magic, _, _) in CODECS.items():
+        if magic and head.startswith(magic):
+            return name
+    return "json"
+
+def encode_records(data, fmt=None) -> bytes:
+    magic, encode, _ = CODECS[fmt or STORE_FORMAT]
+    return magic + encode(data)
+
+def decode_records(raw: bytes):
+    fmt = detect_format(raw)
+    magic, _, decode = CODECS[fmt]
+    return decode(memoryview(raw)[len(magic):] if magic else raw)
+
+# ----------------------------
+# BASIC FILE HELPERS
+# ----------------------------
+def _read_json(path, strict=False):
+    """
+    Contents of a store file in any format; [] if missing or unreadable.
+    With `strict`, a file that does not decode raises ValueError instead.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "rb") as f:
+            return decode_records(f.read())
+    except ValueError as e:
+        if strict:
+            raise ValueError(f"corrupt store file {path}: {e}") from e
+        return []
+    except OSError:
+        return []  # a missing codec (RuntimeError) is raised
+
+def file_format(path):
+    with open(path, "rb") as f:
+        return detect_format(f.read(16))
+
+def _iter_json(path, read_size: int = 1 << 20):
+    """
+    Yields the records of a store file one by one without loading the whole
+    file, so memory stays bounded by `read_size` plus one record. Formats
+    other than JSON and msgpack are decoded whole.
+    """
+    if not os.path.exists(path):
+        return
+    fmt = file_format(path)
+    if fmt == "msgpack":
+        _require_msgpack()
+        with open(path, "rb") as f:
+            f.seek(len(CODECS[fmt][0]))
+            unpacker = msgpack.Unpacker(f, raw=False, strict_map_key=False, read_size=read_size)
+            try:
+                n = unpacker.read_array_header()
+                for _ in range(n):
+                    yield unpacker.unpack()
+            except (msgpack.OutOfData, ValueError):
+                return  # truncated file: stop at the last complete record
+        return
+    if fmt != "json":
+        yield from _read_json(path)
+        return
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(read_size)
+        pos = 0
+        started = False
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                more = f.read(read_size)
+                if not more:
+                    return
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if not started:
+                if buf[pos] != "[":
+                    return
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                rec, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                more = f.read(read_size)
+                if not more:
+                    return  # truncated file: stop at the last complete record
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield rec
+            pos = end
+            if pos > read_size:
+                buf, pos = buf[pos:], 0
+
+def _write_json(path, data, fmt=None):
+    """
+    Writes `data` in `fmt` (default: STORE_FORMAT) to a temporary file and
+    renames it over `path`, so readers see the old or the new contents,
+    never a partial file. Errors are raised.
+    """
+    raw = encode_records(data, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(raw)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ----------------------------
+# EVENT LOG (CHANGE DATA CAPTURE)
+# ----------------------------
+try:
+    import fcntl
+except ImportError:  # Windows: single-process demo, no locking
+    fcntl = None
+
+def _last_seq(f):
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    if size == 0:
+        return 0
+    f.seek(max(0, size - 65536))
+    lines = f.read().splitlines()
+    for line in reversed(lines):
+        try:
+            return int(json.loads(line)["seq"])
+        except Exception:
+            continue
+    return 0
+
+def emit_events(events):
+    """
+    Appends [(event_type, data)] to the event log under an exclusive lock.
+    Each event gets the next sequence number:
+    {"seq": 12, "ts": "...", "type": "trip_booked", "data": {...}}
+    """
+    if not events:
+        return
+    ensure_data_dir()
+    try:
+        with open(EVENTS_PATH, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            seq = _last_seq(f)
+            ts = datetime.utcnow().isoformat()
+            lines = []
+            for event_type, data in events:
+                seq += 1
+                rec = {"seq": seq, "ts": ts, "type": event_type, "data": data}
+                lines.append(json.dumps(rec, ensure_ascii=False, default=str))
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+    except Exception:
+        # the store write is already committed: never fail it, but say which
+        # events the event-sourced views (driver state, leaderboard, ...) miss
+        log.exception("event log write failed, %d event(s) lost: %s", len(events),
+                      ", ".join(f"{t} {d.get('trip_id') or d.get('username') or ''}".strip() for t, d in events))
+
+def emit_event(event_type, data):
+    emit_events([(event_type, data)])
+
+def read_events(offset: int = 0, max_bytes: int | None = None):
+    """
+    Reads complete events starting at byte `offset` of the log.
+    Returns (events, new_offset); pass new_offset back in to continue.
+    """
+    if not os.path.exists(EVENTS_PATH):
+        return [], 0
+    with open(EVENTS_PATH, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < offset:  # log was truncated/rotated
+            offset = 0
+        f.seek(offset)
+        chunk = f.read() if max_bytes is None else f.read(max_bytes)
+    end = chunk.rfind(b"\n")
+    if end < 0:
+        return [], offset
+    events = []
+    for line in chunk[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except Exception:
+            continue
+    return events, offset + end + 1
+
+def events_end_offset():
+    return os.path.getsize(EVENTS_PATH) if os.path.exists(EVENTS_PATH) else 0
+
+# ----------------------------
+# CITY SHARDS
+# ----------------------------
+def shard_keys():
+    return MALI_CITIES + [OTHER_SHARD]
+
+def shard_key(city):
+    return city if city in MALI_CITIES else OTHER_SHARD
+
+def _shard_dir(kind):
+    return DRIVERS_SHARD_DIR if kind == "drivers" else TRIPS_SHARD_DIR
+
+def shard_path(kind, key):
+    return os.path.join(_shard_dir(kind), f"{key}.json")
+
+def _ensure_sharded(kind):
+    shard_dir = _shard_dir(kind)
+    if os.path.isdir(shard_dir):
+        return
+    legacy_path = DRIVERS_PATH if kind == "drivers" else TRIPS_PATH
+    os.makedirs(shard_dir, exist_ok=True)
+    if os.path.exists(legacy_path):
+        by_shard = {}
+        for rec in _read_json(legacy_path):
+            by_shard.setdefault(shard_key(rec.get("city")), []).append(rec)
+        for key, recs in by_shard.items():
+            _write_json(shard_path(kind, key), recs)
+        os.replace(legacy_path, legacy_path + ".pre_shard")
+
+def write_schema_version(version: int):
+    ensure_data_dir()
+    with open(SCHEMA_VERSION_PATH, "w", encoding="utf-8") as f:
+        f.write(str(version))
+
+_schema_checked = False
+
+def _ensure_schema():
+    """
+    Migrates the shards once if they were written by an older schema, so
+    readers can rely on normalized records.
+    """
+    global _schema_checked
+    if _schema_checked:
+        return
+    _schema_checked = True
+    try:
+        with open(SCHEMA_VERSION_PATH, encoding="utf-8") as f:
+            version = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        version = 0
+    if version < SCHEMA_VERSION:
+        from core.schema import migrate_store
+        try:
+            migrate_store()
+        except ValueError:
+            # the corrupt shard is left for repair; the next start migrates again
+            log.exception("schema migration stopped, the store is not migrated")
+
+def shard_paths(kind, cities=None, _check_schema=True):
+    """
+    [(shard key, path)] in global order, optionally limited to some cities.
+    """
+    _ensure_sharded(kind)
+    _ensure_recovered()
+    if _check_schema:
+        _ensure_schema()
+    keys = shard_keys()
+    if cities is not None:
+        wanted = {shard_key(c) for c in cities}
+        keys = [k for k in keys if k in wanted]
+    return [(k, shard_path(kind, k)) for k in keys]
+
+# ----------------------------
+# WRITE-AHEAD LOG
+# ----------------------------
+# Records are keyed by these fields in the log ("put" replaces, "set" updates)
+KEY_FIELDS = {"drivers": "username", "trips": "trip_id"}
+
+def _fold_wal(ops):
+    # Runs with the log locked: must not go through read_shard()/shard_paths().
+    # A shard that does not decode stops the checkpoint (the log is kept)
+    # rather than being rewritten with only its pending records.
+    for (kind, key), shard_ops in ops.items():
+        path = shard_path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_json(path, apply_ops(_read_json(path, strict=True), shard_ops, KEY_FIELDS[kind]))
+
+_wal = WriteAheadLog(WAL_PATH, _fold_wal)
+
+_recovered = False
+
+def _ensure_recovered():
+    """
+    Replays a log left behind by a previous run (or a crash) into the shards,
+    once per process.
+    """
+    global _recovered
+    if _recovered:
+        return
+    _recovered = True
+    ensure_data_dir()
+    _wal.recover()
+
+def _shard_of(path):
+    # data/<kind>/<shard key>.json
+    return os.path.basename(os.path.dirname(path)), os.path.splitext(os.path.basename(path))[0]
+
+def read_shard(path):
+    """
+    Records of a shard: the file plus the log records not yet folded into it.
+    """
+    kind, key = _shard_of(path)
+    with _wal.reading():
+        ops = _wal.pending(kind, key)
+        records = _read_json(path)
+    return apply_ops(records, ops, KEY_FIELDS[kind])
+
+def _stream_shard(kind, key, path):
+    """
+    read_shard() without loading the file: its records are streamed and the
+    pending log records applied as they go by (see wal.iter_applied()).
+    """
+    with _wal.reading():
+        ops = _wal.pending(kind, key)
+        records = _iter_json(path)
+        # opens the file: a checkpoint from now on replaces it, not this read
+        first = list(itertools.islice(records, 1))
+    return iter_applied(itertools.chain(first, records), ops, KEY_FIELDS[kind])
+
+def shard_exists(path):
+    return os.path.exists(path) or bool(_wal.pending(*_shard_of(path)))
+
+def shard_stamp(path):
+    """
+    Changes whenever read_shard(path) may return something different.
+    """
+    try:
+        st = os.stat(path)
+        file_stamp = st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        file_stamp = None
+    return file_stamp, _wal.stamp(*_shard_of(path))
+
+def _commit(kind, ops):
+    """
+    Logs [(shard key, op fields)] for `kind` and waits for the group commit.
+    """
+    _ensure_recovered()
+    _wal.commit([{"kind": kind, "shard": key, **op} for key, op in ops])
+
+def checkpoint():
+    """
+    Folds the write-ahead log into the shard files now.
+    """
+    _ensure_recovered()
+    _wal.checkpoint()
+
+def _load_sharded(kind, cities=None):
+    records = []
+    for _, path in shard_paths(kind, cities):
+        records.extend(read_shard(path))
+    return records
+
+def iter_records(kind, cities=None, chunk_size: int = 10_000):
+    """
+    Streams drivers or trips shard by shard in lists of at most `chunk_size`
+    records, in the same order as load_*_from_db().
+    """
+    chunk = []
+    for key, path in shard_paths(kind, cities):
+        for rec in _stream_shard(kind, key, path):
+            chunk.append(rec)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+def _append_sharded(kind, records):
+    _ensure_sharded(kind)
+    _commit(kind, [(shard_key(rec.get("city")), {"op": "put", "rec": rec}) for rec in records])
+
+# ----------------------------
+# DRIVERS
+# ----------------------------
+def load_drivers_from_db(cities=None):
+    return _load_sharded("drivers", cities)
+
+def save_driver_to_db(driver):
+    driver = normalize_driver(driver)
+    with _wal.appending():
+        _append_sharded("drivers", [driver])
+        emit_event("driver_registered", driver)
+
+def _driver_event_type(changed):
+    if "status" in changed:
+        return "driver_status_changed"
+    if "rating" in changed or "cancel_count" in changed:
+        return "driver_rating_changed"
+    return "driver_updated"
+
+def update_drivers_in_db(updates: dict, event_type=None, **event_fields):
+    """
+    Updates drivers and logs the changes: `updates` maps a username to the
+    fields to overwrite, or to a function of the current driver returning
+    them. The drivers are read and the changes committed under the store's
+    write lock, so changes computed from a driver (rating, penalties) cannot
+    overwrite a concurrent one; all of them go out in one log commit and one
+    batch of events. `event_type` / `event_fields` name the change for
+    event-sourced consumers (see driver_state.py); by default the type is
+    derived from the changed fields. Returns {username: driver after the
+    update} for the drivers found.
+    """
+    if not updates:
+        return {}
+    ops = []
+    events = []
+    found = {}
+    with _wal.writing():
+        for key, path in shard_paths("drivers"):
+            for match in read_shard(path):
+                username = match.get("username")
+                if username not in updates or username in found:
+                    continue
+                found[username] = match
+                fields = updates[username]
+                if callable(fields):
+                    fields = fields(dict(match))
+                fields = normalize_updates("drivers", match, fields or {})
+                changed = [k for k, v in fields.items() if match.get(k) != v]
+                before = {k: match.get(k) for k in changed}
+                match.update(fields)
+                new_key = shard_key(match.get("city"))
+                if new_key != key:
+                    # city changed: move the driver to its new shard
+                    ops.append((key, {"op": "del", "key": username}))
+                    ops.append((new_key, {"op": "put", "rec": match}))
+                elif changed:
+                    ops.append((key, {"op": "set", "key": username, "fields": {k: match[k] for k in changed}}))
+                if changed or event_type:
+                    events.append((event_type or _driver_event_type(changed), {
+                        "username": username,
+                        "city": match.get("city"),
+                        **event_fields,
+                        "before": before,
+                        "after": {k: match.get(k) for k in changed},
+                    }))
+            if len(found) == len(updates):
+                break
+        _commit("drivers", ops)
+        emit_events(events)
+    return found
+
+def update_driver_in_db(username, updates, event_type=None, **event_fields):
+    """
+    update_drivers_in_db() for one driver. Returns the updated driver, or
+    None if there is no driver with this username.
+    """
+    return update_drivers_in_db({username: updates}, event_type, **event_fields).get(username)
+
+def find_driver(username):
+    for driver in load_drivers_from_db():
+        if driver.get("username") == username:
+            return driver
+    return None
+
+def penalize_driver(username, trip_id=""):
+    """
+    Applies the driver cancellation penalty (penalize_driver_rating) and logs
+    it as a `driver_cancellation_penalty` event. Returns the updated driver.
+    """
+    def penalize(driver):
+        penalized = penalize_driver_rating(driver)
+        return {"rating": penalized["rating"], "cancel_count": penalized["cancel_count"]}
+    return update_driver_in_db(
+        username,
+        penalize,
+        event_type="driver_cancellation_penalty",
+        trip_id=trip_id,
+        penalty=DRIVER_RATING_CANCEL_PENALTY,
+    )
+
+def rate_driver(username, stars: int, trip_id=""):
+    """
+    Adds a passenger rating (1-5 stars) to the driver's average and logs a
+    `driver_rated` event. Returns the updated driver.
+    """
+    def rate(driver):
+        rating, count = apply_rating(driver.get("rating"), driver.get("rating_count"), stars)
+        return {"rating": rating, "rating_count": count}
+    return update_driver_in_db(
+        username,
+        rate,
+        event_type="driver_rated",
+        trip_id=trip_id,
+        stars=int(stars),
+    )
+
+# ----------------------------
+# TRIPS
+# ----------------------------
+def load_trips_from_db(cities=None):
+    """
+    All trips, shard by shard in `shard_keys()` order.
+    """
+    return _load_sharded("trips", cities)
+
+def save_trip_to_db(trip):
+    # trip_id gives events (and anything keyed on them) a stable identity
+    trip = normalize_trip({**trip, "trip_id": trip.get("trip_id") or uuid.uuid4().hex})
+    with _wal.appending():
+        _append_sharded("trips", [trip])
+        emit_event("trip_booked", trip)
+
+def _trip_change_event(trip, before):
+    """
+    (event type, data) for a stored trip whose fields in `before` changed.
+    """
+    was_cancelled = str(before.get("status", trip.get("status"))).startswith("cancelled")
+    is_cancelled = str(trip.get("status")).startswith("cancelled")
+    return (
+        "trip_cancelled" if is_cancelled and not was_cancelled else "trip_updated",
+        {
+            "trip_id": trip.get("trip_id"),
+            "city": trip.get("city"),
+            "driver_username": trip.get("driver_username"),
+            "created_at": trip.get("created_at"),
+            "price_xof": trip.get("price_xof"),
+            "driver_earnings_xof": trip.get("driver_earnings_xof"),
+            # what the sketches need to move a trip to another day or city
+            "distance_miles": trip.get("distance_miles"),
+            "route_summary": trip.get("route_summary"),
+            "referral_code": trip.get("referral_code"),
+            "before": before,
+            "after": {k: trip.get(k) for k in before},
+        },
+    )
+
+def trip_shards():
+    """
+    {trip_id: shard key} of every stored trip (see import_trips_to_db()).
+    """
+    out = {}
+    for key, path in shard_paths("trips"):
+        for trip in _stream_shard("trips", key, path):
+            out[trip.get("trip_id")] = key
+    return out
+
+def import_trips_to_db(trips, stored):
+    """
+    Writes normalized trips in one log commit (bulk import). `stored` maps
+    the trip_id of every stored trip to its shard key (trip_shards()) and is
+    kept up to date. A new trip is logged as `trip_booked`. A trip_id already
+    stored replaces that trip, in its new shard if the city changed, and is
+    logged as `trip_updated` with the changed fields (nothing if identical),
+    so importing a file twice does not count its trips twice.
+    """
+    ops = []
+    events = []
+    written = {}
+    with _wal.writing():
+        old_shards = {}
+        for key in {stored[t["trip_id"]] for t in trips if t["trip_id"] in stored}:
+            old_shards[key] = {rec.get("trip_id"): rec for rec in read_shard(shard_path("trips", key))}
+        for trip in trips:
+            trip_id, key = trip["trip_id"], shard_key(trip.get("city"))
+            old_key = stored.get(trip_id)
+            old = written.get(trip_id) or old_shards.get(old_key, {}).get(trip_id)
+            before = {k: old.get(k) for k, v in trip.items() if old.get(k) != v} if old is not None else None
+            if before == {}:
+                continue  # identical to the stored trip
+            if old_key is not None and old_key != key:
+                ops.append((old_key, {"op": "del", "key": trip_id}))
+            ops.append((key, {"op": "put", "rec": trip}))
+            stored[trip_id] = key
+            written[trip_id] = trip
+            events.append(("trip_booked", trip) if old is None else _trip_change_event(trip, before))
+        _commit("trips", ops)
+        emit_events(events)
+
+
+def update_trips_in_db(updates: dict):
+    """
+    Batched update: `updates` maps a trip_id to the fields to overwrite, or
+    to a function of the current trip returning them (None: no change).
+    Trips are looked up and the changes committed under the store's write
+    lock, in one log commit, so a concurrent booking, update or move cannot
+    redirect or overwrite them. A trip whose city changes moves to its new
+    shard. Returns {trip_id: trip after the update} for the trips found.
+    """
+    if not updates:
+        return {}
+    ops = []
+    events = []
+    found = {}
+    with _wal.writing():
+        for key, path in shard_paths("trips"):
+            for trip in read_shard(path):
+                trip_id = trip.get("trip_id")
+                if trip_id not in updates or trip_id in found:
+                    continue
+                found[trip_id] = trip
+                fields = updates[trip_id]
+                if callable(fields):
+                    fields = fields(dict(trip))
+                fields = normalize_updates("trips", trip, fields or {})
+                changed = [k for k, v in fields.items() if trip.get(k) != v]
+                before = {k: trip.get(k) for k in changed}
+                trip.update(fields)
+                if not changed:
+                    continue
+                if shard_key(trip.get("city")) != key:
+                    # city changed: move the trip to its new shard
+                    ops.append((key, {"op": "del", "key": trip_id}))
+                    ops.append((shard_key(trip.get("city")), {"op": "put", "rec": trip}))
+                else:
+                    ops.append((key, {"op": "set", "key": trip_id, "fields": {k: trip[k] for k in changed}}))
+                events.append(_trip_change_event(trip, before))
+            if len(found) == len(updates):
+                break
+        _commit("trips", ops)
+        emit_events(events)
+    return found
+
+def find_trip(trip_id):
+    """
+    The trip with this id, or None.
+    """
+    for _, path in shard_paths("trips"):
+        for trip in read_shard(path):
+            if trip.get("trip_id") == trip_id:
+                return trip
+    return None
+
+def cancel_trip(trip_id, by, now_utc=None):
+    """
+    Cancels a scheduled trip by the passenger (free 4h+ ahead, else the late
+    fee) or the driver (penalty fee and rating penalty). A trip that is no
+    longer scheduled is returned unchanged, so a repeated request is
+    harmless. Returns the trip, or None if there is no trip with this id.
+    """
+    cancelled = []
+
+    def cancel(trip):
+        # checked under the write lock: two concurrent cancellations charge once
+        if trip.get("status") != "scheduled":
+            return None
+        if by == "driver":
+            trip = apply_driver_cancellation(trip)
+        elif passenger_can_cancel(trip, now_utc=now_utc):
+            trip["status"] = "cancelled_by_passenger"
+            trip["cancellation_reason"] = "free_passenger_cancel"
+            trip["cancellation_fee_xof"] = 0
+            trip["platform_commission_xof"] = 0
+            trip["driver_earnings_xof"] = 0
+        else:
+            trip = apply_passenger_cancellation(trip)
+        cancelled.append(True)
+        return trip
+
+    trip = update_trips_in_db({trip_id: cancel}).get(trip_id)
+    if cancelled and by == "driver" and trip.get("driver_username"):
+        # logged as a driver_cancellation_penalty event
+        penalize_driver(trip["driver_username"], trip_id=trip_id)
+    return trip
+
+def rate_trip(trip_id, stars: int):
+    """
+    The passenger's rating of a completed trip: kept on the trip as
+    `passenger_rating` and added to its driver's rating (rate_driver). A
+    trip can be rated once. Returns the updated driver, or None if the trip
+    is not found, not completed, has no driver or was already rated.
+    """
+    stars = min(5, max(1, int(stars)))
+    rated = []
+
+    def rate(trip):
+        # checked under the write lock: a double submit counts once
+        if trip.get("status") != "completed" or not trip.get("driver_username") or trip.get("passenger_rating"):
+            return None
+        rated.append(True)
+        return {"passenger_rating": stars}
+
+    trip = update_trips_in_db({trip_id: rate}).get(trip_id)
+    if not rated:
+        return None
+    return rate_driver(trip["driver_username"], stars, trip_id=trip_id)
+
+def with_datetimes(df):
+    """
+    Copy of a trips DataFrame with the epoch-ms timestamp columns shown as
+    datetimes (UTC), for display only.
+    """
+    import pandas as pd
+
+    df = df.copy()
+    for col in TIMESTAMP_FIELDS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], unit="ms")
+    return df
+
+# ----------------------------
+# TRIP QUERIES
+# ----------------------------
+# Secondary indexes per trips shard: driver, status and UTC day of created_at
+# -> row numbers. Built the first time a shard is queried and kept (with the
+# parsed records) until the shard file changes.
+_trip_shard_cache = {}
+
+def _indexed_trip_shard(path):
+    stamp = shard_stamp(path)
+    cached = _trip_shard_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+    records = read_shard(path)
+    indexes = {"driver_username": {}, "status": {}, "day": {}}
+    for row, trip in enumerate(records):
+        indexes["driver_username"].setdefault(trip.get("driver_username", ""), []).append(row)
+        indexes["status"].setdefault(trip.get("status"), []).append(row)
+        indexes["day"].setdefault((trip.get("created_at") or 0) // DAY_MS, []).append(row)
+    _trip_shard_cache[path] = (stamp, records, indexes)
+    return records, indexes
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+class TripQuery:
+    """
+    Lazy result of query_trips(). Nothing is read until a result is asked
+    for, and count() / sum() never build a DataFrame.
+
+    Plan, per shard:
+    - the city filter selects the shards to read
+    - driver, status and the created_at range are answered from the shard
+      indexes (most selective first, then intersected)
+    - remaining conditions (provider, partial days) are checked row by row
+      on the candidates only; without any indexed condition this is a scan
+    """
+
+    def __init__(self, cities=None, drivers=None, statuses=None, providers=None,
+                 start_ms=None, end_ms=None, columns=None):
+        self.cities = cities
+        self.drivers = drivers
+        self.statuses = statuses
+        self.providers = set(providers) if providers else None
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.columns = columns
+        self._rows = None
+
+    def _index_lookups(self, indexes):
+        lookups = []
+        if self.drivers:
+            lookups.append(("driver_username", [r for d in self.drivers for r in indexes["driver_username"].get(d, [])]))
+        if self.statuses:
+            lookups.append(("status", [r for s in self.statuses for r in indexes["status"].get(s, [])]))
+        if self.start_ms is not None or self.end_ms is not None:
+            first = self.start_ms // DAY_MS if self.start_ms is not None else None
+            last = (self.end_ms - 1) // DAY_MS if self.end_ms is not None else None
+            days = [d for d in indexes["day"] if (first is None or d >= first) and (last is None or d <= last)]
+            lookups.append(("day", [r for d in days for r in indexes["day"][d]]))
+        return lookups
+
+    def _matches(self, trip, check_city=False):
+        if check_city and trip.get("city") not in self.cities:
+            return False
+        if self.providers is not None and trip.get("routing_provider") not in self.providers:
+            return False
+        created = trip.get("created_at") or 0
+        if self.start_ms is not None and created < self.start_ms:
+            return False
+        if self.end_ms is not None and created >= self.end_ms:
+            return False
+        return True
+
+    def _shard_rows(self, key, records, indexes):
+        lookups = sorted(self._index_lookups(indexes), key=lambda lk: len(lk[1]))
+        if lookups:
+            rows = set(lookups[0][1])
+            for _, other in lookups[1:]:
+                if not rows:
+                    break
+                rows &= set(other)
+            rows = sorted(rows)
+        else:
+            rows = range(len(records))
+        # the catch-all shard holds several cities
+        check_city = bool(self.cities) and key == OTHER_SHARD
+        if not check_city and self.providers is None and self.start_ms is None and self.end_ms is None:
+            return list(rows)
+        return [r for r in rows if self._matches(records[r], check_city)]
+
+    def _matching(self):
+        """
+        [(shard path, records, matching row numbers)], computed once.
+        """
+        if self._rows is None:
+            self._rows = []
+            for key, path in shard_paths("trips", self.cities):
+                records, indexes = _indexed_trip_shard(path)
+                self._rows.append((path, records, self._shard_rows(key, records, indexes)))
+        return self._rows
+
+    def explain(self):
+        """
+        Human-readable plan, e.g. for debugging slow pages.
+        """
+        steps = [f"shards: {', '.join(k for k, _ in shard_paths('trips', self.cities)) or '-'}"]
+        used = [name for name, _ in self._index_lookups({"driver_username": {}, "status": {}, "day": {}})]
+        steps.append(f"index: {', '.join(used)}" if used else "scan")
+        if self.providers is not None:
+            steps.append("filter: routing_provider")
+        return steps
+
+    def count(self):
+        return sum(len(rows) for _, _, rows in self._matching())
+
+    __len__ = count
+
+    def sum(self, column):
+        return sum(records[r].get(column) or 0 for _, records, rows in self._matching() for r in rows)
+
+    def __iter__(self):
+        for _, records, rows in self._matching():
+            for r in rows:
+                trip = records[r]
+                if self.columns:
+                    yield {c: trip.get(c) for c in self.columns}
+                else:
+                    yield dict(trip)
+
+    def records(self):
+        return list(self)
+
+    def frame(self, by_trip_id: bool = False):
+        """
+        DataFrame of the matches; indexed by trip_id (the key
+        update_trips_in_db() expects) when `by_trip_id` is set.
+        """
+        import pandas as pd
+
+        df = pd.DataFrame.from_records(self.records(), columns=self.columns)
+        if by_trip_id:
+            df.index = df["trip_id"].tolist()  # with `columns`, include trip_id
+        return df
+
+def query_trips(city=None, date_range=None, created_range=None, provider=None, status=None,
+                driver=None, columns=None):
+    """
+    Filtered trips, shared by all apps. Each filter takes one value or a list:
+    - city, provider (routing provider), status, driver (username)
+    - date_range: (start_date, end_date) calendar dates, inclusive
+    - created_range: (start_ms, end_ms) epoch ms, end exclusive
+    Either bound of a range may be None. Returns a lazy TripQuery.
+    """
+    start_ms = end_ms = None
+    if date_range is not None:
+        start_ms, end_ms = date_range_ms(*date_range)
+    if created_range is not None:
+        lo, hi = created_range
+        if lo is not None:
+            start_ms = lo if start_ms is None else max(start_ms, lo)
+        if hi is not None:
+            end_ms = hi if end_ms is None else min(end_ms, hi)
+    return TripQuery(
+        cities=_as_list(city),
+        drivers=_as_list(driver),
+        statuses=_as_list(status),
+        providers=_as_list(provider),
+        start_ms=start_ms,
+        end_ms=end_ms,
+        columns=_as_list(columns),
+    )
+
+# ----------------------------
+# ADMIN LOGIN TRACKING (OPTIONAL)
+# ----------------------------
+def save_admin_login_to_db(info: dict):
+    logins = _read_json(ADMIN_LOGINS_PATH)
+    logins.append(info)
+    _write_json(ADMIN_LOGINS_PATH, logins)
+
+def load_admin_logins_from_db(limit: int = 300):
+    logins = _read_json(ADMIN_LOGINS_PATH)
+    for l in logins:
+        ts = l.get("timestamp_iso")
+        try:
+            l["_ts"] = datetime.fromisoformat(ts)
+        except Exception:
+            l["_ts"] = datetime.min
+    logins_sorted = sorted(logins, key=lambda x: x.get("_ts"), reverse=True)
+    for l in logins_sorted:
+        l.pop("_ts", None)
+    return logins_sorted[:limit]
+
+# ----------------------------
+# CITIES & VEHICLES
+# ----------------------------
+MALI_CITIES = ["Bamako", "Sikasso", "Kayes", "Mopti", "Ségou"]
+BKO_NEIGHBORHOODS = [
+    "ACI 2000", "Kalaban Coura", "Badalabougou", "Lafiabougou", "Niarela"
+]
+
+# Approximate city centres, used when a driver has no known position
+CITY_CENTERS = {
+    "Bamako": (12.6392, -8.0029),
+    "Sikasso": (11.3176, -5.6665),
+    "Kayes": (14.4469, -11.4456),
+    "Mopti": (14.4843, -4.1827),
+    "Ségou": (13.4317, -6.2157),
+}
+
+TRANSPORT_TYPES = ["Moto", "Car", "Taxi", "Tricycle"]
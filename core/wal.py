@@ -0,0 +1,370 @@
+"""
+Write-ahead log for the JSON shard store.
+
+Store writes from all sessions are appended to data/store.wal as JSON lines.
+Threads that write while a commit is in flight queue up and go out together
+in the next one, with a single fsync per batch (group commit). Shard files
+are only rewritten at checkpoints, which fold the log into them, one atomic
+file replace per shard, and then start an empty log. Readers apply the
+pending log records on top of the shard file (see shared.read_shard).
+
+Log records name the shard they belong to and are keyed by the record key
+(`username` for drivers, `trip_id` for trips):
+
+    {"kind": "trips", "shard": "Bamako", "op": "put", "rec": {...}}
+    {"kind": "trips", "shard": "Bamako", "op": "set", "key": "9f0c...", "fields": {...}}
+    {"kind": "drivers", "shard": "Kayes", "op": "del", "key": "amadou"}
+
+Replaying records onto a shard that already contains them gives the same
+records, so recovery after a crash (including one halfway through a
+checkpoint) is: drop a torn last line, then checkpoint.
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process demo, no locking
+    fcntl = None
+
+# A log past this size is folded into the shards after the next commit
+CHECKPOINT_BYTES = 4_000_000
+
+log = logging.getLogger(__name__)
+
+
+def apply_ops(records, ops, key_field):
+    """
+    Records of a shard file with its log records applied, in log order.
+    `put` replaces the record with the same key or appends, `set` updates
+    fields, `del` removes. Returned records are never shared with `ops`.
+    """
+    if not ops:
+        return records
+    records = list(records)
+    pos = {rec.get(key_field): i for i, rec in enumerate(records) if rec.get(key_field)}
+    for op in ops:
+        key = op.get("key") or op.get("rec", {}).get(key_field)
+        i = pos.get(key) if key else None
+        if op["op"] == "put":
+            if i is None:
+                if key:
+                    pos[key] = len(records)
+                records.append(dict(op["rec"]))
+            else:
+                records[i] = dict(op["rec"])
+        elif op["op"] == "set":
+            if i is not None:
+                records[i] = {**records[i], **op["fields"]}
+        elif op["op"] == "del":
+            if i is not None:
+                del records[i]
+                pos = {rec.get(key_field): j for j, rec in enumerate(records) if rec.get(key_field)}
+    return records
+
+
+def _fold_key(ops, present):
+    # outcome of one key's log records on a shard where the key is `present`
+    # or not: (exists, still at its file position, replacing record or None
+    # for the file's, fields set on top, log index it was appended at)
+    exists, in_place, rec, fields, at = present, present, None, {}, None
+    for i, op in ops:
+        if op["op"] == "put":
+            if not exists:
+                exists, at = True, i
+            rec, fields = op["rec"], {}
+        elif op["op"] == "set":
+            if exists:
+                fields.update(op["fields"])
+        elif op["op"] == "del":
+            exists = in_place = False
+            rec, fields = None, {}
+    return exists, in_place, rec, fields, at
+
+
+def iter_applied(records, ops, key_field):
+    """
+    apply_ops() over a stream: yields the records of a shard file (any
+    iterable) with its log records applied, in the same order, keeping only
+    the records the log touches in memory. Records the log deletes or
+    replaces are skipped or patched as they go by; records it appends come
+    last.
+    """
+    if not ops:
+        yield from records
+        return
+    by_key = {}
+    appended = []  # (log index, record) of puts without a key
+    for i, op in enumerate(ops):
+        key = op.get("key") or op.get("rec", {}).get(key_field)
+        if key:
+            by_key.setdefault(key, []).append((i, op))
+        elif op["op"] == "put":
+            appended.append((i, dict(op["rec"])))
+    seen = set()
+    for rec in records:
+        key = rec.get(key_field)
+        if not key or key not in by_key:
+            yield rec
+            continue
+        seen.add(key)
+        exists, in_place, new, fields, _ = _fold_key(by_key[key], True)
+        if exists and in_place:
+            yield {**(new or rec), **fields}
+    for key, key_ops in by_key.items():
+        exists, in_place, new, fields, at = _fold_key(key_ops, key in seen)
+        if exists and not in_place:
+            appended.append((at, {**new, **fields}))
+    appended.sort(key=lambda item: item[0])
+    for _, rec in appended:
+        yield rec
+
+
+def _flock(f, exclusive=True, block=True):
+    if fcntl is None:
+        return True
+    mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    try:
+        fcntl.flock(f, mode if block else mode | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _complete_lines(data):
+    """
+    (parsed records, bytes used) for the complete lines of `data`; a torn
+    last line (no newline yet, or a crash mid-write) is left out.
+    """
+    end = data.rfind(b"\n")
+    if end < 0:
+        return [], 0
+    records = []
+    for line in data[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records, end + 1
+
+
+class WriteAheadLog:
+    """
+    The log file plus three lock files:
+    - `<log>.lock`: appends and checkpoints (exclusive)
+    - `<log>.readers`: shared while a reader combines a shard file with the
+      log, exclusive while a checkpoint swaps them
+    - `<log>.writers`: held by read-modify-write updates (see writing())
+    - `<log>.appenders`: shared by plain appends until their events are
+      logged, exclusive while a reader waits for them (see settled())
+
+    `fold({(kind, shard): [records]})` writes the shards at a checkpoint.
+    """
+
+    def __init__(self, path, fold, checkpoint_bytes=CHECKPOINT_BYTES):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.readers_path = path + ".readers"
+        self.writers_path = path + ".writers"
+        self.appenders_path = path + ".appenders"
+        self.fold = fold
+        self.checkpoint_bytes = checkpoint_bytes
+
+        self._cond = threading.Condition()
+        self._queue = []
+        self._committing = False
+        self._writer_lock = threading.Lock()
+
+        # parsed log, read incrementally: (inode, bytes parsed, {(kind, shard): [records]})
+        self._cache = (None, 0, {})
+        self._cache_lock = threading.Lock()
+
+    # ----------------------------
+    # WRITES
+    # ----------------------------
+    def commit(self, records):
+        """
+        Appends the records and returns once they are on disk. Raises the
+        OSError of the batch if the write failed.
+        """
+        if not records:
+            return
+        lines = b"".join(
+            json.dumps(rec, ensure_ascii=False, default=str).encode("utf-8") + b"\n" for rec in records
+        )
+        entry = {"lines": lines, "done": False, "error": None}
+        with self._cond:
+            self._queue.append(entry)
+            while not entry["done"] and self._committing:
+                self._cond.wait()
+            if entry["done"]:
+                if entry["error"] is not None:
+                    raise entry["error"]
+                return
+            # leader: take everything queued so far
+            self._committing = True
+            batch, self._queue = self._queue, []
+
+        error, size = None, 0
+        try:
+            size = self._append(b"".join(e["lines"] for e in batch))
+        except OSError as e:
+            error = e
+        with self._cond:
+            for e in batch:
+                e["done"], e["error"] = True, error
+            self._committing = False
+            self._cond.notify_all()
+        if error is not None:
+            raise error
+        if size >= self.checkpoint_bytes:
+            try:
+                self.checkpoint(block=False)
+            except ValueError:
+                # the records are committed; the log keeps them until the
+                # shard is repaired and a checkpoint succeeds
+                log.exception("checkpoint failed, the write-ahead log is kept")
+
+    @contextmanager
+    def writing(self):
+        """
+        Held by an update from reading the records it changes to committing
+        the change, so two updates of the same record, or of a record moving
+        to another shard, cannot interleave. Plain appends do not take it.
+        """
+        with self._writer_lock:
+            with open(self.writers_path, "a") as lock:
+                _flock(lock)
+                yield
+
+    @contextmanager
+    def appending(self):
+        """
+        Held by a plain append from committing its records to logging their
+        events. Appends do not wait for each other, only for settled().
+        """
+        with open(self.appenders_path, "a") as lock:
+            _flock(lock, exclusive=False)
+            yield
+
+    @contextmanager
+    def settled(self):
+        """
+        While held, no update or append has committed records whose events
+        are not logged yet, so the event log's end matches the store.
+        """
+        with self.writing():
+            with open(self.appenders_path, "a") as lock:
+                _flock(lock)
+                yield
+
+    def _append(self, data):
+        with open(self.lock_path, "a") as lock:
+            _flock(lock)
+            with open(self.path, "a+b") as f:
+                self._drop_torn_tail(f)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                return f.tell()
+
+    @staticmethod
+    def _drop_torn_tail(f):
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        start = max(0, size - (1 << 20))
+        f.seek(start)
+        tail = f.read()
+        end = tail.rfind(b"\n")
+        f.truncate(start + end + 1 if end >= 0 else start)
+
+    # ----------------------------
+    # READS
+    # ----------------------------
+    @contextmanager
+    def reading(self):
+        """
+        Held while a shard file and its pending records are read together,
+        so a checkpoint cannot fold the log in between.
+        """
+        with open(self.readers_path, "a") as lock:
+            _flock(lock, exclusive=False)
+            yield
+
+    def _refresh(self):
+        with self._cache_lock:
+            inode, offset, ops = self._cache
+            try:
+                with open(self.path, "rb") as f:
+                    st = os.fstat(f.fileno())
+                    if st.st_ino != inode or st.st_size < offset:
+                        inode, offset, ops = st.st_ino, 0, {}
+                    if st.st_size > offset:
+                        f.seek(offset)
+                        records, used = _complete_lines(f.read())
+                        if records:
+                            ops = {k: list(v) for k, v in ops.items()}
+                            for rec in records:
+                                ops.setdefault((rec["kind"], rec["shard"]), []).append(rec)
+                        offset += used
+            except FileNotFoundError:
+                inode, offset, ops = None, 0, {}
+            self._cache = (inode, offset, ops)
+            return self._cache
+
+    def pending(self, kind, shard):
+        """
+        Log records of one shard not yet folded into its file.
+        """
+        return self._refresh()[2].get((kind, shard), [])
+
+    def stamp(self, kind, shard):
+        """
+        Changes whenever the pending records of the shard change.
+        """
+        inode, _, ops = self._refresh()
+        return inode, len(ops.get((kind, shard), ()))
+
+    # ----------------------------
+    # CHECKPOINT & RECOVERY
+    # ----------------------------
+    def checkpoint(self, block=True):
+        """
+        Folds the log into the shards and starts an empty log. Without
+        `block`, gives up (returns False) if readers or another checkpoint
+        hold the log.
+        """
+        with open(self.readers_path, "a") as readers:
+            if not _flock(readers, block=block):
+                return False
+            with open(self.lock_path, "a") as lock:
+                _flock(lock)
+                try:
+                    with open(self.path, "rb") as f:
+                        records, _ = _complete_lines(f.read())
+                except FileNotFoundError:
+                    return True
+                ops = {}
+                for rec in records:
+                    ops.setdefault((rec["kind"], rec["shard"]), []).append(rec)
+                if ops:
+                    self.fold(ops)
+                # a new file (new inode) tells readers to drop their parsed log
+                tmp = self.path + ".tmp"
+                with open(tmp, "wb") as f:
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+        return True
+
+    def recover(self):
+        """
+        Startup recovery: replays whatever the log holds into the shards.
+        """
+        return self.checkpoint(block=True)
@@ -0,0 +1,207 @@
+"""
+Spatial-temporal demand bins: pickups and dropoffs counted per grid cell and
+hour of the week, plus origin -> destination flows between coarser cells.
+
+The grid is a hierarchy of square cells: at resolution r a cell is
+1 / 2**r degrees on each side (r=0: ~111 km, r=7: ~870 m), and the parent of
+cell (y, x) is (y >> 1, x >> 1). Counts are kept at FINE_RESOLUTION only and
+rolled up to coarser resolutions when a view asks for them.
+
+History is binned in one vectorized pass over the shared snapshot columns;
+after that every `trip_booked` event in the log adds its trip to the bins, so
+the dashboards render the heatmap from a few thousand cells instead of
+plotting every trip. Hours are UTC, which is also local time in Mali.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from core.shared import read_events
+from core.schema import DAY_MS
+
+FINE_RESOLUTION = 7
+OD_RESOLUTION = 5
+HOURS_PER_WEEK = 168
+HOUR_MS = 3_600_000
+
+# 1970-01-01 was a Thursday; shift so that hour 0 is Monday 00:00 UTC
+_EPOCH_WEEKDAY = 3
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def hour_of_week(ms):
+    """
+    Epoch ms (scalar or array) -> hour of the week, 0 = Monday 00:00 UTC.
+    """
+    ms = np.asarray(ms, dtype=np.int64)
+    return ((ms // DAY_MS + _EPOCH_WEEKDAY) % 7) * 24 + (ms % DAY_MS) // HOUR_MS
+
+
+def cell_of(lat, lon, resolution=FINE_RESOLUTION):
+    """
+    Grid cell (y, x) of coordinates (scalars or arrays).
+    """
+    scale = 1 << resolution
+    # NaN (unknown position) maps to cell 0; callers mask those rows out
+    lat = np.nan_to_num(np.asarray(lat, dtype=np.float64))
+    lon = np.nan_to_num(np.asarray(lon, dtype=np.float64))
+    y = np.floor((lat + 90.0) * scale).astype(np.int64)
+    x = np.floor((lon + 180.0) * scale).astype(np.int64)
+    return y, x
+
+
+def cell_center(y, x, resolution):
+    scale = 1 << resolution
+    return (np.asarray(y) + 0.5) / scale - 90.0, (np.asarray(x) + 0.5) / scale - 180.0
+
+
+def _count_keys(keys):
+    """
+    Rows of `keys` (n x k int array) -> {tuple: count}.
+    """
+    if len(keys) == 0:
+        return {}
+    uniq, counts = np.unique(keys, axis=0, return_counts=True)
+    return {tuple(int(v) for v in row): int(c) for row, c in zip(uniq, counts)}
+
+
+class DemandGrid:
+    """
+    Pickup / dropoff counts per (cell y, cell x, hour of week) and OD flow
+    counts per (origin y, origin x, dest y, dest x, hour of week).
+
+    Start with `DemandGrid.build()`, then `refresh()` to add new bookings.
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.bins = {"pickup": {}, "drop": {}}
+        self.od = {}
+        self._arrays = {}
+
+    @classmethod
+    def build(cls):
+        from snapshot import get_snapshot
+
+        snap = get_snapshot()
+        grid = cls(offset=snap.offset)
+        if snap.n_rows == 0:
+            return grid
+        how = hour_of_week(snap.column("created_at"))
+        py, px = cell_of(snap.column("pickup_lat"), snap.column("pickup_lon"))
+        dy, dx = cell_of(snap.column("drop_lat"), snap.column("drop_lon"))
+        has_pickup = ~(np.isnan(snap.column("pickup_lat")) | np.isnan(snap.column("pickup_lon")))
+        has_drop = ~(np.isnan(snap.column("drop_lat")) | np.isnan(snap.column("drop_lon")))
+
+        grid.bins["pickup"] = _count_keys(np.column_stack([py, px, how])[has_pickup])
+        grid.bins["drop"] = _count_keys(np.column_stack([dy, dx, how])[has_drop])
+        shift = FINE_RESOLUTION - OD_RESOLUTION
+        both = has_pickup & has_drop
+        grid.od = _count_keys(np.column_stack([py >> shift, px >> shift, dy >> shift, dx >> shift, how])[both])
+        return grid
+
+    def _bump(self, counter, key):
+        counter[key] = counter.get(key, 0) + 1
+
+    def add_trip(self, trip):
+        created = trip.get("created_at")
+        if created is None:
+            return
+        how = int(hour_of_week(created))
+        cells = {}
+        for kind in ("pickup", "drop"):
+            lat, lon = trip.get(f"{kind}_lat"), trip.get(f"{kind}_lon")
+            if lat is None or lon is None:
+                continue
+            y, x = (int(v) for v in cell_of(lat, lon))
+            cells[kind] = (y, x)
+            self._bump(self.bins[kind], (y, x, how))
+        if len(cells) == 2:
+            shift = FINE_RESOLUTION - OD_RESOLUTION
+            (py, px), (dy, dx) = cells["pickup"], cells["drop"]
+            self._bump(self.od, (py >> shift, px >> shift, dy >> shift, dx >> shift, how))
+        self._arrays = {}
+
+    def refresh(self):
+        """
+        Adds the trips booked since the last call. Returns how many.
+        """
+        events, self.offset = read_events(self.offset)
+        booked = [e["data"] for e in events if e.get("type") == "trip_booked"]
+        for trip in booked:
+            self.add_trip(trip)
+        return len(booked)
+
+    def _array(self, name):
+        # (keys, counts) arrays of a counter, rebuilt only after changes
+        if name not in self._arrays:
+            counter = self.od if name == "od" else self.bins[name]
+            width = 5 if name == "od" else 3
+            keys = np.array(list(counter), dtype=np.int64).reshape(-1, width)
+            counts = np.fromiter(counter.values(), dtype=np.int64, count=len(counter))
+            self._arrays[name] = (keys, counts)
+        return self._arrays[name]
+
+    @staticmethod
+    def _select_hours(keys, counts, hours):
+        if hours is None:
+            return keys, counts
+        mask = np.isin(keys[:, -1], list(hours))
+        return keys[mask], counts[mask]
+
+    def heatmap(self, kind="pickup", resolution=FINE_RESOLUTION, hours=None):
+        """
+        DataFrame lat, lon (cell centres), trips for `kind` ("pickup" or
+        "drop") at `resolution` <= FINE_RESOLUTION, optionally only some
+        hours of the week.
+        """
+        keys, counts = self._select_hours(*self._array(kind), hours)
+        if len(keys) == 0:
+            return pd.DataFrame(columns=["lat", "lon", "trips"])
+        shift = FINE_RESOLUTION - resolution
+        cells, inverse = np.unique(keys[:, :2] >> shift, axis=0, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=counts, minlength=len(cells)).astype(np.int64)
+        lat, lon = cell_center(cells[:, 0], cells[:, 1], resolution)
+        return pd.DataFrame({"lat": lat, "lon": lon, "trips": totals}).sort_values("trips", ascending=False)
+
+    def by_hour_of_week(self, kind="pickup"):
+        """
+        DataFrame day x hour (0-23) of trip counts.
+        """
+        keys, counts = self._array(kind)
+        week = np.bincount(keys[:, 2], weights=counts, minlength=HOURS_PER_WEEK) if len(keys) else np.zeros(HOURS_PER_WEEK)
+        return pd.DataFrame(week.astype(np.int64).reshape(7, 24), index=DAY_NAMES)
+
+    def flows(self, hours=None, top=20):
+        """
+        Top origin -> destination flows between OD_RESOLUTION cells.
+        """
+        keys, counts = self._select_hours(*self._array("od"), hours)
+        columns = ["origin_lat", "origin_lon", "dest_lat", "dest_lon", "trips"]
+        if len(keys) == 0:
+            return pd.DataFrame(columns=columns)
+        pairs, inverse = np.unique(keys[:, :4], axis=0, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=counts, minlength=len(pairs)).astype(np.int64)
+        order = np.argsort(-totals, kind="stable")[:top]
+        olat, olon = cell_center(pairs[order, 0], pairs[order, 1], OD_RESOLUTION)
+        dlat, dlon = cell_center(pairs[order, 2], pairs[order, 3], OD_RESOLUTION)
+        return pd.DataFrame(dict(zip(columns, [olat, olon, dlat, dlon, totals[order]])))
+
+
+_grid = None
+_grid_lock = threading.Lock()
+
+
+def get_demand_grid():
+    """
+    Process-wide grid, shared by all sessions and brought up to date with
+    the event log on every call.
+    """
+    global _grid
+    with _grid_lock:
+        if _grid is None:
+            _grid = DemandGrid.build()
+        _grid.refresh()
+        return _grid
@@ -0,0 +1,287 @@
+"""
+Batch dispatcher: assigns scheduled trips to available drivers.
+
+For each city we build a (trips x drivers) cost matrix with numpy and solve a
+min-cost assignment on it. Cities are independent, so a large fleet is solved
+as several small problems instead of one huge one. All assignments are written
+back with a single `update_trips_in_db` call.
+
+Run from the command line:
+
+    python dispatch.py                 # dispatch unassigned scheduled trips
+    python dispatch.py --dry-run       # only print the plan
+    python dispatch.py --include-assigned --horizon-hours 12
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.shared import (
+    labels,
+    load_drivers_from_db,
+    load_trips_from_db,
+    update_trips_in_db,
+    get_commission_pct,
+    haversine_miles_vec,
+    CITY_CENTERS,
+)
+from core.schema import now_ms, WEEK_MS
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # scipy is optional – fall back to the greedy solver
+    linear_sum_assignment = None
+
+# ----------------------------
+# COST WEIGHTS (XOF-ish units, tune freely)
+# ----------------------------
+COST_PER_PICKUP_MILE = 100.0
+COST_PER_RATING_POINT = 150.0         # (5.0 - rating) * weight
+COST_PER_COMMISSION_POINT = 20.0      # favour drivers in higher-commission (low volume) tiers
+MAX_PICKUP_MILES = 30.0               # beyond this a pair is not considered
+
+INFEASIBLE = 1e12
+GREEDY_CANDIDATES = 16  # cheapest drivers per trip the greedy solver sorts
+
+STATUS_AVAILABLE = labels["English"]["status_options"][0]
+
+
+# ----------------------------
+# INPUT SELECTION
+# ----------------------------
+def select_dispatchable_trips(trips, now=None, horizon_hours=None, include_assigned=False):
+    """
+    Returns the indices in `trips` of trips that should be dispatched:
+    - status "scheduled"
+    - no driver yet (or any driver, with include_assigned=True)
+    - not in the past, and within `horizon_hours` if given
+    `now` is epoch ms.
+    """
+    if now is None:
+        now = now_ms()
+    until = now + int(horizon_hours * 3_600_000) if horizon_hours else None
+
+    selected = []
+    for idx, t in enumerate(trips):
+        if t["status"] != "scheduled":
+            continue
+        if t["driver_username"] and not include_assigned:
+            continue
+        sched = t["scheduled_for"]
+        if sched is not None:
+            if sched < now:
+                continue
+            if until is not None and sched > until:
+                continue
+        selected.append(idx)
+    return selected
+
+
+def weekly_trip_counts(trips, now=None):
+    """
+    Trips per driver over the last 7 days (same window as the driver app).
+    """
+    if not trips:
+        return {}
+    now = now_ms() if now is None else now
+    df = pd.DataFrame.from_records(trips, columns=["driver_username", "created_at"])
+    mask = (df["created_at"] >= now - WEEK_MS) & (df["created_at"] <= now) & (df["driver_username"] != "")
+    return df.loc[mask, "driver_username"].value_counts().to_dict()
+
+
+# ----------------------------
+# COST MATRIX
+# ----------------------------
+def _driver_positions(drivers):
+    lat = np.empty(len(drivers))
+    lon = np.empty(len(drivers))
+    for i, d in enumerate(drivers):
+        default = CITY_CENTERS.get(d.get("city"), (np.nan, np.nan))
+        try:
+            lat[i] = float(d.get("lat", default[0]))
+            lon[i] = float(d.get("lon", default[1]))
+        except (TypeError, ValueError):
+            lat[i], lon[i] = default
+    return lat, lon
+
+
+def build_cost_matrix(trips, drivers, weekly_counts):
+    """
+    Cost of giving trip i to driver j, shape (len(trips), len(drivers)).
+    Pairs that must not be matched get INFEASIBLE.
+    """
+    t_lat = np.array([t["pickup_lat"] for t in trips], dtype=float)
+    t_lon = np.array([t["pickup_lon"] for t in trips], dtype=float)
+    d_lat, d_lon = _driver_positions(drivers)
+
+    pickup = haversine_miles_vec(t_lat[:, None], t_lon[:, None], d_lat[None, :], d_lon[None, :])
+    pickup = np.nan_to_num(pickup, nan=MAX_PICKUP_MILES)
+    cost = pickup * COST_PER_PICKUP_MILE
+
+    rating = np.array([d["rating"] for d in drivers], dtype=float)
+    cost += ((5.0 - rating) * COST_PER_RATING_POINT)[None, :]
+
+    pct = np.array([get_commission_pct(weekly_counts.get(d.get("username"), 0)) for d in drivers])
+    cost += ((pct.max() - pct) * COST_PER_COMMISSION_POINT)[None, :]
+
+    wanted = np.array([t["transport_type"] for t in trips], dtype=object)
+    offered = np.array([d["transport_type"] for d in drivers], dtype=object)
+    mismatch = (wanted[:, None] != "") & (wanted[:, None] != offered[None, :])
+    cost[pickup > MAX_PICKUP_MILES] = INFEASIBLE
+    cost[mismatch] = INFEASIBLE  # never send the wrong vehicle
+    return cost
+
+
+# ----------------------------
+# SOLVERS
+# ----------------------------
+def _greedy_assignment(cost, k=GREEDY_CANDIDATES):
+    """
+    Cheapest-pair-first matching; not optimal like Hungarian but close for
+    dispatch costs. Only each trip's k cheapest free drivers are sorted
+    (argpartition, linear in the matrix size). Trips whose candidates were
+    all taken get another round over the drivers still free. INFEASIBLE
+    pairs are never assigned.
+    """
+    n_rows, n_cols = cost.shape
+    used_r = np.zeros(n_rows, dtype=bool)
+    used_c = np.zeros(n_cols, dtype=bool)
+    out_r, out_c = [], []
+    limit = min(n_rows, n_cols)
+    rows_left = np.arange(n_rows)
+    while len(out_r) < limit:
+        free_c = np.flatnonzero(~used_c)
+        sub = cost if len(free_c) == n_cols and len(rows_left) == n_rows else cost[np.ix_(rows_left, free_c)]
+        kk = min(k, len(free_c))
+        if kk < len(free_c):
+            cand = np.argpartition(sub, kk - 1, axis=1)[:, :kk]
+        else:
+            cand = np.broadcast_to(np.arange(kk), (len(rows_left), kk))
+        values = np.take_along_axis(sub, cand, axis=1).ravel()
+        rows = np.repeat(rows_left, kk)
+        cols = free_c[cand.ravel()]
+        feasible = values < INFEASIBLE
+        if not feasible.any():  # no trip has a feasible free driver left
+            break
+        values, rows, cols = values[feasible], rows[feasible], cols[feasible]
+        # every round assigns at least its cheapest feasible pair
+        for i in np.argsort(values, kind="stable").tolist():
+            r, c = int(rows[i]), int(cols[i])
+            if used_r[r] or used_c[c]:
+                continue
+            used_r[r] = used_c[c] = True
+            out_r.append(r)
+            out_c.append(c)
+            if len(out_r) == limit:
+                break
+        if kk == len(free_c):  # every free pair was considered
+            break
+        rows_left = rows_left[~used_r[rows_left]]
+    return np.array(out_r, dtype=int), np.array(out_c, dtype=int)
+
+
+def solve_assignment(cost):
+    if cost.size == 0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    if linear_sum_assignment is not None:
+        rows, cols = linear_sum_assignment(cost)
+    else:
+        rows, cols = _greedy_assignment(cost)
+    ok = cost[rows, cols] < INFEASIBLE
+    return rows[ok], cols[ok]
+
+
+# ----------------------------
+# DISPATCH
+# ----------------------------
+def plan_dispatch(trips, drivers, now=None, horizon_hours=None, include_assigned=False, capacity=1):
+    """
+    Builds the assignment plan without writing anything.
+
+    Returns a dict {trip_id: fields to update}. Each driver receives at
+    most `capacity` trips per run.
+    """
+    trip_idx = select_dispatchable_trips(trips, now, horizon_hours, include_assigned)
+    available = [d for d in drivers if d.get("status", STATUS_AVAILABLE) == STATUS_AVAILABLE and d.get("username")]
+    if not trip_idx or not available:
+        return {}
+
+    weekly = weekly_trip_counts(trips, now)
+
+    by_city_trips = {}
+    for idx in trip_idx:
+        by_city_trips.setdefault(trips[idx].get("city"), []).append(idx)
+    by_city_drivers = {}
+    for d in available:
+        by_city_drivers.setdefault(d.get("city"), []).append(d)
+
+    plan = {}
+    for city, idxs in by_city_trips.items():
+        city_drivers = by_city_drivers.get(city, [])
+        if not city_drivers:
+            continue
+        slots = [d for d in city_drivers for _ in range(max(1, capacity))]
+        cost = build_cost_matrix([trips[i] for i in idxs], slots, weekly)
+        rows, cols = solve_assignment(cost)
+
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            trip = trips[idxs[r]]
+            username = slots[c]["username"]
+            weekly[username] = weekly.get(username, 0) + 1
+            pct = get_commission_pct(weekly[username])
+            fare = trip["price_xof"]
+            platform_commission = round(fare * pct / 100)
+            plan[trip["trip_id"]] = {
+                "driver_username": username,
+                "platform_pct": pct,
+                "driver_pct": 100 - pct,
+                "platform_commission_xof": platform_commission,
+                "driver_earnings_xof": fare - platform_commission,
+                "assigned_by": "batch_dispatch",
+            }
+    return plan
+
+
+def run_dispatch(horizon_hours=None, include_assigned=False, capacity=1, dry_run=False):
+    trips = load_trips_from_db()
+    drivers = load_drivers_from_db()
+    plan = plan_dispatch(trips, drivers, horizon_hours=horizon_hours,
+                         include_assigned=include_assigned, capacity=capacity)
+    if not dry_run:
+        # applied only to trips still dispatchable when the write happens
+        # (not cancelled or assigned by someone else since they were read)
+        def guarded(fields):
+            def update(trip):
+                if trip["status"] != "scheduled" or (trip["driver_username"] and not include_assigned):
+                    return None
+                return fields
+            return update
+        update_trips_in_db({trip_id: guarded(fields) for trip_id, fields in plan.items()})
+    return plan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assign scheduled trips to available drivers.")
+    parser.add_argument("--horizon-hours", type=float, default=None,
+                        help="only dispatch trips scheduled within this many hours")
+    parser.add_argument("--include-assigned", action="store_true",
+                        help="also re-optimise trips that already have a driver")
+    parser.add_argument("--capacity", type=int, default=1,
+                        help="max trips per driver in one run")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    plan = run_dispatch(args.horizon_hours, args.include_assigned, args.capacity, args.dry_run)
+    elapsed = time.perf_counter() - started
+
+    for trip_id, fields in sorted(plan.items()):
+        print(f"trip {trip_id[:8]} -> {fields['driver_username']} ({fields['platform_pct']}%)")
+    action = "planned" if args.dry_run else "assigned"
+    print(f"{len(plan)} trips {action} in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
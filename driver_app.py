@@ -3,20 +3,23 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 
-from shared import (
+from core.shared import (
     LANG_OPTIONS,
     labels,
-    load_drivers_from_db,
     save_driver_to_db,
-    update_driver_in_db,
-    load_trips_from_db,
+    query_trips,
     get_commission_pct,
-    apply_driver_cancellation,
-    penalize_driver_rating,
-    TRIPS_PATH,
-    _write_json,
+    DRIVER_CANCEL_PENALTY_PCT,
     MALI_CITIES,
+    TRANSPORT_TYPES,
+    with_datetimes,
 )
+from core.schema import now_ms, WEEK_MS, DRIVER_STATUSES
+from driver_state import get_driver_state
+from presence import heartbeat, HEARTBEAT_SECONDS
+from settlement import driver_statements
+from jobs import submit
+from driver_search import get_driver_search
 
 st.set_page_config(page_title="Mali Ride – Driver App", layout="wide")
 
@@ -36,7 +39,6 @@ def L(key):
 st.title("🚖 Mali Ride – Driver Demo")
 st.caption("Register drivers and view their earnings, penalties, and ratings based on recent trips.")
 
-drivers = load_drivers_from_db()
 if "logged_driver" not in st.session_state:
     st.session_state["logged_driver"] = None
 
@@ -50,11 +52,13 @@ with st.form("register_driver"):
     last_name = st.text_input("Last name")
     age = st.number_input("Age", min_value=18, max_value=80, value=30)
     city = st.selectbox("City", MALI_CITIES)
-    transport_type = st.selectbox("Transport type", ["Moto", "Car", "Taxi", "Tricycle"])
+    transport_type = st.selectbox("Transport type", TRANSPORT_TYPES)
     submitted = st.form_submit_button("Add driver")
     if submitted:
         if not username:
             st.error("Username is required.")
+        elif get_driver_search().get(username.strip()):
+            st.error("This username is already taken.")
         else:
             # initialize rating & cancel_count
             driver = {
@@ -71,20 +75,32 @@ with st.form("register_driver"):
             }
             save_driver_to_db(driver)
             st.success("Driver added.")
-            drivers = load_drivers_from_db()
 
 # ----------------------------
 # EXISTING DRIVERS
 # ----------------------------
 st.markdown("## 🚕 Existing drivers")
-if drivers:
-    df = pd.DataFrame(drivers)
-    display_cols = [c for c in ["username", "first_name", "last_name", "city", "transport_type", "rating", "cancel_count"] if c in df.columns]
-    st.dataframe(df[display_cols])
-
-    login_username = st.selectbox("Log in as driver", options=df["username"].tolist())
-    if st.button("Log in as this driver"):
-        st.session_state["logged_driver"] = login_username
+index = get_driver_search()
+if len(index):
+    # A page of search results instead of the whole fleet
+    col_q, col_c, col_s = st.columns([3, 2, 2])
+    with col_q:
+        query = st.text_input("Search drivers (username or name)", key="driver_search_query")
+    with col_c:
+        search_city = st.selectbox("City", [""] + MALI_CITIES, key="driver_search_city")
+    with col_s:
+        search_status = st.selectbox("Status", [""] + list(DRIVER_STATUSES), key="driver_search_status")
+    matches = index.search(query, city=search_city or None, status=search_status or None)
+    display_cols = ["username", "first_name", "last_name", "city", "transport_type", "status", "rating", "cancel_count"]
+    if matches:
+        st.dataframe(pd.DataFrame(matches, columns=display_cols), hide_index=True)
+        st.caption(f"Showing {len(matches)} of {len(index):,} drivers – refine the search to narrow down.")
+
+        login_username = st.selectbox("Log in as driver", options=[d["username"] for d in matches])
+        if st.button("Log in as this driver"):
+            st.session_state["logged_driver"] = login_username
+    else:
+        st.info("No driver matches this search.")
 else:
     st.info("No drivers registered yet.")
 
@@ -95,34 +111,24 @@ if st.session_state["logged_driver"]:
     username_logged = st.session_state["logged_driver"]
     st.markdown(f"### Dashboard for driver: `{username_logged}`")
 
-    trips_history = load_trips_from_db()
-    weekly_trips = 0
-    total_driver_earnings = 0
-    total_platform_commission = 0
-
-    try:
-        df_trips = pd.DataFrame(trips_history)
-        if not df_trips.empty and "created_at" in df_trips.columns and "driver_username" in df_trips.columns:
-            df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-            now = pd.Timestamp.utcnow()
-            last_7 = now - pd.Timedelta(days=7)
-            mask = (
-                (df_trips["driver_username"] == username_logged)
-                & (df_trips["created_at"] >= last_7)
-                & (df_trips["created_at"] <= now)
-            )
-            df_week = df_trips[mask].copy()
-            weekly_trips = len(df_week)
-            if "driver_earnings_xof" in df_week.columns:
-                total_driver_earnings = float(df_week["driver_earnings_xof"].sum())
-            if "platform_commission_xof" in df_week.columns:
-                total_platform_commission = float(df_week["platform_commission_xof"].sum())
-    except Exception:
-        pass
+    @st.fragment(run_every=HEARTBEAT_SECONDS)
+    def presence_heartbeat():
+        # Keeps the driver online; without heartbeats they go Offline after the TTL
+        driver = get_driver_search().get(username_logged)
+        heartbeat(username_logged, driver.get("status") if driver else None)
+        st.caption(f"🟢 Online – heartbeat every {HEARTBEAT_SECONDS}s")
+
+    presence_heartbeat()
+
+    now = now_ms()
+    week_trips = query_trips(driver=username_logged, created_range=(now - WEEK_MS, now + 1))
+    weekly_trips = week_trips.count()
+    total_driver_earnings = int(week_trips.sum("driver_earnings_xof"))
+    total_platform_commission = int(week_trips.sum("platform_commission_xof"))
 
     current_commission_pct = get_commission_pct(weekly_trips)
 
-    current_driver = next((d for d in drivers if d.get("username") == username_logged), None)
+    current_driver = get_driver_search().get(username_logged)
     rating_val = current_driver.get("rating", 5.0) if current_driver else 5.0
     cancel_count = current_driver.get("cancel_count", 0) if current_driver else 0
 
@@ -135,52 +141,60 @@ if st.session_state["logged_driver"]:
 
     st.caption("Commission tier is based on trips in the last 7 days (launch promo tiers).")
 
+    with st.expander("Rating & penalty history"):
+        history = get_driver_state().history.get(username_logged, [])
+        if history:
+            st.dataframe(pd.DataFrame([
+                {
+                    "time": e.get("ts"),
+                    "event": e.get("type"),
+                    "trip_id": e["data"].get("trip_id", ""),
+                    "stars": e["data"].get("stars"),
+                    "after": e["data"].get("after"),
+                }
+                for e in reversed(history)
+            ]))
+        else:
+            st.caption("No recorded changes yet.")
+
+    with st.expander("💰 Weekly statements"):
+        # Written by the weekly settlement run (settlement.py), no trip scan
+        statements = driver_statements(username_logged)
+        if not statements.empty:
+            st.dataframe(statements, hide_index=True)
+        else:
+            st.caption("No settled weeks yet – statements appear after the weekly settlement run.")
+
     # ----------------------------
     # SCHEDULED TRIPS VIEW + CANCELLATION
     # ----------------------------
     st.markdown("---")
     st.subheader("🗓️ My scheduled trips")
 
-    all_trips = load_trips_from_db()
-    df_all = pd.DataFrame(all_trips)
+    my_sched = query_trips(driver=username_logged, status=["scheduled", "cancelled_by_driver"])
+    df_my_sched = my_sched.frame(by_trip_id=True)
 
-    if not df_all.empty:
-        if "status" not in df_all.columns:
-            df_all["status"] = "scheduled"
+    if not df_my_sched.empty:
+        st.dataframe(with_datetimes(df_my_sched))
 
-        df_my_sched = df_all[
-            (df_all["driver_username"] == username_logged)
-            & (df_all["status"].isin(["scheduled", "cancelled_by_driver"]))
-        ].copy()
+        trip_ids = df_my_sched.index.tolist()
+        chosen_id = st.selectbox("Select a scheduled trip to cancel", trip_ids, key="driver_cancel_select")
 
-        if not df_my_sched.empty:
-            st.dataframe(df_my_sched)
-
-            trip_indices = df_my_sched.index.tolist()
-            chosen_idx = st.selectbox("Select a scheduled trip to cancel", trip_indices, key="driver_cancel_select")
-
-            if st.button("Cancel selected scheduled trip", key="driver_cancel_button"):
-                trips_list = all_trips
-                trip = trips_list[chosen_idx]
-
-                trip = apply_driver_cancellation(trip)
-
-                # penalize driver rating
-                drivers_list = load_drivers_from_db()
-                for d in drivers_list:
-                    if d.get("username") == username_logged:
-                        penalized = penalize_driver_rating(d)
-                        update_driver_in_db(username_logged, penalized)
-                        break
-
-                trips_list[chosen_idx] = trip
-                _write_json(TRIPS_PATH, trips_list)
+        if st.button("Cancel selected scheduled trip", key="driver_cancel_button"):
+            trip = dict(zip(df_my_sched.index, my_sched.records()))[chosen_id]
 
+            # Trip rewrite and rating penalty run in the job worker when one
+            # is up (jobs.py)
+            if trip.get("status") != "scheduled":
+                st.info("This trip is already cancelled.")
+            elif submit("cancel_trip", {"trip_id": trip.get("trip_id"), "by": "driver"})["status"] == "failed":
+                st.warning("The cancellation failed, please try again.")
+            else:
+                penalty = round(int(trip.get("price_xof") or 0) * DRIVER_CANCEL_PENALTY_PCT)
                 st.error(
-                    f"Trip cancelled by driver. A penalty of {trip['cancellation_fee_xof']:,.0f} XOF "
+                    f"Trip cancelled by driver. A penalty of {penalty:,.0f} XOF "
                     f"is charged to the company and your rating has been reduced."
                 )
-        else:
-            st.info("No scheduled trips for this driver.")
     else:
-        st.info("No trips found.")
+        st.info("No scheduled trips for this driver.")
+
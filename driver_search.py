@@ -0,0 +1,310 @@
+"""
+Driver search for the selectors: prefix and trigram matching on username,
+first and last name, with filters on city, transport type, status and
+rating range.
+
+- Prefix: one sorted list of (username, slot) and one of (name token, slot);
+  a query is a bisect plus a walk over the matching run, which stops as soon
+  as a page of results is filled.
+- Trigrams: {trigram: set of slots} over the same strings, for queries that
+  match inside a word or with a typo ("0042" or "dvr00042" finds
+  "drv00042"), tried when nothing matches by prefix. Candidates come from
+  the rarest query trigrams only, and are ranked by the share of query
+  trigrams they contain.
+- Filters: {value: set of slots} per facet. Trigram candidates are
+  intersected with the smallest selected facet set before they are capped.
+  When that set is small next to the fleet, prefix queries (and the empty
+  query) scan its slots instead of walking the sorted lists, which would
+  skip over every driver outside the filter.
+
+Text is lowercased and accent-folded. The index is built from the
+event-sourced driver state and kept current with the driver events of the
+log (registrations, status, rating and profile changes), like the
+leaderboard.
+
+    python driver_search.py "ama" --city Bamako --limit 5
+"""
+import argparse
+import bisect
+import heapq
+import threading
+import time
+import unicodedata
+
+from core.shared import read_events
+
+PAGE_SIZE = 20
+FACETS = ("city", "transport_type", "status")
+# candidates scored per trigram query, whatever the fleet size
+MAX_TRIGRAM_CANDIDATES = 2_000
+
+
+def fold(text):
+    """
+    Lowercase, accents removed: "Koné" -> "kone".
+    """
+    text = str(text or "").lower()
+    if text.isascii():
+        return text.strip()
+    text = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _name_tokens(driver):
+    return {t for field in ("first_name", "last_name") for t in fold(driver.get(field)).split()}
+
+
+def _strings(driver):
+    return {fold(driver.get("username"))} | _name_tokens(driver)
+
+
+class DriverSearch:
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.drivers = []  # slot -> driver (a copy)
+        self.slots = {}  # username -> slot
+        self.usernames = []  # sorted (folded username, slot)
+        self.names = []  # sorted (folded name token, slot)
+        self.grams = {}  # trigram -> {slot}
+        self.facets = {facet: {} for facet in FACETS}  # facet -> value -> {slot}
+
+    @classmethod
+    def build(cls):
+        from driver_state import get_driver_state
+
+        state = get_driver_state()
+        index = cls(offset=state.offset)
+        for driver in state.drivers.values():
+            index.put(driver, sort=False)
+        index.usernames.sort()
+        index.names.sort()
+        return index
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, username):
+        slot = self.slots.get(username)
+        return self.drivers[slot] if slot is not None else None
+
+    # ----------------------------
+    # MAINTENANCE
+    # ----------------------------
+    def _unindex(self, slot):
+        driver = self.drivers[slot]
+        name = fold(driver.get("username"))
+        i = bisect.bisect_left(self.usernames, (name, slot))
+        if i < len(self.usernames) and self.usernames[i] == (name, slot):
+            del self.usernames[i]
+        for token in _name_tokens(driver):
+            i = bisect.bisect_left(self.names, (token, slot))
+            if i < len(self.names) and self.names[i] == (token, slot):
+                del self.names[i]
+        for text in _strings(driver):
+            for gram in trigrams(text):
+                self.grams.get(gram, set()).discard(slot)
+        for facet in FACETS:
+            self.facets[facet].get(driver.get(facet) or "", set()).discard(slot)
+
+    def put(self, driver, sort=True):
+        """
+        Adds a driver or re-indexes it after a change. Without `sort` the
+        prefix lists are left unsorted (bulk build: sort them once at the end).
+        """
+        username = driver.get("username")
+        if not username:
+            return
+        slot = self.slots.get(username)
+        if slot is None:
+            slot = self.slots[username] = len(self.drivers)
+            self.drivers.append(None)
+        else:
+            self._unindex(slot)
+        driver = self.drivers[slot] = dict(driver)
+
+        add = bisect.insort if sort else list.append
+        name, tokens = fold(username), _name_tokens(driver)
+        add(self.usernames, (name, slot))
+        for token in tokens:
+            add(self.names, (token, slot))
+        grams = self.grams
+        for gram in set().union(trigrams(name), *(trigrams(t) for t in tokens)):
+            posting = grams.get(gram)
+            if posting is None:
+                posting = grams[gram] = set()
+            posting.add(slot)
+        for facet in FACETS:
+            self.facets[facet].setdefault(driver.get(facet) or "", set()).add(slot)
+
+    def refresh(self):
+        """
+        Re-indexes the drivers touched by events written since the last
+        call. Returns how many events were read.
+        """
+        from driver_state import get_driver_state
+
+        state = get_driver_state()
+        events, self.offset = read_events(self.offset)
+        touched = {e.get("data", {}).get("username") for e in events if e.get("type", "").startswith("driver_")}
+        for username in touched:
+            driver = state.drivers.get(username)
+            if driver:
+                self.put(driver)
+        return len(events)
+
+    # ----------------------------
+    # QUERIES
+    # ----------------------------
+    def _filter(self, city=None, transport_type=None, status=None, rating=None):
+        """
+        (selected facet sets, smallest first; slot -> bool) for the given
+        filters (values or lists of values).
+        """
+        allowed = []
+        for facet, value in (("city", city), ("transport_type", transport_type), ("status", status)):
+            if value:
+                values = [value] if isinstance(value, str) else value
+                allowed.append(set().union(*(self.facets[facet].get(v, set()) for v in values))
+                               if len(values) > 1 else self.facets[facet].get(values[0], set()))
+        allowed.sort(key=len)
+        lo, hi = rating if rating else (None, None)
+
+        def ok(slot):
+            if any(slot not in s for s in allowed):
+                return False
+            if rating:
+                value = float(self.drivers[slot].get("rating") or 0)
+                return (lo is None or value >= lo) and (hi is None or value <= hi)
+            return True
+        return allowed, ok
+
+    @staticmethod
+    def _walk_prefix(entries, prefix, ok, out, seen, limit):
+        i = bisect.bisect_left(entries, (prefix, -1))
+        while i < len(entries) and len(out) < limit:
+            text, slot = entries[i]
+            if not text.startswith(prefix):
+                break
+            if slot not in seen and ok(slot):
+                seen.add(slot)
+                out.append(slot)
+            i += 1
+
+    @staticmethod
+    def _scan_prefix(slots, texts, prefix, ok, out, seen, limit):
+        """
+        _walk_prefix() over `slots` only (same order): texts(slot) are the
+        strings of the slot's entries.
+        """
+        hits = []
+        for slot in slots:
+            if slot in seen:
+                continue
+            matching = [t for t in texts(slot) if t.startswith(prefix)]
+            if matching and ok(slot):
+                hits.append((min(matching), slot))
+        for _, slot in heapq.nsmallest(limit - len(out), hits):
+            seen.add(slot)
+            out.append(slot)
+
+    def _trigram_matches(self, query, allowed, ok, seen, limit):
+        grams = trigrams(query)
+        if not grams:
+            return []
+        postings = sorted((p for p in (self.grams.get(g) for g in grams) if p), key=len)
+        # a match shares at least one of the two rarest trigrams (one typo);
+        # the filter is applied before the cap so it cannot empty the page
+        candidates = set()
+        for posting in postings[:2]:
+            if allowed:
+                posting = posting & allowed[0]
+            for slot in posting:
+                if len(candidates) >= MAX_TRIGRAM_CANDIDATES:
+                    break
+                candidates.add(slot)
+        scored = []
+        for slot in candidates - seen:
+            score = sum(slot in posting for posting in postings) / len(grams)
+            if score >= 0.5 and ok(slot):
+                scored.append((-score, self.drivers[slot].get("username"), slot))
+        return [slot for _, _, slot in sorted(scored)[:limit]]
+
+    def search(self, query="", limit=PAGE_SIZE, city=None, transport_type=None, status=None, rating=None):
+        """
+        Up to `limit` drivers matching `query` and the filters: username
+        prefix matches first, then first / last name prefix matches, and,
+        only when nothing matches by prefix, trigram matches (inside words,
+        typos). `rating` is a (min, max) range, either end None.
+        """
+        allowed, ok = self._filter(city, transport_type, status, rating)
+        # a walk finds about limit * fleet / |allowed| entries before the page
+        # is full: scan the allowed slots when there are fewer of those
+        narrow = allowed[0] if allowed and len(allowed[0]) ** 2 < limit * len(self.usernames) else None
+        q = fold(query)
+        out, seen = [], set()
+        if narrow is not None:
+            self._scan_prefix(narrow, lambda slot: (fold(self.drivers[slot].get("username")),), q, ok, out, seen, limit)
+        else:
+            self._walk_prefix(self.usernames, q, ok, out, seen, limit)
+        if q:
+            # "amadou ko": first token walks the names, the others must
+            # prefix one of the driver's other name tokens
+            first, *rest = q.split()
+
+            def ok_name(slot):
+                tokens = _name_tokens(self.drivers[slot])
+                return ok(slot) and all(any(t.startswith(r) for t in tokens) for r in rest)
+            if narrow is not None:
+                self._scan_prefix(narrow, lambda slot: _name_tokens(self.drivers[slot]), first, ok_name, out, seen, limit)
+            else:
+                self._walk_prefix(self.names, first, ok_name, out, seen, limit)
+            if not out and len(q) >= 3:
+                out.extend(self._trigram_matches(q.replace(" ", ""), allowed, ok, seen, limit - len(out)))
+        return [self.drivers[slot] for slot in out]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_driver_search():
+    """
+    Process-wide index, brought up to date with the event log on every call.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DriverSearch.build()
+        _index.refresh()
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search drivers by username or name.")
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--city")
+    parser.add_argument("--transport-type")
+    parser.add_argument("--status")
+    parser.add_argument("--min-rating", type=float)
+    parser.add_argument("--limit", type=int, default=PAGE_SIZE)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    index = get_driver_search()
+    built = time.perf_counter() - started
+    rating = (args.min_rating, None) if args.min_rating is not None else None
+    started = time.perf_counter()
+    results = index.search(args.query, args.limit, args.city, args.transport_type, args.status, rating)
+    took = time.perf_counter() - started
+    for d in results:
+        print(f"{d.get('username'):20} {d.get('first_name', '')} {d.get('last_name', '')} · "
+              f"{d.get('city', '')} · {d.get('transport_type', '')} · {d.get('status', '')} · {d.get('rating')}")
+    print(f"{len(results)} of {len(index):,} drivers in {took * 1000:.2f} ms (index ready in {built:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
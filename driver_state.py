@@ -0,0 +1,246 @@
+"""
+Event-sourced driver state.
+
+Every driver change is an event in data/events.log (see core/shared.py):
+- driver_registered            full driver record
+- driver_status_changed        before / after status
+- driver_cancellation_penalty  trip_id, penalty (rating points)
+- driver_rated                 trip_id, stars
+- driver_rating_changed / driver_updated   other field changes (before / after)
+
+`apply_driver_event` folds one event into the state, re-applying the business
+rules (penalty, rating average) instead of trusting the stored values, so the
+state can be recomputed and audited against the driver shards.
+
+Materialization:
+- data/driver_state/snapshot.json: state at some log offset, rewritten every
+  SNAPSHOT_EVERY events; a cold start loads it and replays only the tail
+- data/driver_state/genesis.json: drivers that existed before the event log
+  (taken once from the shards); a full rebuild replays the whole log on top
+
+    python driver_state.py rebuild     # genesis + full log, writes a snapshot
+    python driver_state.py audit       # compare with the driver shards
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from core.shared import (
+    DATA_DIR,
+    DRIVER_RATING_MIN,
+    apply_rating,
+    load_drivers_from_db,
+    read_events,
+    events_end_offset,
+    _read_json,
+)
+
+STATE_DIR = os.path.join(DATA_DIR, "driver_state")
+SNAPSHOT_PATH = os.path.join(STATE_DIR, "snapshot.json")
+GENESIS_PATH = os.path.join(STATE_DIR, "genesis.json")
+
+SNAPSHOT_EVERY = 1_000
+HISTORY_PER_DRIVER = 20
+REBUILD_CHUNK_BYTES = 8 << 20
+
+AUDITED_FIELDS = ("status", "rating", "rating_count", "cancel_count", "city")
+
+
+# ----------------------------
+# REDUCER
+# ----------------------------
+def apply_driver_event(drivers: dict, event: dict) -> bool:
+    """
+    Folds one event into {username: driver}. Returns False for events that
+    are not about drivers.
+    """
+    kind = event.get("type", "")
+    if not kind.startswith("driver_"):
+        return False
+    data = event.get("data", {})
+    username = data.get("username")
+    if kind == "driver_registered":
+        drivers[username] = dict(data)
+        return True
+
+    driver = drivers.setdefault(username, {"username": username})
+    if kind == "driver_cancellation_penalty":
+        rating = float(driver.get("rating", 5.0)) - float(data.get("penalty", 0))
+        driver["rating"] = round(max(DRIVER_RATING_MIN, rating), 2)
+        driver["cancel_count"] = int(driver.get("cancel_count", 0)) + 1
+    elif kind == "driver_rated":
+        driver["rating"], driver["rating_count"] = apply_rating(
+            driver.get("rating"), driver.get("rating_count"), data.get("stars", 5)
+        )
+    else:
+        driver.update(data.get("after", {}))
+    return True
+
+
+# ----------------------------
+# MATERIALIZED STATE
+# ----------------------------
+class DriverState:
+    """
+    {username: driver} as of byte `offset` of the event log, plus the last
+    HISTORY_PER_DRIVER events of each driver.
+    """
+
+    def __init__(self, drivers=None, offset=0, history=None):
+        self.drivers = drivers or {}
+        self.offset = offset
+        self.history = history or {}
+        self._since_snapshot = 0
+
+    def apply(self, event):
+        if not apply_driver_event(self.drivers, event):
+            return False
+        username = event["data"].get("username")
+        self.history[username] = (self.history.get(username, []) + [event])[-HISTORY_PER_DRIVER:]
+        self._since_snapshot += 1
+        return True
+
+    def replay(self, max_bytes=None):
+        """
+        Applies the events after `offset` (all of them, in chunks of
+        `max_bytes`). Returns how many driver events were applied.
+        """
+        applied = 0
+        while True:
+            events, new_offset = read_events(self.offset, max_bytes)
+            if new_offset == self.offset:
+                break
+            applied += sum(self.apply(event) for event in events)
+            self.offset = new_offset
+            if max_bytes is None:
+                break
+        return applied
+
+    def to_json(self):
+        return {"offset": self.offset, "drivers": self.drivers, "history": self.history}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data.get("drivers"), data.get("offset", 0), data.get("history"))
+
+    def save(self, path=None):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        path = path or SNAPSHOT_PATH
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_json(), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        self._since_snapshot = 0
+
+    def refresh(self):
+        """
+        Replays new events and writes a snapshot once enough accumulated.
+        """
+        applied = self.replay()
+        if self._since_snapshot >= SNAPSHOT_EVERY:
+            self.save()
+        return applied
+
+
+def _genesis():
+    """
+    Drivers that predate the event log. Taken from the shards the first time
+    and kept, so later rebuilds start from the same point.
+    """
+    if os.path.exists(GENESIS_PATH):
+        return DriverState.from_json(_read_json(GENESIS_PATH) or {})
+    offset = events_end_offset()  # before reading: a racing write is replayed, not lost
+    state = DriverState(
+        {d["username"]: d for d in load_drivers_from_db() if d.get("username")},
+        offset=offset,
+    )
+    state.save(GENESIS_PATH)
+    return state
+
+
+def load_driver_state():
+    """
+    Cold start: latest snapshot (or genesis) + replay of the events after it.
+    """
+    if os.path.exists(SNAPSHOT_PATH):
+        state = DriverState.from_json(_read_json(SNAPSHOT_PATH) or {})
+    else:
+        state = _genesis()
+    state.refresh()
+    return state
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_driver_state():
+    """
+    Process-wide state, loaded once and caught up with the log on every call.
+    """
+    global _state
+    with _state_lock:
+        if _state is None:
+            _state = load_driver_state()
+        else:
+            _state.refresh()
+        return _state
+
+
+def rebuild_driver_state():
+    """
+    Batch job: genesis + the whole log, read in large chunks. Writes a fresh
+    snapshot and returns the state.
+    """
+    state = _genesis()
+    state.replay(max_bytes=REBUILD_CHUNK_BYTES)
+    state.save()
+    return state
+
+
+def audit(state=None):
+    """
+    [(username, field, stored value, replayed value)] where the driver shards
+    disagree with the replayed events.
+    """
+    state = state or load_driver_state()
+    stored = {d.get("username"): d for d in load_drivers_from_db()}
+    diffs = []
+    for username in sorted(set(stored) | set(state.drivers)):
+        a, b = stored.get(username), state.drivers.get(username)
+        if a is None or b is None:
+            diffs.append((username, "*", "present" if a else "missing", "present" if b else "missing"))
+            continue
+        for field in AUDITED_FIELDS:
+            if a.get(field) != b.get(field):
+                diffs.append((username, field, a.get(field), b.get(field)))
+    return diffs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Event-sourced driver state.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("rebuild", help="replay the whole event log and write a snapshot")
+    sub.add_parser("snapshot", help="catch up from the latest snapshot and write a new one")
+    sub.add_parser("audit", help="compare the replayed state with the driver shards")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "rebuild":
+        state = rebuild_driver_state()
+        print(f"{len(state.drivers)} drivers rebuilt in {time.perf_counter() - started:.2f}s")
+    elif args.command == "snapshot":
+        state = load_driver_state()
+        state.save()
+        print(f"snapshot at offset {state.offset} ({len(state.drivers)} drivers)")
+    else:
+        diffs = audit()
+        for username, field, stored, replayed in diffs:
+            print(f"{username}: {field} stored={stored!r} replayed={replayed!r}")
+        print(f"{len(diffs)} differences")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Tailing the change log (data/events.log) written by core/shared.py.
+
+A dashboard builds its aggregates once, remembers the log offset, and from
+then on only reads and applies the events appended after it, on each tick of
+its fragment (`refresh()` never blocks). Command-line tailing waits for new
+events instead (`wait_and_refresh()`), with file-system notifications
+(watchdog) when available, so an idle tail does not re-read anything:
+
+    python events.py              # print events as they are written
+    python events.py --from-start
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+from core.config import ensure_data_dir
+from core.shared import (
+    labels,
+    read_events,
+    events_end_offset,
+    EVENTS_PATH,
+)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional – fall back to stat() checks
+    Observer = None
+
+MONEY_FIELDS = {
+    "price_xof": "gross_xof",
+    "platform_commission_xof": "platform_xof",
+    "driver_earnings_xof": "driver_xof",
+    "cancellation_fee_xof": "cancellation_fees_xof",
+}
+
+
+def _num(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# ----------------------------
+# CHANGE NOTIFICATIONS
+# ----------------------------
+_changed = threading.Condition()
+_observer = None
+
+
+def _start_observer():
+    global _observer
+    if Observer is None or _observer is not None:
+        return
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if os.path.abspath(getattr(event, "src_path", "")) == os.path.abspath(EVENTS_PATH):
+                with _changed:
+                    _changed.notify_all()
+
+    _observer = Observer()
+    _observer.daemon = True
+    _observer.schedule(_Handler(), os.path.dirname(EVENTS_PATH), recursive=False)
+    _observer.start()
+
+
+def wait_for_events(offset: int, timeout: float = 5.0) -> bool:
+    """
+    Blocks until the log grows past `offset` or `timeout` seconds pass.
+    Returns True if there is something new to read.
+    """
+    deadline = time.monotonic() + timeout
+    _start_observer()
+    while events_end_offset() <= offset:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if _observer is not None:
+            with _changed:
+                _changed.wait(remaining)
+        else:
+            time.sleep(min(0.25, remaining))
+    return True
+
+
+# ----------------------------
+# LIVE AGGREGATES
+# ----------------------------
+class LiveAggregates:
+    """
+    Platform-wide counters kept up to date from the event log:
+    drivers (by status), trips (by city / status) and money totals.
+
+    Start from a full load with `LiveAggregates.build()`, then call
+    `refresh()` to apply only the new events (`wait_and_refresh()` blocks
+    until there are some: command-line use only, never in an app run).
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.last_seq = 0
+        self.n_drivers = 0
+        self.drivers_by_status = {}
+        self.n_trips = 0
+        self.trips_by_city = {}
+        self.trips_by_status = {}
+        self.totals = {v: 0.0 for v in MONEY_FIELDS.values()}
+        self.recent = []
+
+    @classmethod
+    def build(cls):
+        """
+        Starts from the shared snapshot. Its offset is the event log offset
+        taken before it was built, so tailing from there never misses a write.
+        """
+        from snapshot import get_snapshot
+
+        snap = get_snapshot()
+        live = cls(offset=snap.offset)
+        drivers = snap.aggregates["drivers"]
+        trips = snap.aggregates["trips"]
+        live.n_drivers = drivers.get("n_drivers", 0)
+        live.drivers_by_status = dict(drivers.get("by_status", {}))
+        live.n_trips = trips.get("n_trips", 0)
+        live.trips_by_city = {k: v["trips_count"] for k, v in trips.get("by_city", {}).items()}
+        live.trips_by_status = dict(trips.get("by_status", {}))
+        for field in MONEY_FIELDS.values():
+            live.totals[field] = trips.get(field, 0.0)
+        return live
+
+    def _bump(self, counter, key, delta):
+        if key is None:
+            return
+        counter[key] = counter.get(key, 0) + delta
+
+    def apply(self, event):
+        kind = event.get("type")
+        data = event.get("data", {})
+        if kind == "trip_booked":
+            self.n_trips += 1
+            self._bump(self.trips_by_city, data.get("city"), 1)
+            self._bump(self.trips_by_status, data.get("status", "scheduled"), 1)
+            for field, total in MONEY_FIELDS.items():
+                self.totals[total] += _num(data.get(field))
+        elif kind in ("trip_updated", "trip_cancelled"):
+            before, after = data.get("before", {}), data.get("after", {})
+            if "status" in after:
+                self._bump(self.trips_by_status, before.get("status"), -1)
+                self._bump(self.trips_by_status, after.get("status"), 1)
+            if "city" in after:
+                self._bump(self.trips_by_city, before.get("city"), -1)
+                self._bump(self.trips_by_city, after.get("city"), 1)
+            for field, total in MONEY_FIELDS.items():
+                if field in after:
+                    self.totals[total] += _num(after.get(field)) - _num(before.get(field))
+        elif kind == "driver_registered":
+            self.n_drivers += 1
+            self._bump(self.drivers_by_status, data.get("status", labels["English"]["status_options"][0]), 1)
+        elif kind in ("driver_status_changed", "driver_rating_changed", "driver_updated"):
+            after = data.get("after", {})
+            if "status" in after:
+                self._bump(self.drivers_by_status, data.get("before", {}).get("status"), -1)
+                self._bump(self.drivers_by_status, after.get("status"), 1)
+        self.last_seq = max(self.last_seq, int(event.get("seq", 0)))
+        self.recent = (self.recent + [event])[-20:]
+
+    def refresh(self):
+        """
+        Applies events appended since the last call. Returns how many.
+        """
+        events, self.offset = read_events(self.offset)
+        for event in events:
+            self.apply(event)
+        return len(events)
+
+    def wait_and_refresh(self, timeout: float = 5.0):
+        if wait_for_events(self.offset, timeout):
+            return self.refresh()
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print change events as they are written.")
+    parser.add_argument("--from-start", action="store_true", help="print the existing events first")
+    args = parser.parse_args(argv)
+
+    ensure_data_dir()  # watched for changes
+    offset = 0 if args.from_start else events_end_offset()
+    while True:
+        if not wait_for_events(offset, timeout=60.0):
+            continue
+        events, offset = read_events(offset)
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Streaming export of drivers and trips to CSV or Parquet.
+
+Timestamps are exported as epoch milliseconds (UTC), as stored.
+Records are read from the city shards in fixed-size chunks and each chunk is
+filtered and appended to the output file, so memory use depends on the chunk
+size, not on the size of the store. Parquet needs `pyarrow`.
+
+Nightly dump from the command line:
+
+    python export.py drivers -o drivers.csv
+    python export.py trips --format parquet -o trips.parquet \\
+        --city Bamako --city Kayes --start 2026-01-01 --end 2026-01-31
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from core.shared import iter_records
+from core.schema import date_range_ms
+
+DRIVER_COLUMNS = {
+    "username": "string",
+    "first_name": "string",
+    "last_name": "string",
+    "age": "Int64",
+    "city": "string",
+    "transport_type": "string",
+    "status": "string",
+    "rating": "float64",
+    "rating_count": "Int64",
+    "cancel_count": "Int64",
+}
+
+TRIP_COLUMNS = {
+    "trip_id": "string",
+    "created_at": "Int64",
+    "scheduled_for": "Int64",
+    "status": "string",
+    "city": "string",
+    "driver_username": "string",
+    "transport_type": "string",
+    "pickup_lat": "float64",
+    "pickup_lon": "float64",
+    "drop_lat": "float64",
+    "drop_lon": "float64",
+    "distance_miles": "float64",
+    "price_xof": "Int64",
+    "price_before_discount_xof": "Int64",
+    "discount_xof": "Int64",
+    "promo_code": "string",
+    "referral_code": "string",
+    "platform_pct": "Int64",
+    "driver_pct": "Int64",
+    "platform_commission_xof": "Int64",
+    "driver_earnings_xof": "Int64",
+    "cancellation_fee_xof": "Int64",
+    "cancellation_reason": "string",
+    "routing_provider": "string",
+    "route_summary": "string",
+    "client_app": "string",
+}
+
+FORMATS = ["csv", "parquet"]
+
+
+def _typed_chunk(records, columns):
+    """
+    Fixed columns and dtypes, so every chunk has the same schema.
+    """
+    df = pd.DataFrame.from_records(records)
+    out = pd.DataFrame(index=df.index)
+    for col, dtype in columns.items():
+        values = df[col] if col in df.columns else pd.Series(None, index=df.index)
+        out[col] = values.astype(dtype)
+    return out
+
+
+def filter_trips(df, cities=None, start_date=None, end_date=None, providers=None):
+    """
+    Same filters as the admin dashboard: city, created_at date range
+    (inclusive) and routing provider.
+    """
+    if cities:
+        df = df[df["city"].isin(list(cities))]
+    if providers:
+        df = df[df["routing_provider"].isin(list(providers))]
+    start_ms, end_ms = date_range_ms(start_date, end_date)
+    if start_ms is not None:
+        df = df[df["created_at"] >= start_ms]
+    if end_ms is not None:
+        df = df[df["created_at"] < end_ms]
+    return df
+
+
+class _Writer:
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.rows = 0
+        self._parquet = None
+        if fmt == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a", header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.path, table.schema)
+            self._parquet.write_table(table)
+        self.rows += len(df)
+
+    def close(self, columns):
+        if self.rows == 0:
+            self.write(_typed_chunk([], columns))  # header / schema only
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def export_drivers(path, fmt="csv", cities=None, chunk_size=10_000):
+    """
+    Writes all drivers (optionally only some cities) and returns the row count.
+    """
+    writer = _Writer(path, fmt)
+    for chunk in iter_records("drivers", cities, chunk_size):
+        writer.write(_typed_chunk(chunk, DRIVER_COLUMNS))
+    writer.close(DRIVER_COLUMNS)
+    return writer.rows
+
+
+def export_trips(path, fmt="csv", cities=None, start_date=None, end_date=None, providers=None,
+                 chunk_size=10_000):
+    """
+    Writes the trips matching the admin filters and returns the row count.
+    Only the shards of the selected cities are read.
+    """
+    writer = _Writer(path, fmt)
+    for chunk in iter_records("trips", cities or None, chunk_size):
+        df = filter_trips(_typed_chunk(chunk, TRIP_COLUMNS), cities, start_date, end_date, providers)
+        if not df.empty:
+            writer.write(df)
+    writer.close(TRIP_COLUMNS)
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export drivers or trips to CSV/Parquet.")
+    parser.add_argument("table", choices=["drivers", "trips"])
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--format", choices=FORMATS, default=None,
+                        help="defaults to the output file extension")
+    parser.add_argument("--city", action="append", help="repeatable")
+    parser.add_argument("--start", help="created_at from (YYYY-MM-DD), trips only")
+    parser.add_argument("--end", help="created_at until (YYYY-MM-DD), trips only")
+    parser.add_argument("--provider", action="append", help="routing provider, trips only")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "csv")
+    started = time.perf_counter()
+    if args.table == "drivers":
+        rows = export_drivers(args.output, fmt, args.city, args.chunk_size)
+    else:
+        rows = export_trips(args.output, fmt, args.city, args.start, args.end, args.provider, args.chunk_size)
+    print(f"{rows} {args.table} written to {args.output} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
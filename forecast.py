@@ -0,0 +1,316 @@
+"""
+Demand forecasts per city and pickup neighborhood, by hour, for supply
+planning.
+
+Model (per series, additive): trips in an hour = level + profile[hour of
+week]. Days are folded in one at a time: the level follows the
+deseasonalized hourly mean with smoothing ALPHA, the profile of that day's
+24 hours with smoothing GAMMA. The first week initializes the profile.
+Every step is one numpy operation over all series at once (total, each city,
+each city/neighborhood), so a fit loops over days, not over series.
+
+Only complete UTC days are fitted. The fitted state is stored with the
+forecasts in data/forecasts.json, so a refit only folds in the days that
+completed since the last one; it starts over when the series set changed or
+trips were added to already fitted days (bulk import). Each fit also keeps
+the one-day-ahead error of the last BACKTEST_DAYS days per series.
+
+The dashboards only read the stored file. The job worker refits hourly
+(jobs.py), or by hand:
+
+    python forecast.py fit [--full]
+    python forecast.py show --city Bamako [--neighborhood "ACI 2000"]
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from core.shared import DATA_DIR, _read_json, _write_json
+from core.schema import DAY_MS, from_epoch_ms, now_ms
+
+FORECAST_PATH = os.path.join(DATA_DIR, "forecasts.json")
+
+ALPHA = 0.1  # level smoothing, per day
+GAMMA = 0.2  # hour-of-week profile smoothing, per week
+HORIZON_DAYS = 14
+BACKTEST_DAYS = 28
+FIT_CHUNK_DAYS = 56
+HOUR_MS = 3_600_000
+HOURS_PER_WEEK = 168
+
+# 1970-01-01 was a Thursday: day number -> weekday with Monday = 0
+_EPOCH_WEEKDAY = 3
+
+
+def series_key(city=None, neighborhood=None):
+    """
+    "" for all cities, "Bamako", or "Bamako/ACI 2000".
+    """
+    if not city:
+        return ""
+    return f"{city}/{neighborhood}" if neighborhood else city
+
+
+def _weekday(day):
+    return (day + _EPOCH_WEEKDAY) % 7
+
+
+# ----------------------------
+# HOURLY COUNTS
+# ----------------------------
+def _series(snap):
+    """
+    (series keys, per-trip series rows): every trip counts in the total, in
+    its city and, when known, in its city/neighborhood.
+    """
+    cities = snap.categories("city")
+    neighborhoods = snap.categories("pickup_neighborhood")
+    city = snap.column("city").astype(np.int64)
+    neighborhood = snap.column("pickup_neighborhood").astype(np.int64)
+
+    city_ids = [i for i, name in enumerate(cities) if name]
+    city_row = np.full(len(cities), -1, np.int64)
+    city_row[city_ids] = np.arange(1, len(city_ids) + 1)
+
+    has_pair = (city_row[city] >= 0) & (neighborhood != snap.code_of("pickup_neighborhood", ""))
+    pair = city * len(neighborhoods) + neighborhood
+    pairs, pair_inverse = np.unique(pair[has_pair], return_inverse=True)
+    pair_row = np.full(len(city), -1, np.int64)
+    pair_row[has_pair] = 1 + len(city_ids) + pair_inverse
+
+    keys = [""] + [cities[i] for i in city_ids] + [
+        series_key(cities[p // len(neighborhoods)], neighborhoods[p % len(neighborhoods)]) for p in pairs.tolist()
+    ]
+    return keys, city_row[city], pair_row
+
+
+def _hourly_counts(snap, n_series, city_row, pair_row, start_day, end_day):
+    """
+    [n_series, 24 * days] trip counts per hour for days [start_day, end_day).
+    """
+    n_hours = (end_day - start_day) * 24
+    created = snap.column("created_at")
+    mask = (created >= start_day * DAY_MS) & (created < end_day * DAY_MS)
+    hours = (created[mask] - start_day * DAY_MS) // HOUR_MS
+    counts = np.zeros((n_series, n_hours))
+    counts[0] = np.bincount(hours, minlength=n_hours)
+    for rows in (city_row[mask], pair_row[mask]):
+        known = rows >= 0
+        flat = np.bincount(rows[known] * n_hours + hours[known], minlength=n_series * n_hours)
+        counts += flat.reshape(n_series, n_hours)
+    return counts
+
+
+# ----------------------------
+# FIT
+# ----------------------------
+def _fold_days(state, counts, first_day):
+    """
+    Folds consecutive days of hourly counts into the state, in place.
+    """
+    level, profile = state["level"], state["profile"]
+    errors, pos = state["errors"], state["error_pos"]
+    for d in range(counts.shape[1] // 24):
+        day = first_day + d
+        hrs = slice(_weekday(day) * 24, _weekday(day) * 24 + 24)
+        observed = counts[:, d * 24:(d + 1) * 24]
+        if state["days"] < 7:
+            # first week: the profile starts from the observed hours
+            if state["days"] == 0:
+                level[:] = observed.mean(axis=1)
+            profile[:, hrs] = observed - level[:, None]
+        else:
+            predicted = np.maximum(level[:, None] + profile[:, hrs], 0).sum(axis=1)
+            errors[:, pos] = np.abs(predicted - observed.sum(axis=1))
+            pos = (pos + 1) % BACKTEST_DAYS
+            level[:] = ALPHA * (observed - profile[:, hrs]).mean(axis=1) + (1 - ALPHA) * level
+            profile[:, hrs] = GAMMA * (observed - level[:, None]) + (1 - GAMMA) * profile[:, hrs]
+        state["days"] += 1
+    state["error_pos"] = pos
+
+
+def _empty_state(keys, start_day):
+    n = len(keys)
+    return {
+        "series": keys,
+        "start_day": start_day,
+        "days": 0,
+        "level": np.zeros(n),
+        "profile": np.zeros((n, HOURS_PER_WEEK)),
+        "errors": np.full((n, BACKTEST_DAYS), np.nan),
+        "error_pos": 0,
+    }
+
+
+def _forecast_values(state, first_day, days=HORIZON_DAYS):
+    """
+    [n_series, 24 * days] forecast trips per hour from day `first_day` on.
+    """
+    how = np.array([_weekday(first_day + h // 24) * 24 + h % 24 for h in range(days * 24)])
+    return np.maximum(state["level"][:, None] + state["profile"][:, how], 0)
+
+
+def _to_file(state, next_day, n_trips):
+    with np.errstate(invalid="ignore"):
+        mae = np.nanmean(state["errors"], axis=1) if state["days"] > 7 else np.full(len(state["series"]), np.nan)
+    return {
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "alpha": ALPHA,
+        "gamma": GAMMA,
+        "next_day": next_day,
+        "n_trips": n_trips,
+        "state": {
+            "series": state["series"],
+            "start_day": state["start_day"],
+            "days": state["days"],
+            "level": state["level"].tolist(),
+            "profile": state["profile"].round(4).tolist(),
+            "errors": np.where(np.isnan(state["errors"]), -1, state["errors"]).round(2).tolist(),
+            "error_pos": state["error_pos"],
+        },
+        "mae_daily": {k: (None if np.isnan(v) else round(float(v), 2)) for k, v in zip(state["series"], mae)},
+        "forecast": {
+            "start_ms": next_day * DAY_MS,
+            "values": _forecast_values(state, next_day).round(2).tolist(),
+        },
+    }
+
+
+def _from_file(data):
+    s = data["state"]
+    errors = np.array(s["errors"], dtype=np.float64).reshape(len(s["series"]), BACKTEST_DAYS)
+    return {
+        "series": s["series"],
+        "start_day": s["start_day"],
+        "days": s["days"],
+        "level": np.array(s["level"], dtype=np.float64),
+        "profile": np.array(s["profile"], dtype=np.float64).reshape(len(s["series"]), HOURS_PER_WEEK),
+        "errors": np.where(errors < 0, np.nan, errors),
+        "error_pos": s["error_pos"],
+    }
+
+
+def fit(full=False, now=None):
+    """
+    Folds the complete days not fitted yet into the stored state (all of
+    history when `full`, or when it has to start over) and writes new
+    forecasts. Returns the number of days folded in.
+    """
+    from snapshot import get_snapshot
+
+    snap = get_snapshot()
+    today = int((now or now_ms()) // DAY_MS)
+    created = snap.column("created_at")
+    created = created[created >= 0]
+    if not len(created):
+        return 0
+    keys, city_row, pair_row = _series(snap)
+    n_trips = int((created < today * DAY_MS).sum())
+
+    stored = _read_json(FORECAST_PATH) or {}
+    state = None
+    if not full and stored.get("state", {}).get("series") == keys \
+            and (stored.get("alpha"), stored.get("gamma")) == (ALPHA, GAMMA):
+        fitted_trips = int((created < stored["next_day"] * DAY_MS).sum())
+        if fitted_trips == stored["n_trips"]:
+            state, start = _from_file(stored), stored["next_day"]
+    if state is None:
+        start = int(created.min() // DAY_MS)
+        state = _empty_state(keys, start)
+
+    if start < today:
+        # a few weeks of hourly counts at a time, whatever the history length
+        for first in range(start, today, FIT_CHUNK_DAYS):
+            last = min(first + FIT_CHUNK_DAYS, today)
+            _fold_days(state, _hourly_counts(snap, len(keys), city_row, pair_row, first, last), first)
+    elif stored and state["days"]:
+        return 0  # nothing completed since the last fit
+    _write_json(FORECAST_PATH, _to_file(state, max(start, today), n_trips))
+    return max(0, today - start)
+
+
+# ----------------------------
+# READ
+# ----------------------------
+_loaded = (None, None)  # (file stamp, contents)
+
+
+def load_forecasts():
+    """
+    Stored forecasts ({} before the first fit), reread only when the file
+    changes.
+    """
+    global _loaded
+    try:
+        st = os.stat(FORECAST_PATH)
+        stamp = st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return {}
+    if _loaded[0] != stamp:
+        _loaded = (stamp, _read_json(FORECAST_PATH) or {})
+    return _loaded[1]
+
+
+def forecast_frame(city=None, neighborhood=None, by="day"):
+    """
+    Forecast trips of a series per day (`date_only`, like the aggregates) or
+    per hour (`hour`, naive UTC datetimes). Empty if there is no forecast.
+    """
+    data = load_forecasts()
+    key = series_key(city, neighborhood)
+    series = data.get("state", {}).get("series", [])
+    if key not in series:
+        return pd.DataFrame(columns=["date_only" if by == "day" else "hour", "forecast_trips"])
+    values = np.asarray(data["forecast"]["values"][series.index(key)])
+    start_ms = data["forecast"]["start_ms"]
+    if by == "hour":
+        hours = [from_epoch_ms(start_ms + h * HOUR_MS) for h in range(len(values))]
+        return pd.DataFrame({"hour": hours, "forecast_trips": values})
+    days = values.reshape(-1, 24).sum(axis=1)
+    labels = [from_epoch_ms(start_ms + d * DAY_MS).date().isoformat() for d in range(len(days))]
+    return pd.DataFrame({"date_only": labels, "forecast_trips": days.round(1)})
+
+
+def with_forecast(daily, city=None, neighborhood=None, column="trips_count"):
+    """
+    History (`date_only`, `column`) followed by the forecast days, indexed by
+    date, for a line chart with both.
+    """
+    history = daily.set_index("date_only")[[column]]
+    forecast = forecast_frame(city, neighborhood).set_index("date_only")
+    return history.join(forecast, how="outer").sort_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hourly demand forecasts per city and neighborhood.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fit_cmd = sub.add_parser("fit", help="fold in the days completed since the last fit")
+    fit_cmd.add_argument("--full", action="store_true", help="refit all of history")
+    show = sub.add_parser("show", help="print a series' daily forecast")
+    show.add_argument("--city")
+    show.add_argument("--neighborhood")
+    args = parser.parse_args(argv)
+
+    if args.command == "fit":
+        started = time.perf_counter()
+        days = fit(full=args.full)
+        data = load_forecasts()
+        n_series = len(data.get("state", {}).get("series", []))
+        print(f"{days} day(s) fitted for {n_series} series in {time.perf_counter() - started:.2f}s")
+    elif args.command == "show":
+        df = forecast_frame(args.city, args.neighborhood)
+        if df.empty:
+            print("no forecast for this series – run `python forecast.py fit`")
+            return
+        print(df.to_string(index=False))
+        mae = load_forecasts().get("mae_daily", {}).get(series_key(args.city, args.neighborhood))
+        if mae is not None:
+            print(f"mean absolute error of one-day-ahead totals, last {BACKTEST_DAYS} days: {mae}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+City and neighborhood from coordinates.
+
+Polygons come from geofences.geojson (a GeoJSON FeatureCollection; each
+feature has `kind` "city" or "neighborhood", a `name`, and for neighborhoods
+the `city` they belong to). Polygons may have holes and be MultiPolygons;
+insideness is the even-odd rule over all rings of a part.
+
+Single lookups (booking time) walk a bounding-box tree: the polygon parts are
+split in halves along the longer side of their boxes, recursively, and each
+node keeps the box around its children, so a point only reaches the few
+parts whose box contains it before the exact ray-casting test.
+
+Bulk labeling (the trip history) tests every part against all points at
+once with numpy: a box filter, then one vectorized crossing count per edge.
+
+    python geofence.py label --dry-run     # relabel stored trips from their coordinates
+    python geofence.py lookup 12.64 -8.00  # city / neighborhood of one point
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+GEOFENCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geofences.geojson")
+
+KINDS = ("city", "neighborhood")
+LEAF_SIZE = 4
+
+
+def _rings_inside(rings, lat, lon):
+    """
+    Even-odd test of one point against a polygon part given as rings of
+    (lon, lat) vertices.
+    """
+    inside = False
+    for ring in rings:
+        x0, y0 = ring[-1]
+        for x1, y1 in ring:
+            if (y1 > lat) != (y0 > lat) and lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0):
+                inside = not inside
+            x0, y0 = x1, y1
+    return inside
+
+
+def _rings_inside_vec(rings, lat, lon):
+    """
+    _rings_inside over arrays of points.
+    """
+    inside = np.zeros(len(lat), dtype=bool)
+    for ring in rings:
+        xs, ys = ring[:, 0], ring[:, 1]
+        x0s, y0s = np.roll(xs, 1), np.roll(ys, 1)
+        for x0, y0, x1, y1 in zip(x0s.tolist(), y0s.tolist(), xs.tolist(), ys.tolist()):
+            if y0 == y1:
+                continue  # horizontal edges never cross the ray
+            crosses = ((y1 > lat) != (y0 > lat)) & (lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0))
+            inside ^= crosses
+    return inside
+
+
+class _Part:
+    __slots__ = ("kind", "name", "city", "rings", "arrays", "box")
+
+    def __init__(self, kind, name, city, rings):
+        self.kind = kind
+        self.name = name
+        self.city = city
+        self.rings = [[(float(x), float(y)) for x, y in ring] for ring in rings]
+        self.arrays = [np.asarray(ring, dtype=np.float64) for ring in self.rings]
+        xs = [x for ring in self.rings for x, _ in ring]
+        ys = [y for ring in self.rings for _, y in ring]
+        self.box = (min(ys), min(xs), max(ys), max(xs))  # south, west, north, east
+
+
+def _box_around(boxes):
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _in_box(box, lat, lon):
+    return box[0] <= lat <= box[2] and box[1] <= lon <= box[3]
+
+
+def _build_tree(parts):
+    """
+    (box, children, parts): inner nodes have two children, leaves up to
+    LEAF_SIZE parts.
+    """
+    box = _box_around([p.box for p in parts])
+    if len(parts) <= LEAF_SIZE:
+        return box, (), parts
+    if box[2] - box[0] >= box[3] - box[1]:
+        parts = sorted(parts, key=lambda p: p.box[0] + p.box[2])
+    else:
+        parts = sorted(parts, key=lambda p: p.box[1] + p.box[3])
+    mid = len(parts) // 2
+    return box, (_build_tree(parts[:mid]), _build_tree(parts[mid:])), ()
+
+
+class GeofenceIndex:
+    """
+    Polygon parts per kind, each in its own bounding-box tree.
+    """
+
+    def __init__(self, features):
+        self.parts = {kind: [] for kind in KINDS}
+        for feature in features:
+            props = feature.get("properties") or {}
+            kind = props.get("kind")
+            if kind not in self.parts:
+                continue
+            geometry = feature.get("geometry") or {}
+            polygons = geometry.get("coordinates") or []
+            if geometry.get("type") == "Polygon":
+                polygons = [polygons]
+            for rings in polygons:
+                self.parts[kind].append(_Part(kind, props.get("name", ""), props.get("city", ""), rings))
+        self.trees = {kind: _build_tree(parts) for kind, parts in self.parts.items() if parts}
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or GEOFENCES_PATH, encoding="utf-8") as f:
+            return cls(json.load(f).get("features", []))
+
+    def _find(self, kind, lat, lon):
+        node = self.trees.get(kind)
+        stack = [node] if node is not None and _in_box(node[0], lat, lon) else []
+        while stack:
+            _, children, parts = stack.pop()
+            for part in parts:
+                if _in_box(part.box, lat, lon) and _rings_inside(part.rings, lat, lon):
+                    return part
+            stack.extend(c for c in children if _in_box(c[0], lat, lon))
+        return None
+
+    def lookup(self, lat, lon):
+        """
+        (city, neighborhood) of a point; "" where no polygon contains it.
+        """
+        if lat is None or lon is None:
+            return "", ""
+        lat, lon = float(lat), float(lon)
+        city = self._find("city", lat, lon)
+        neighborhood = self._find("neighborhood", lat, lon)
+        city_name = city.name if city else (neighborhood.city if neighborhood else "")
+        return city_name, neighborhood.name if neighborhood else ""
+
+    def label(self, lat, lon):
+        """
+        Vectorized lookup: (city, neighborhood) object arrays for arrays of
+        coordinates. NaN coordinates get "".
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        out = {}
+        for kind in KINDS:
+            labels = np.full(len(lat), "", dtype=object)
+            parent = np.full(len(lat), "", dtype=object)
+            todo = ~(np.isnan(lat) | np.isnan(lon))
+            for part in self.parts[kind]:
+                s, w, n, e = part.box
+                cand = np.flatnonzero(todo & (lat >= s) & (lat <= n) & (lon >= w) & (lon <= e))
+                if not len(cand):
+                    continue
+                hit = cand[_rings_inside_vec(part.arrays, lat[cand], lon[cand])]
+                labels[hit] = part.name
+                parent[hit] = part.city
+                todo[hit] = False  # a point keeps the first polygon that contains it
+            out[kind] = (labels, parent)
+        city, _ = out["city"]
+        neighborhood, neighborhood_city = out["neighborhood"]
+        city = np.where(city == "", neighborhood_city, city)
+        return city, neighborhood
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_geofences():
+    """
+    Process-wide index, loaded once.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = GeofenceIndex.load()
+        return _index
+
+
+# ----------------------------
+# TRIP HISTORY
+# ----------------------------
+_COORD_FIELDS = ("pickup_lat", "pickup_lon", "drop_lat", "drop_lon")
+
+
+def _if_not_moved(trip, fields):
+    # update_trips_in_db() callback: labels computed from these coordinates
+    coords = [trip.get(f) for f in _COORD_FIELDS]
+
+    def update(current):
+        return fields if [current.get(f) for f in _COORD_FIELDS] == coords else None
+    return update
+
+
+def label_trips(dry_run=False):
+    """
+    Sets city / pickup_neighborhood / drop_city / drop_neighborhood of every
+    stored trip from its coordinates, where they differ. A field whose point
+    is outside every polygon keeps its stored value. Updates are keyed by trip_id and
+    skipped for a trip whose coordinates changed since they were labeled;
+    city changes move the trip and are logged like any trip update. Returns
+    the number of trips changed.
+    """
+    from core.shared import read_shard, shard_paths, update_trips_in_db
+
+    index = get_geofences()
+    updates = {}
+    for _, path in shard_paths("trips"):
+        trips = read_shard(path)
+        coords = np.array(
+            [[t.get("pickup_lat"), t.get("pickup_lon"), t.get("drop_lat"), t.get("drop_lon")] for t in trips],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        pickup_city, pickup_neigh = index.label(coords[:, 0], coords[:, 1])
+        drop_city, drop_neigh = index.label(coords[:, 2], coords[:, 3])
+        for i, trip in enumerate(trips):
+            labeled = {
+                "city": pickup_city[i],
+                "pickup_neighborhood": pickup_neigh[i],
+                "drop_city": drop_city[i],
+                "drop_neighborhood": drop_neigh[i],
+            }
+            fields = {k: v for k, v in labeled.items() if v}
+            changed = {k: v for k, v in fields.items() if trip.get(k) != v}
+            if changed:
+                updates[trip.get("trip_id")] = _if_not_moved(trip, changed)
+    if not dry_run:
+        update_trips_in_db(updates)
+    return len(updates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Geofences: city and neighborhood from coordinates.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    label = sub.add_parser("label", help="relabel stored trips from their coordinates")
+    label.add_argument("--dry-run", action="store_true")
+    lookup = sub.add_parser("lookup", help="city and neighborhood of one point")
+    lookup.add_argument("lat", type=float)
+    lookup.add_argument("lon", type=float)
+    args = parser.parse_args(argv)
+
+    if args.command == "label":
+        started = time.perf_counter()
+        n = label_trips(args.dry_run)
+        action = "would change" if args.dry_run else "changed"
+        print(f"{n} trips {action} in {time.perf_counter() - started:.2f}s")
+    elif args.command == "lookup":
+        city, neighborhood = get_geofences().lookup(args.lat, args.lon)
+        print(f"{city or '-'} / {neighborhood or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,23 @@
 import streamlit as st
 import pandas as pd
 
-from shared import (
+from core.shared import (
+    events_end_offset,
     load_drivers_from_db,
-    load_trips_from_db,
+    query_trips,
+    with_datetimes,
+    COMMISSION_TIERS,
 )
+from aggregation import group_frame
+from forecast import with_forecast
+from events import LiveAggregates
+from snapshot import get_snapshot
+from demand_grid import get_demand_grid, DAY_NAMES, FINE_RESOLUTION
+from commission_sim import check_tiers, compare_tiers, tier_mix
+from leaderboard import get_leaderboard, PERIODS, PERIOD_LABELS, METRICS, METRIC_LABELS
+from lazy_views import cached, compute, view_tabs
+
+LIVE_REFRESH_SECONDS = 5
 
 
 st.set_page_config(page_title="Mali Ride – Investor Overview", layout="wide")
@@ -16,62 +29,66 @@ st.caption(
     "This view is designed for investor demos and strategic partners."
 )
 
-drivers = load_drivers_from_db()
-trips = load_trips_from_db()
-df_trips = pd.DataFrame(trips) if trips else pd.DataFrame()
-
-if not df_trips.empty and "created_at" in df_trips.columns:
-    df_trips["created_at"] = pd.to_datetime(df_trips["created_at"], errors="coerce")
-    df_trips["date_only"] = df_trips["created_at"].dt.date
+# Cross-city KPIs, precomputed once per store version in the shared snapshot
+snap = get_snapshot(stale_ok=True)
+kpis = snap.aggregates["trips"]
+n_trips = kpis.get("n_trips", 0)
 
 st.markdown("## 📊 Key KPIs")
 
-col1, col2, col3, col4 = st.columns(4)
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def key_kpis():
+    # Headline numbers follow the event log instead of reloading the store;
+    # run_every paces the updates, so this never waits for events
+    live = st.session_state.get("live_aggregates")
+    if live is None:
+        live = st.session_state["live_aggregates"] = LiveAggregates.build()
+    else:
+        live.refresh()
 
-n_drivers = len(drivers)
-n_trips = len(df_trips) if not df_trips.empty else 0
-total_gmv = float(df_trips.get("price_xof", pd.Series([0]*len(df_trips))).sum()) if not df_trips.empty else 0.0
-total_platform = float(df_trips.get("platform_commission_xof", pd.Series([0]*len(df_trips))).sum()) if not df_trips.empty else 0.0
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Active drivers (registered)", live.n_drivers)
+    with col2:
+        st.metric("Total trips (lifetime)", live.n_trips)
+    with col3:
+        st.metric("Gross fares (XOF)", f"{live.totals['gross_xof']:,.0f}")
+    with col4:
+        st.metric("Platform revenue (XOF)", f"{live.totals['platform_xof']:,.0f}")
 
-with col1:
-    st.metric("Active drivers (registered)", n_drivers)
-with col2:
-    st.metric("Total trips (lifetime)", n_trips)
-with col3:
-    st.metric("Gross fares (XOF)", f"{total_gmv:,.0f}")
-with col4:
-    st.metric("Platform revenue (XOF)", f"{total_platform:,.0f}")
+key_kpis()
 
 st.markdown("---")
 
-tab_overview, tab_drivers, tab_trips, tab_promos, tab_mobile = st.tabs(
-    ["Overview", "Drivers", "Trips & cancellations", "Promos & referrals", "Mobile usage"]
+# Only the selected view is built on a rerun
+TAB_OVERVIEW, TAB_DRIVERS, TAB_TRIPS, TAB_PROMOS, TAB_MOBILE, TAB_DEMAND, TAB_TIERS = (
+    "Overview", "Drivers", "Trips & cancellations", "Promos & referrals", "Mobile usage", "Demand map",
+    "Commission what-if",
+)
+view = view_tabs(
+    [TAB_OVERVIEW, TAB_DRIVERS, TAB_TRIPS, TAB_PROMOS, TAB_MOBILE, TAB_DEMAND, TAB_TIERS], key="investor_view"
 )
 
 # ----------------------------
 # OVERVIEW TAB
 # ----------------------------
-with tab_overview:
+if view == TAB_OVERVIEW:
     st.markdown("### 📅 Volume over time")
 
-    if not df_trips.empty and "date_only" in df_trips.columns:
-        daily = df_trips.groupby("date_only").agg(
-            trips_count=("price_xof", "count"),
-            revenue_xof=("price_xof", "sum"),
-            platform_xof=("platform_commission_xof", "sum"),
-        ).reset_index()
+    if kpis.get("by_day"):
+        daily = group_frame(kpis["by_day"], "date_only")
 
         c1, c2 = st.columns(2)
         with c1:
-            st.markdown("**Trips per day**")
-            st.line_chart(daily.set_index("date_only")["trips_count"])
+            st.markdown("**Trips per day** (next days: forecast)")
+            st.line_chart(with_forecast(daily))
         with c2:
             st.markdown("**Gross fares per day (XOF)**")
             st.line_chart(daily.set_index("date_only")["revenue_xof"])
 
         st.markdown("### 🌍 City mix")
-        if "city" in df_trips.columns:
-            city_group = df_trips.dropna(subset=["city"]).groupby("city").size().reset_index(name="trips_count")
+        if kpis.get("by_city"):
+            city_group = group_frame(kpis["by_city"], "city")[["city", "trips_count"]]
             st.dataframe(city_group)
             st.bar_chart(city_group.set_index("city")["trips_count"])
     else:
@@ -80,9 +97,13 @@ with tab_overview:
 # ----------------------------
 # DRIVERS TAB
 # ----------------------------
-with tab_drivers:
+if view == TAB_DRIVERS:
     st.markdown("### 🚖 Driver performance & ratings")
 
+    # the driver table and the leaderboard do not depend on each other; the
+    # snapshot version only follows trips, so key them on the whole log
+    data = compute({"drivers": load_drivers_from_db, "leaderboard": get_leaderboard}, events_end_offset())
+    drivers = data["drivers"]
     if drivers:
         df_dr = pd.DataFrame(drivers)
         pref = ["username", "first_name", "last_name", "city", "transport_type", "rating", "cancel_count"]
@@ -91,64 +112,46 @@ with tab_drivers:
     else:
         st.info("No drivers registered.")
 
-    if not df_trips.empty and "driver_username" in df_trips.columns:
-        df_d = df_trips.copy()
-        agg = df_d.groupby("driver_username").agg(
-            trips_count=("price_xof", "count"),
-            total_revenue_xof=("price_xof", "sum"),
-            driver_earnings_xof=("driver_earnings_xof", "sum")
-            if "driver_earnings_xof" in df_d.columns
-            else ("price_xof", "sum"),
-        ).reset_index()
-
-        if drivers:
-            df_dr = pd.DataFrame(drivers)
-            join_cols = ["username", "first_name", "last_name", "city", "transport_type", "rating", "cancel_count"]
-            join_cols = [c for c in join_cols if c in df_dr.columns]
-            df_info = df_dr[join_cols].copy()
-            agg = agg.merge(df_info, how="left", left_on="driver_username", right_on="username")
-
-            agg["driver_name"] = agg.apply(
-                lambda r: f"{r.get('first_name', '')} {r.get('last_name', '')}".strip()
-                if (pd.notna(r.get('first_name', '')) or pd.notna(r.get('last_name', '')))
-                else r["driver_username"],
-                axis=1
-            )
-        else:
-            agg["driver_name"] = agg["driver_username"]
-
-        agg = agg.sort_values("driver_earnings_xof", ascending=False)
+    if kpis.get("by_driver"):
+        board = data["leaderboard"]
+        c1, c2, c3 = st.columns(3)
+        with c1:
+            period = st.selectbox("Period", PERIODS, format_func=PERIOD_LABELS.get, key="inv_top_period")
+        with c2:
+            metric = st.selectbox("Rank by", METRICS, format_func=METRIC_LABELS.get, key="inv_top_metric")
+        with c3:
+            city = st.selectbox("City", ["All cities"] + sorted(c for c in board.rating_boards if c), key="inv_top_city")
 
-        st.markdown("**Top drivers by earnings**")
+        st.markdown(f"**Top drivers by {METRIC_LABELS[metric].lower()}**")
         top_n = st.slider("Top N drivers", 3, 50, 10, key="inv_top_driver")
-        top_drivers = agg.head(top_n)
+        top_drivers = board.top(metric, top_n, period=period, city=None if city == "All cities" else city)
         st.dataframe(top_drivers)
 
-        st.markdown("**Revenue by driver (XOF)**")
-        st.bar_chart(top_drivers.set_index("driver_name")["driver_earnings_xof"])
+        if len(top_drivers):
+            st.markdown(f"**{METRIC_LABELS[metric]} by driver**")
+            st.bar_chart(top_drivers.set_index("driver_name")[metric])
     else:
         st.info("No driver-level trips yet.")
 
 # ----------------------------
 # TRIPS & CANCELLATIONS TAB
 # ----------------------------
-with tab_trips:
+if view == TAB_TRIPS:
     st.markdown("### 🚕 Trip mix & cancellation behavior")
 
-    if not df_trips.empty:
+    if n_trips:
         st.markdown("**Trips snapshot**")
-        st.dataframe(df_trips)
+        st.dataframe(cached("all_trips", snap.version, lambda: with_datetimes(query_trips().frame())))
 
-        if "status" in df_trips.columns:
-            cancel_stats = df_trips["status"].value_counts().reset_index()
-            cancel_stats.columns = ["status", "count"]
+        if kpis.get("by_status"):
+            cancel_stats = group_frame(kpis["by_status"], "status").sort_values("count", ascending=False)
 
             st.markdown("**Trips by status (including cancellations)**")
             st.dataframe(cancel_stats)
             st.bar_chart(cancel_stats.set_index("status")["count"])
 
-        if "cancellation_fee_xof" in df_trips.columns:
-            total_cancel_fees = float(df_trips["cancellation_fee_xof"].fillna(0).sum())
+        if kpis.get("cancellation_fees_xof") is not None:
+            total_cancel_fees = kpis["cancellation_fees_xof"]
             st.metric("Total cancellation fees (XOF)", f"{total_cancel_fees:,.0f}")
     else:
         st.info("No trips yet.")
@@ -156,82 +159,134 @@ with tab_trips:
 # ----------------------------
 # PROMOS & REFERRALS TAB
 # ----------------------------
-with tab_promos:
+if view == TAB_PROMOS:
     st.markdown("### 💸 Promotions & referral engine")
 
-    if not df_trips.empty:
-        if "promo_code" in df_trips.columns:
-            df_promo = df_trips.copy()
-            df_promo = df_promo[df_promo["promo_code"].notna() & (df_promo["promo_code"] != "")]
-            if not df_promo.empty:
-                promo_group = df_promo.groupby("promo_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_gross_before_xof=("price_before_discount_xof", "sum")
-                    if "price_before_discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_discount_xof=("discount_xof", "sum")
-                    if "discount_xof" in df_promo.columns
-                    else ("price_xof", "sum"),
-                    total_net_xof=("price_xof", "sum"),
-                ).reset_index()
-                promo_group["avg_discount_per_trip_xof"] = (
-                    promo_group["total_discount_xof"] / promo_group["trips_count"]
-                ).round(2)
-
-                st.markdown("**Promo performance**")
-                st.dataframe(promo_group)
-
-                c1, c2 = st.columns(2)
-                with c1:
-                    st.markdown("Trips by promo code")
-                    st.bar_chart(promo_group.set_index("promo_code")["trips_count"])
-                with c2:
-                    st.markdown("Total discount by promo code (XOF)")
-                    st.bar_chart(promo_group.set_index("promo_code")["total_discount_xof"])
-            else:
-                st.info("No promo codes used yet.")
+    if n_trips:
+        if kpis.get("by_promo"):
+            promo_group = group_frame(kpis["by_promo"], "promo_code")
+
+            st.markdown("**Promo performance**")
+            st.dataframe(promo_group)
+
+            c1, c2 = st.columns(2)
+            with c1:
+                st.markdown("Trips by promo code")
+                st.bar_chart(promo_group.set_index("promo_code")["trips_count"])
+            with c2:
+                st.markdown("Total discount by promo code (XOF)")
+                st.bar_chart(promo_group.set_index("promo_code")["total_discount_xof"])
         else:
-            st.info("Promo code field not available in trips.")
+            st.info("No promo codes used yet.")
 
         st.markdown("---")
 
-        if "referral_code" in df_trips.columns:
-            df_ref = df_trips.copy()
-            df_ref = df_ref[df_ref["referral_code"].notna() & (df_ref["referral_code"] != "")]
-            if not df_ref.empty:
-                ref_group = df_ref.groupby("referral_code").agg(
-                    trips_count=("price_xof", "count"),
-                    total_revenue_xof=("price_xof", "sum"),
-                    avg_fare_xof=("price_xof", "mean"),
-                ).reset_index()
-                ref_group["avg_fare_xof"] = ref_group["avg_fare_xof"].round(0)
-
-                st.markdown("**Referral performance**")
-                st.dataframe(ref_group)
-                st.bar_chart(ref_group.set_index("referral_code")["trips_count"])
-            else:
-                st.info("No referral codes used yet.")
+        if kpis.get("by_referral"):
+            ref_group = group_frame(kpis["by_referral"], "referral_code")[
+                ["referral_code", "trips_count", "total_revenue_xof", "avg_fare_xof"]
+            ]
+
+            st.markdown("**Referral performance**")
+            st.dataframe(ref_group)
+            st.bar_chart(ref_group.set_index("referral_code")["trips_count"])
         else:
-            st.info("Referral code field not available in trips.")
+            st.info("No referral codes used yet.")
     else:
         st.info("No trips yet.")
 
 # ----------------------------
 # MOBILE USAGE TAB
 # ----------------------------
-with tab_mobile:
+if view == TAB_MOBILE:
     st.markdown("### 📱 Mobile vs web usage")
 
-    if not df_trips.empty and "client_app" in df_trips.columns:
-        df_ch = df_trips.dropna(subset=["client_app"]).copy()
-        if not df_ch.empty:
-            ch_group = df_ch.groupby("client_app").size().reset_index(name="trips_count")
-            st.dataframe(ch_group)
-            st.bar_chart(ch_group.set_index("client_app")["trips_count"])
-        else:
-            st.info("No client_app data available yet.")
+    if kpis.get("by_client_app"):
+        ch_group = group_frame(kpis["by_client_app"], "client_app").rename(columns={"count": "trips_count"})
+        st.dataframe(ch_group)
+        st.bar_chart(ch_group.set_index("client_app")["trips_count"])
     else:
         st.info(
             "No client_app field found – the Passenger app saves `client_app='passenger_mobile_demo'`. "
             "You can extend this to other clients (driver mobile, web, etc.)."
         )
+
+# ----------------------------
+# DEMAND MAP TAB
+# ----------------------------
+if view == TAB_DEMAND:
+    st.markdown("### 🗺️ Where and when riders book")
+
+    grid = get_demand_grid()
+    col_k, col_r, col_d = st.columns(3)
+    with col_k:
+        heat_kind = st.radio("Demand", ["pickup", "drop"], horizontal=True, key="investor_heat_kind")
+    with col_r:
+        heat_res = st.slider("Cell size (finer →)", 3, FINE_RESOLUTION, FINE_RESOLUTION - 1, key="investor_heat_res")
+    with col_d:
+        heat_days = st.multiselect("Days", DAY_NAMES, default=DAY_NAMES, key="investor_heat_days")
+    heat_hours = st.slider("Hours (UTC)", 0, 23, (0, 23), key="investor_heat_hours")
+    hours = [
+        DAY_NAMES.index(d) * 24 + h
+        for d in heat_days
+        for h in range(heat_hours[0], heat_hours[1] + 1)
+    ]
+
+    cells = grid.heatmap(heat_kind, heat_res, hours)
+    if not cells.empty:
+        cells["size"] = 200 * cells["trips"] ** 0.5
+        st.map(cells, latitude="lat", longitude="lon", size="size")
+        st.markdown("**Trips by hour of week (UTC)**")
+        st.dataframe(grid.by_hour_of_week(heat_kind))
+        st.markdown("**Top origin → destination flows**")
+        st.dataframe(grid.flows(hours))
+    else:
+        st.info("No trips with coordinates for this selection.")
+
+# ----------------------------
+# COMMISSION WHAT-IF TAB
+# ----------------------------
+if view == TAB_TIERS:
+    st.markdown("### 🧮 Commission tiers – what if?")
+    st.caption(
+        "Replays every trip with another tier table: each trip is priced at the tier its driver "
+        "would have been in (trips in the previous 7 days). Cancelled trips keep their fees."
+    )
+
+    edited = st.data_editor(
+        pd.DataFrame(COMMISSION_TIERS, columns=["min_trips_per_week", "platform_pct"]),
+        num_rows="dynamic",
+        key="tier_editor",
+    )
+    if st.button("Simulate", key="simulate_tiers"):
+        try:
+            alt_tiers = check_tiers(edited.dropna().itertuples(index=False, name=None))
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            comparison = compare_tiers({"Current tiers": COMMISSION_TIERS, "Alternative": alt_tiers})
+            current = comparison.iloc[1]
+            alternative = comparison.iloc[2]
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric(
+                "Platform revenue (XOF)",
+                f"{alternative['platform_xof']:,.0f}",
+                f"{alternative['platform_xof'] - current['platform_xof']:+,.0f} vs current tiers",
+            )
+            col2.metric(
+                "Driver earnings (XOF)",
+                f"{alternative['driver_xof']:,.0f}",
+                f"{alternative['driver_xof'] - current['driver_xof']:+,.0f} vs current tiers",
+            )
+            col3.metric(
+                "Average commission (%)",
+                f"{alternative['avg_pct'] or 0:.2f}",
+                f"{(alternative['avg_pct'] or 0) - (current['avg_pct'] or 0):+.2f}",
+            )
+            st.dataframe(comparison)
+
+            mix = tier_mix(COMMISSION_TIERS).rename(columns={"trips": "current"}).merge(
+                tier_mix(alt_tiers).rename(columns={"trips": "alternative"}), on="pct", how="outer"
+            ).fillna(0)
+            st.markdown("**Trips per commission %**")
+            st.bar_chart(mix.set_index("pct")[["current", "alternative"]])
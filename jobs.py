@@ -0,0 +1,462 @@
+"""
+Background jobs: a SQLite-backed queue (data/jobs.db) and a worker process.
+
+Slow work (snapshot rebuilds, exports, cancellations, log checkpoints,
+settlement, forecast refits) runs in the worker instead of on a Streamlit
+request:
+
+    python jobs.py worker                 # run queued and periodic jobs
+    python jobs.py enqueue export --param kind=trips --param fmt=csv
+    python jobs.py stats                  # runs, failures, timings per job
+
+- `enqueue()` adds a job unless the same job (name + params) is already
+  queued or running, in which case that one's id is returned (deduplication).
+- Workers claim jobs in one transaction and hold a lease while they run; a
+  job whose worker died is picked up again when the lease runs out.
+- A worker thread refreshes the worker's heartbeat every HEARTBEAT_SECONDS,
+  also while a long job runs, so the apps keep queueing instead of running
+  jobs inline.
+- A failed job is retried with exponential backoff up to its max attempts.
+- PERIODIC jobs are enqueued by the worker when due; dedup keeps several
+  workers from piling them up.
+- Every finished run records its duration, so `stats()` reports count,
+  failures, mean / max seconds per job.
+- The periodic `purge` deletes finished jobs past their retention, and the
+  export files (data/exports) of those jobs or as old.
+
+The apps call `submit()`: it enqueues when a worker is alive (heartbeat in
+the last WORKER_TTL_SECONDS) and otherwise runs the job inline, so the demo
+works without a worker too. Results are JSON and read back with `get_job()`.
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from core.config import DATA_DIR, ensure_data_dir
+
+JOBS_DB_PATH = os.path.join(DATA_DIR, "jobs.db")
+EXPORTS_DIR = os.path.join(DATA_DIR, "exports")  # export job files, removed by purge()
+
+POLL_SECONDS = 0.5
+WORKER_TTL_SECONDS = 15
+HEARTBEAT_SECONDS = 5
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+RETRY_BASE_SECONDS = 2
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    seconds REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs (dedupe_key) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name, finished_at);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+"""
+
+
+# ----------------------------
+# JOB REGISTRY
+# ----------------------------
+# name -> (fn(**params) -> JSON-serializable result, lease seconds)
+JOBS = {}
+
+
+def register(name, lease_seconds=LEASE_SECONDS):
+    def decorator(fn):
+        JOBS[name] = (fn, lease_seconds)
+        return fn
+    return decorator
+
+
+@register("snapshot")
+def _job_snapshot():
+    from snapshot import get_snapshot
+
+    snap = get_snapshot()
+    return {"version": snap.version, "rows": snap.n_rows}
+
+
+@register("checkpoint")
+def _job_checkpoint():
+    from core import shared
+
+    shared.checkpoint()
+    return {}
+
+
+@register("presence_sweep", lease_seconds=60)
+def _job_presence_sweep():
+    from presence import sweep_presence
+
+    return sweep_presence().counts()
+
+
+@register("settle")
+def _job_settle(weeks=None):
+    from settlement import settle
+
+    return {"written": settle(weeks)}
+
+
+@register("export", lease_seconds=3600)
+def _job_export(kind, fmt="csv", job_id=None, **filters):
+    from export import export_drivers, export_trips
+
+    export_fn = export_trips if kind == "trips" else export_drivers
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    path = os.path.join(EXPORTS_DIR, f"mali_ride_{kind}_{job_id or os.getpid()}.{fmt}")
+    return {"path": path, "rows": export_fn(path, fmt, **filters)}
+
+
+@register("cancel_trip", lease_seconds=120)
+def _job_cancel_trip(trip_id, by):
+    from core.shared import cancel_trip
+
+    trip = cancel_trip(trip_id, by)
+    if trip is None:
+        return {"trip_id": trip_id, "found": False}
+    return {
+        "trip_id": trip_id,
+        "found": True,
+        "status": trip.get("status"),
+        "cancellation_fee_xof": trip.get("cancellation_fee_xof"),
+    }
+
+
+@register("purge")
+def _job_purge():
+    return {"deleted": purge()}
+
+
+@register("forecast")
+def _job_forecast(full=False):
+    from forecast import fit
+
+    return {"days": fit(full=full)}
+
+
+# name -> interval in seconds
+PERIODIC = {
+    "presence_sweep": 15,
+    "snapshot": 30,
+    "checkpoint": 60,
+    "forecast": 3600,
+    "settle": 3600,
+    "purge": 86400,
+}
+
+
+# ----------------------------
+# QUEUE
+# ----------------------------
+_local = threading.local()
+
+
+def _db():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        ensure_data_dir()
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def _params_json(params):
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def _row(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+def enqueue(name, params=None, delay=0.0, max_attempts=MAX_ATTEMPTS):
+    """
+    Queues job `name` with `params` and returns its id; the id of the same
+    job already queued or running if there is one.
+    """
+    if name not in JOBS:
+        raise ValueError(f"unknown job {name!r}")
+    params_json = _params_json(params)
+    key = f"{name}:{params_json}"
+    now = time.time()
+    conn = _db()
+    conn.execute(
+        "INSERT OR IGNORE INTO jobs (name, params, dedupe_key, status, max_attempts, run_after, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (name, params_json, key, QUEUED, max_attempts, now + delay, now),
+    )
+    row = conn.execute(
+        "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)", (key, QUEUED, RUNNING)
+    ).fetchone()
+    if row is None:  # finished in between
+        return enqueue(name, params, delay, max_attempts)
+    return row["id"]
+
+
+def get_job(job_id):
+    return _row(_db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def latest_result(name, params=None):
+    """
+    Result of the last successful run of the job, or None.
+    """
+    row = _db().execute(
+        "SELECT result FROM jobs WHERE dedupe_key = ? AND status = ? ORDER BY finished_at DESC LIMIT 1",
+        (f"{name}:{_params_json(params)}", DONE),
+    ).fetchone()
+    return json.loads(row["result"]) if row is not None else None
+
+
+def _claim():
+    """
+    The next due job (or one whose lease ran out), marked running; None if
+    there is nothing to do.
+    """
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_until < ?) "
+            "ORDER BY run_after, id LIMIT 1",
+            (QUEUED, now, RUNNING, now),
+        ).fetchone()
+        if row is not None:
+            lease = JOBS.get(row["name"], (None, LEASE_SECONDS))[1]
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? WHERE id = ?",
+                (RUNNING, now, now + lease, row["id"]),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    job = _row(row)
+    job["attempts"] += 1
+    return job
+
+
+def _run(job):
+    """
+    Runs a claimed job and records the outcome: done, retried later, or
+    failed after its last attempt.
+    """
+    name, params = job["name"], dict(job["params"])
+    if name == "export":
+        params["job_id"] = job["id"]
+    started = time.perf_counter()
+    try:
+        fn = JOBS[name][0]
+        result, error = fn(**params), None
+    except Exception:
+        result, error = None, traceback.format_exc(limit=5)
+    seconds = time.perf_counter() - started
+    now = time.time()
+
+    if error is None:
+        status, run_after = DONE, None
+    elif job["attempts"] < job["max_attempts"]:
+        status, run_after = QUEUED, now + RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+    else:
+        status, run_after = FAILED, None
+    _db().execute(
+        "UPDATE jobs SET status = ?, run_after = COALESCE(?, run_after), lease_until = NULL, finished_at = ?, "
+        "seconds = ?, result = ?, error = ? WHERE id = ?",
+        (status, run_after, now, seconds, json.dumps(result, default=str) if error is None else None,
+         error, job["id"]),
+    )
+    return get_job(job["id"])
+
+
+def worker_alive():
+    row = _db().execute("SELECT MAX(seen_at) AS seen FROM workers").fetchone()
+    return row["seen"] is not None and time.time() - row["seen"] < WORKER_TTL_SECONDS
+
+
+def submit(name, params=None):
+    """
+    Enqueues the job when a worker is running, else runs it right away.
+    Returns the job (check `status`: "queued" / "running" or finished).
+    """
+    job_id = enqueue(name, params)
+    if worker_alive():
+        return get_job(job_id)
+    # no worker: claim it ourselves unless someone already did
+    conn = _db()
+    now = time.time()
+    claimed = conn.execute(
+        "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ? "
+        "WHERE id = ? AND status = ?",
+        (RUNNING, now, now + JOBS[name][1], job_id, QUEUED),
+    ).rowcount
+    if not claimed:
+        return get_job(job_id)
+    job = get_job(job_id)
+    job["max_attempts"] = job["attempts"]  # the caller sees the error instead of waiting for a retry
+    return _run(job)
+
+
+# ----------------------------
+# WORKER
+# ----------------------------
+def _enqueue_periodic(last_enqueued):
+    now = time.time()
+    for name, interval in PERIODIC.items():
+        if now - last_enqueued.get(name, 0) >= interval:
+            enqueue(name)
+            last_enqueued[name] = now
+
+
+def _heartbeat(worker_id, stop):
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            _db().execute("UPDATE workers SET seen_at = ? WHERE id = ?", (time.time(), worker_id))
+        except sqlite3.Error:
+            traceback.print_exc()  # try again on the next beat
+
+
+def run_worker(once=False, periodic=True):
+    """
+    Claims and runs jobs until interrupted (`once`: until the queue is empty).
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    _db().execute("INSERT OR REPLACE INTO workers (id, seen_at) VALUES (?, ?)", (worker_id, time.time()))
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(worker_id, stop), name="jobs-heartbeat", daemon=True).start()
+    last_enqueued = {}
+    try:
+        while True:
+            if periodic:
+                _enqueue_periodic(last_enqueued)
+            job = _claim()
+            if job is None:
+                if once:
+                    return
+                time.sleep(POLL_SECONDS)
+                continue
+            job = _run(job)
+            print(f"{job['name']} #{job['id']} {job['status']} in {job['seconds']:.2f}s", flush=True)
+    finally:
+        stop.set()
+        _db().execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+
+def stats(since=None):
+    """
+    {job name: {runs, failed, queued, mean_seconds, max_seconds, last_run}}
+    over the runs finished after `since` (epoch seconds; default all).
+    """
+    rows = _db().execute(
+        "SELECT name, COUNT(*) AS runs, SUM(status = ?) AS failed, AVG(seconds) AS mean_seconds, "
+        "MAX(seconds) AS max_seconds, MAX(finished_at) AS last_run FROM jobs "
+        "WHERE finished_at IS NOT NULL AND finished_at >= ? GROUP BY name",
+        (FAILED, since or 0),
+    ).fetchall()
+    out = {row["name"]: {**dict(row), "queued": 0} for row in rows}
+    for row in _db().execute("SELECT name, COUNT(*) AS n FROM jobs WHERE status = ? GROUP BY name", (QUEUED,)):
+        out.setdefault(row["name"], {"name": row["name"], "runs": 0, "failed": 0, "mean_seconds": None,
+                                     "max_seconds": None, "last_run": None})["queued"] = row["n"]
+    for rec in out.values():
+        rec.pop("name")
+    return out
+
+
+def purge(older_than_seconds=7 * 86400):
+    """
+    Deletes finished jobs older than the given age, with the files of the
+    export jobs deleted and any export file older than that. Returns the
+    number of jobs deleted.
+    """
+    cutoff = time.time() - older_than_seconds
+    db = _db()
+    rows = db.execute(
+        "SELECT result FROM jobs WHERE name = 'export' AND status = ? AND finished_at < ?", (DONE, cutoff)
+    ).fetchall()
+    deleted = db.execute(
+        "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+    ).rowcount
+
+    # only files in EXPORTS_DIR, whatever path an old result names
+    names = {os.path.basename(json.loads(row["result"]).get("path") or "") for row in rows if row["result"]}
+    if os.path.isdir(EXPORTS_DIR):
+        for name in os.listdir(EXPORTS_DIR):
+            path = os.path.join(EXPORTS_DIR, name)
+            try:
+                if name in names or os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+    return deleted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Background job queue and worker.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="run queued and periodic jobs")
+    worker.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    worker.add_argument("--no-periodic", action="store_true")
+    enq = sub.add_parser("enqueue", help="queue a job")
+    enq.add_argument("name", choices=sorted(JOBS))
+    enq.add_argument("--param", action="append", default=[], help="key=value (repeatable)")
+    sub.add_parser("stats", help="runs, failures and timings per job")
+    purge_cmd = sub.add_parser("purge", help="delete finished jobs")
+    purge_cmd.add_argument("--days", type=float, default=7)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        try:
+            run_worker(once=args.once, periodic=not args.no_periodic)
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "enqueue":
+        params = dict(p.split("=", 1) for p in args.param)
+        print(f"job #{enqueue(args.name, params)} queued")
+    elif args.command == "stats":
+        for name, rec in sorted(stats().items()):
+            mean = f"{rec['mean_seconds']:.3f}s" if rec["mean_seconds"] is not None else "-"
+            top = f"{rec['max_seconds']:.3f}s" if rec["max_seconds"] is not None else "-"
+            print(f"{name:16} runs={rec['runs']} failed={rec['failed']} queued={rec['queued']} "
+                  f"mean={mean} max={top}")
+    elif args.command == "purge":
+        print(f"{purge(args.days * 86400)} job(s) deleted")
+
+
+if __name__ == "__main__":
+    main()
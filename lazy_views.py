@@ -0,0 +1,129 @@
+"""
+Lazy tabs for the dashboards.
+
+`st.tabs` runs the body of every tab on each rerun although only one is
+visible. `view_tabs()` draws the tab strip as a horizontal radio and returns
+the selected label, so a page builds the visible tab only.
+
+The data behind a view goes through `compute()`: results are cached per
+process by (name, store version, filter set). The cache is bounded by the
+memory of its values (DataFrames are measured with
+`memory_usage(deep=True)`), least recently used first out, so keeping many
+filter sets of a large trips table cannot grow it past CACHE_BYTES; a value
+larger than a quarter of that is returned without being cached. Cached
+values are shared between sessions: treat them as read-only.
+
+A job given as `(fn, *args)` instead of a callable is run in aggregation's
+process pool when it misses together with other such jobs, so independent
+aggregations (the admin's filtered KPIs and sketch summary) run in parallel
+instead of in turn under the GIL. `fn` must be a module-level function and
+its arguments and result picklable.
+"""
+import json
+import sys
+import threading
+from collections import OrderedDict
+
+CACHE_BYTES = 512 << 20
+MAX_ENTRY_BYTES = CACHE_BYTES // 4
+
+_cache = OrderedDict()  # key -> (value, size in bytes)
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_MISS = object()
+
+
+def view_tabs(labels, key):
+    """
+    Tab strip that only reports the selected tab; build that one only.
+    """
+    import streamlit as st
+
+    return st.radio("View", labels, horizontal=True, key=key, label_visibility="collapsed")
+
+
+def nbytes(value):
+    """
+    Approximate memory held by a cached value.
+    """
+    usage = getattr(value, "memory_usage", None)
+    if callable(usage):  # DataFrame / Series
+        total = usage(deep=True)
+        return int(total.sum() if hasattr(total, "sum") else total)
+    if hasattr(value, "nbytes"):  # numpy arrays
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(nbytes(k) + nbytes(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _cache_key(name, version, params):
+    return name, version, json.dumps(params, sort_keys=True, default=str)
+
+
+def _lookup(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return _MISS
+        _cache.move_to_end(key)
+        return entry[0]
+
+
+def _store(key, value):
+    global _cache_bytes
+    size = nbytes(value)
+    if size > MAX_ENTRY_BYTES:
+        return
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old[1]
+        _cache[key] = (value, size)
+        _cache_bytes += size
+        while _cache_bytes > CACHE_BYTES:
+            _, (_, evicted) = _cache.popitem(last=False)
+            _cache_bytes -= evicted
+
+
+def compute(jobs, version, params=None):
+    """
+    {name: fn or (fn, *args)} -> {name: result}, each cached under
+    (name, version, params). Two or more `(fn, *args)` misses run in the
+    process pool, while the callables run here.
+    """
+    out = {}
+    missing = {}
+    for name, job in jobs.items():
+        key = _cache_key(name, version, params)
+        value = _lookup(key)
+        if value is _MISS:
+            missing[name] = key
+        else:
+            out[name] = value
+    pooled = [name for name in missing if isinstance(jobs[name], tuple)]
+    futures = {}
+    if len(pooled) > 1:
+        from aggregation import _pool
+
+        futures = {name: _pool().submit(*jobs[name]) for name in pooled}
+    for name, key in missing.items():
+        job = jobs[name]
+        if name in futures:
+            value = futures[name].result()
+        elif isinstance(job, tuple):
+            value = job[0](*job[1:])
+        else:
+            value = job()
+        _store(key, value)
+        out[name] = value
+    return {name: out[name] for name in jobs}
+
+
+def cached(name, version, fn, params=None):
+    """
+    compute() for a single value.
+    """
+    return compute({name: fn}, version, params)[name]
@@ -0,0 +1,275 @@
+"""
+Maintained driver leaderboards: top drivers by earnings, trips or revenue per
+period (all time, calendar month, week) and city, and by rating per city.
+
+Every board keeps its per-driver totals plus, for each metric somebody asked
+for, a list of (-value, username) kept sorted with bisect. A trip write moves
+one entry per board it touches, so `top(n)` is a slice of n entries whatever
+the fleet size. Display names are computed once per driver (and again only
+when a name changes).
+
+History comes from one vectorized pass over the shared snapshot; after that
+`trip_booked`, `trip_updated` / `trip_cancelled` (fare, earnings, driver
+reassignment or city move) and driver events from the log are applied. Weeks
+start on Monday, UTC.
+"""
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+
+from core.shared import read_events
+from core.schema import DAY_MS, now_ms
+
+PERIODS = ("all", "month", "week")
+TRIP_METRICS = ("driver_earnings_xof", "trips_count", "total_revenue_xof")
+METRICS = TRIP_METRICS + ("rating",)
+
+PERIOD_LABELS = {"all": "All time", "month": "This month", "week": "This week"}
+METRIC_LABELS = {
+    "driver_earnings_xof": "Earnings (XOF)",
+    "trips_count": "Trips",
+    "total_revenue_xof": "Revenue (XOF)",
+    "rating": "Rating",
+}
+
+# 1970-01-01 was a Thursday
+_EPOCH_WEEKDAY = 3
+
+
+def period_key(period, ms):
+    """
+    Epoch ms (scalar or array) -> period number: 0 for "all", months since
+    1970-01 for "month", Monday-aligned weeks since 1970 for "week".
+    """
+    ms = np.asarray(ms, dtype=np.int64)
+    if period == "all":
+        return np.zeros_like(ms)
+    if period == "month":
+        return ms.astype("datetime64[ms]").astype("datetime64[M]").astype(np.int64)
+    if period == "week":
+        return (ms // DAY_MS + _EPOCH_WEEKDAY) // 7
+    raise ValueError(f"unknown period {period!r}")
+
+
+def display_name(driver):
+    name = f"{driver.get('first_name') or ''} {driver.get('last_name') or ''}".strip()
+    return name or driver.get("username", "")
+
+
+# ----------------------------
+# ONE BOARD
+# ----------------------------
+class Board:
+    """
+    {username: {metric: value}} with lazily built, incrementally kept
+    rankings per metric.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._ranked = {}
+
+    def _unrank(self, username):
+        old = self.stats.get(username)
+        if old is None:
+            return
+        for metric, ranked in self._ranked.items():
+            i = bisect.bisect_left(ranked, (-old.get(metric, 0), username))
+            if i < len(ranked) and ranked[i][1] == username:
+                del ranked[i]
+
+    def set(self, username, values):
+        self._unrank(username)
+        for metric, ranked in self._ranked.items():
+            bisect.insort(ranked, (-values.get(metric, 0), username))
+        self.stats[username] = values
+
+    def remove(self, username):
+        self._unrank(username)
+        self.stats.pop(username, None)
+
+    def add(self, username, deltas):
+        old = self.stats.get(username, {})
+        values = {m: old.get(m, 0) + deltas.get(m, 0) for m in set(old) | set(deltas)}
+        if values.get("trips_count", 1) <= 0:
+            self.remove(username)  # last trip moved to another driver
+        else:
+            self.set(username, values)
+
+    def top(self, metric, n):
+        ranked = self._ranked.get(metric)
+        if ranked is None:
+            ranked = self._ranked[metric] = sorted(
+                (-values.get(metric, 0), username) for username, values in self.stats.items()
+            )
+        return [(username, self.stats[username]) for _, username in ranked[:n]]
+
+
+# ----------------------------
+# ALL BOARDS
+# ----------------------------
+class Leaderboard:
+    """
+    Trip boards keyed by (period, period number, city or None for all
+    cities) and rating boards keyed by city or None.
+
+    Start with `Leaderboard.build()`, then `refresh()` to follow the log.
+    """
+
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.trip_boards = {}
+        self.rating_boards = {}
+        self.names = {}
+        self.cities = {}
+
+    @classmethod
+    def build(cls):
+        from snapshot import get_snapshot
+        from driver_state import get_driver_state
+
+        snap = get_snapshot()
+        board = cls(offset=snap.offset)
+        for driver in get_driver_state().drivers.values():
+            board._set_driver(driver)
+        if snap.n_rows == 0:
+            return board
+
+        usernames = snap.categories("driver_username")
+        city_names = snap.categories("city")
+        drivers = snap.column("driver_username")
+        assigned = drivers != snap.code_of("driver_username", "")
+        drivers = drivers[assigned].astype(np.int64)
+        cities = snap.column("city")[assigned].astype(np.int64)
+        created = snap.column("created_at")[assigned]
+        price = snap.column("price_xof")[assigned]
+        earnings = snap.column("driver_earnings_xof")[assigned]
+
+        n_drivers, n_cities = len(usernames), len(city_names) + 1  # last code: all cities
+        for period in PERIODS:
+            keys = period_key(period, created)
+            base = keys.min() if len(keys) else 0
+            for city_codes in (cities, np.full_like(cities, n_cities - 1)):
+                group = ((keys - base) * n_cities + city_codes) * n_drivers + drivers
+                groups, inverse = np.unique(group, return_inverse=True)
+                trips = np.bincount(inverse, minlength=len(groups))
+                revenue = np.bincount(inverse, weights=price, minlength=len(groups))
+                earned = np.bincount(inverse, weights=earnings, minlength=len(groups))
+                for g, t, r, e in zip(groups.tolist(), trips.tolist(), revenue.tolist(), earned.tolist()):
+                    rest, driver = divmod(g, n_drivers)
+                    key, city = divmod(rest, n_cities)
+                    city = city_names[city] if city < n_cities - 1 else None
+                    board._board(period, key + int(base), city).stats[usernames[driver]] = {
+                        "trips_count": t,
+                        "total_revenue_xof": int(r),
+                        "driver_earnings_xof": int(e),
+                    }
+        return board
+
+    def _board(self, period, key, city):
+        board = self.trip_boards.get((period, key, city))
+        if board is None:
+            board = self.trip_boards[(period, key, city)] = Board()
+        return board
+
+    def _set_driver(self, driver):
+        username = driver.get("username")
+        if not username:
+            return
+        self.names[username] = display_name(driver)
+        old_city, city = self.cities.get(username), driver.get("city", "")
+        if old_city is not None and old_city != city and old_city in self.rating_boards:
+            self.rating_boards[old_city].remove(username)
+        self.cities[username] = city
+        values = {"rating": float(driver.get("rating") or 0), "rating_count": int(driver.get("rating_count") or 0)}
+        for key in (city, None):
+            self.rating_boards.setdefault(key, Board()).set(username, values)
+
+    def _add_trip(self, username, city, created_at, sign, price, earnings):
+        if not username or created_at is None:
+            return  # unassigned, or an event written before created_at was logged
+        deltas = {
+            "trips_count": sign,
+            "total_revenue_xof": sign * int(price or 0),
+            "driver_earnings_xof": sign * int(earnings or 0),
+        }
+        for period in PERIODS:
+            key = int(period_key(period, created_at))
+            for c in (city, None):
+                self._board(period, key, c).add(username, deltas)
+
+    def apply(self, event, state):
+        kind = event.get("type", "")
+        data = event.get("data", {})
+        if kind == "trip_booked":
+            self._add_trip(data.get("driver_username"), data.get("city"), data.get("created_at"), 1,
+                           data.get("price_xof"), data.get("driver_earnings_xof"))
+        elif kind in ("trip_updated", "trip_cancelled"):
+            before = data.get("before", {})
+            if not {"driver_username", "price_xof", "driver_earnings_xof", "city"} & set(before):
+                return
+            self._add_trip(before.get("driver_username", data.get("driver_username")),
+                           before.get("city", data.get("city")),
+                           data.get("created_at"), -1,
+                           before.get("price_xof", data.get("price_xof")),
+                           before.get("driver_earnings_xof", data.get("driver_earnings_xof")))
+            self._add_trip(data.get("driver_username"), data.get("city"), data.get("created_at"), 1,
+                           data.get("price_xof"), data.get("driver_earnings_xof"))
+        elif kind.startswith("driver_"):
+            # the driver state has already folded this event in
+            driver = state.drivers.get(data.get("username"))
+            if driver:
+                self._set_driver(driver)
+
+    def refresh(self):
+        """
+        Applies the events written since the last call. Returns how many.
+        """
+        from driver_state import get_driver_state
+
+        state = get_driver_state()
+        events, self.offset = read_events(self.offset)
+        for event in events:
+            self.apply(event, state)
+        return len(events)
+
+    def top(self, metric="driver_earnings_xof", n=10, period="all", city=None, at_ms=None):
+        """
+        DataFrame of the top `n` drivers by `metric` for the period that
+        contains `at_ms` (default: now), in `city` or all cities.
+        """
+        if metric == "rating":
+            board = self.rating_boards.get(city)
+        else:
+            board = self.trip_boards.get((period, int(period_key(period, at_ms or now_ms())), city))
+        rows = []
+        for rank, (username, values) in enumerate(board.top(metric, n) if board else [], start=1):
+            rows.append({
+                "rank": rank,
+                "driver_username": username,
+                "driver_name": self.names.get(username, username),
+                "city": self.cities.get(username, ""),
+                **values,
+            })
+            if metric != "rating":
+                rows[-1]["rating"] = self.rating_boards.get(None, Board()).stats.get(username, {}).get("rating")
+        return pd.DataFrame(rows, columns=None if rows else ["rank", "driver_username", "driver_name", metric])
+
+
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+
+
+def get_leaderboard():
+    """
+    Process-wide leaderboard, shared by all sessions and brought up to date
+    with the event log on every call.
+    """
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard = Leaderboard.build()
+        _leaderboard.refresh()
+        return _leaderboard
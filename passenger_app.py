@@ -2,23 +2,31 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date, time
+from streamlit.errors import StreamlitAPIException
 
 from core.shared import (
     LANG_OPTIONS,
     labels,
-    load_drivers_from_db,
-    load_trips_from_db,
+    query_trips,
+    rate_trip,
     save_trip_to_db,
     haversine_miles,
     compute_fare,
     apply_promo,
     passenger_can_cancel,
-    apply_passenger_cancellation,
-    TRIPS_PATH,
-    _write_json,
+    PASSENGER_LATE_CANCEL_PCT,
     MALI_CITIES,
-    BKO_NEIGHBORHOODS,
+    TRANSPORT_TYPES,
+    with_datetimes,
+    events_end_offset,
+    get_commission_pct,
 )
+from core.schema import now_ms, to_epoch_ms, WEEK_MS
+from geofence import get_geofences
+from jobs import submit
+from driver_search import get_driver_search
+
+AUTO_ASSIGN = "Let Mali Ride choose (batch dispatch)"
 
 st.set_page_config(page_title="Mali Ride – Passenger App", layout="wide")
 
@@ -34,177 +42,346 @@ st.title("🚕 Mali Ride – Passenger Demo")
 st.caption("Request a ride, apply promos, and manage scheduled trips for the investor demo.")
 
 # ----------------------------
-# LOAD DRIVERS
+# SESSION DATA HANDLES
 # ----------------------------
-drivers = load_drivers_from_db()
-if not drivers:
+def store_data(name, loader):
+    """
+    Session-scoped handle on drivers / trips: reloaded only when the store has
+    changed since the last load (every write moves the event log offset), not
+    on every widget rerun.
+    """
+    version = events_end_offset()
+    handle = st.session_state.get(f"_data_{name}")
+    if handle is None or handle[0] != version:
+        handle = st.session_state[f"_data_{name}"] = (version, loader())
+    return handle[1]
+
+
+SCHEDULED_VIEW_STATUSES = ["scheduled", "cancelled_by_passenger", "cancelled_by_driver"]
+
+
+def scheduled_trips():
+    """
+    (DataFrame indexed by trip_id, {trip_id: trip}) for the
+    "My scheduled trips" section.
+    """
+    def load():
+        query = query_trips(status=SCHEDULED_VIEW_STATUSES)
+        df = query.frame(by_trip_id=True)
+        return df, dict(zip(df.index, query.records()))
+    return store_data("scheduled_trips", load)
+
+
+RATE_LIST_LIMIT = 20
+
+
+def trips_to_rate():
+    """
+    {trip_id: trip} of the most recent completed trips that have a driver and
+    no passenger rating yet, for the "Rate your driver" section.
+    """
+    def load():
+        trips = [t for t in query_trips(status="completed")
+                 if t.get("driver_username") and not t.get("passenger_rating")]
+        trips.sort(key=lambda t: t.get("created_at") or 0, reverse=True)
+        return {t["trip_id"]: t for t in trips[:RATE_LIST_LIMIT]}
+    return store_data("trips_to_rate", load)
+
+
+def rerun_section():
+    """
+    Reruns the current fragment, or the whole page when this run is not a
+    fragment rerun (a full rerun, e.g. the first run after a page load or
+    AppTest), where a fragment-scoped rerun is not allowed.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def flash(key, message=None):
+    # Messages that must survive the st.rerun() following a write
+    if message is not None:
+        st.session_state[key] = message
+    else:
+        return st.session_state.pop(key, None)
+
+
+if not len(get_driver_search()):
     st.info("No drivers found yet. Add some drivers in the Driver App or seed the drivers.json file.")
 
-# ----------------------------
-# PICKUP / DROPOFF
-# ----------------------------
-col_loc1, col_loc2 = st.columns(2)
-with col_loc1:
-    st.subheader("Pickup location")
-    pickup_city = st.selectbox("City", MALI_CITIES, index=0)
-    pickup_neigh = st.selectbox("Neighborhood (optional)", [""] + BKO_NEIGHBORHOODS)
-    pickup_lat = st.number_input("Pickup latitude", value=12.6392)
-    pickup_lon = st.number_input("Pickup longitude", value=-8.0029)
-with col_loc2:
-    st.subheader("Dropoff location")
-    drop_city = st.selectbox("Dropoff city", MALI_CITIES, index=0, key="drop_city")
-    drop_neigh = st.selectbox("Dropoff neighborhood (optional)", [""] + BKO_NEIGHBORHOODS, key="drop_neigh")
-    drop_lat = st.number_input("Dropoff latitude", value=12.6400)
-    drop_lon = st.number_input("Dropoff longitude", value=-8.0100)
+# Each section below is a fragment: changing one of its widgets reruns only
+# that section. Sections read each other's inputs through widget keys.
 
 # ----------------------------
 # SCHEDULING
 # ----------------------------
-st.markdown("### 🕒 Trip time")
+@st.fragment
+def trip_time_section():
+    st.markdown("### 🕒 Trip time")
 
-default_date = date.today()
-default_time = datetime.utcnow().time().replace(second=0, microsecond=0)
+    st.date_input("Trip date", value=date.today(), key="trip_date")
+    st.time_input(
+        "Trip time",
+        value=datetime.utcnow().time().replace(second=0, microsecond=0),
+        key="trip_time",
+    )
 
-trip_date = st.date_input("Trip date", value=default_date)
-trip_time = st.time_input("Trip time", value=default_time)
-scheduled_for = datetime.combine(trip_date, trip_time)
+    st.info(
+        "❗ **Cancellation policy**:\n\n"
+        "- Free cancellation only if **4 hours or more** before the scheduled time.\n"
+        "- If you cancel within 4 hours of the trip, you pay **75% of the fare** as a fee.\n"
+    )
 
-st.info(
-    "❗ **Cancellation policy**:\n\n"
-    "- Free cancellation only if **4 hours or more** before the scheduled time.\n"
-    "- If you cancel within 4 hours of the trip, you pay **75% of the fare** as a fee.\n"
-)
 
 # ----------------------------
 # DRIVER SELECTION
 # ----------------------------
-st.markdown("### 🎯 Choose a driver")
-if drivers:
-    df_drivers = pd.DataFrame(drivers)
-    display_cols = [c for c in ["username", "first_name", "last_name", "city", "transport_type", "rating"] if c in df_drivers.columns]
-    st.dataframe(df_drivers[display_cols])
-
-    chosen_username = st.selectbox(
-        "Preferred driver (for demo)",
-        options=df_drivers["username"].tolist()
-    )
-else:
-    chosen_username = None
+@st.fragment
+def driver_section():
+    st.markdown("### 🎯 Choose a driver")
+    index = get_driver_search()
+    if len(index):
+        # Only a page of search results is shown, whatever the fleet size
+        col_q, col_c, col_t, col_r = st.columns([3, 2, 2, 2])
+        with col_q:
+            query = st.text_input("Search drivers (username or name)", key="driver_query")
+        with col_c:
+            city = st.selectbox("City", [""] + MALI_CITIES, key="driver_city")
+        with col_t:
+            transport = st.selectbox("Transport", [""] + TRANSPORT_TYPES, key="driver_transport")
+        with col_r:
+            min_rating = st.slider("Min rating", 1.0, 5.0, 1.0, 0.5, key="driver_min_rating")
+        matches = index.search(query, city=city or None, transport_type=transport or None,
+                               rating=(min_rating, None) if min_rating > 1.0 else None)
+        display_cols = ["username", "first_name", "last_name", "city", "transport_type", "status", "rating"]
+        if matches:
+            st.dataframe(pd.DataFrame(matches, columns=display_cols), hide_index=True)
+
+        options = [AUTO_ASSIGN] + [d["username"] for d in matches]
+        chosen = st.session_state.get("chosen_username")
+        if chosen and chosen not in options:
+            options.append(chosen)  # keep the pick while the search changes
+        st.selectbox("Preferred driver (for demo)", options=options, key="chosen_username")
+    else:
+        st.session_state["chosen_username"] = None
+
+    st.selectbox("Vehicle (optional)", [""] + TRANSPORT_TYPES, key="transport_type")
+
+
+def weekly_trip_count(username):
+    now = now_ms()
+    return query_trips(driver=username, created_range=(now - WEEK_MS, now + 1)).count()
+
 
 # ----------------------------
-# PRICING & PROMOS
+# PICKUP / DROPOFF & PRICING
 # ----------------------------
-st.markdown("### 💰 Pricing & promotions")
+def area_of(label, lat, lon, key):
+    """
+    City and neighborhood of the coordinates (geofence.py). The rider picks
+    the city only for points outside every known city.
+    """
+    city, neighborhood = get_geofences().lookup(lat, lon)
+    if city:
+        st.caption(f"📍 {city}{' · ' + neighborhood if neighborhood else ''} (from coordinates)")
+    else:
+        city = st.selectbox(f"{label} city (outside the known areas)", MALI_CITIES, index=0, key=key)
+    return city, neighborhood
+
+
+@st.fragment
+def quote_section():
+    # Only this fragment reruns while the passenger edits the quote inputs:
+    # distance, fare and promo are recomputed, nothing is loaded. The quote
+    # is kept in session state for the confirm section.
+    col_loc1, col_loc2 = st.columns(2)
+    with col_loc1:
+        st.subheader("Pickup location")
+        pickup_lat = st.number_input("Pickup latitude", value=12.6392)
+        pickup_lon = st.number_input("Pickup longitude", value=-8.0029)
+        pickup_city, pickup_neigh = area_of("Pickup", pickup_lat, pickup_lon, key="pickup_city")
+    with col_loc2:
+        st.subheader("Dropoff location")
+        drop_lat = st.number_input("Dropoff latitude", value=12.6400)
+        drop_lon = st.number_input("Dropoff longitude", value=-8.0100)
+        drop_city, drop_neigh = area_of("Dropoff", drop_lat, drop_lon, key="drop_city")
+
+    st.markdown("### 💰 Pricing & promotions")
 
-distance_miles = haversine_miles(pickup_lat, pickup_lon, drop_lat, drop_lon)
-base_fare = compute_fare(distance_miles)
+    distance_miles = haversine_miles(pickup_lat, pickup_lon, drop_lat, drop_lon)
+    base_fare = compute_fare(distance_miles)
 
-promo_code = st.text_input("Promo code (optional)")
-referral_code = st.text_input("Referral code (optional)")
+    promo_code = st.text_input("Promo code (optional)")
+    referral_code = st.text_input("Referral code (optional)")
 
-fare_after_promo, discount = apply_promo(promo_code, base_fare)
+    fare_after_promo, discount = apply_promo(promo_code, base_fare)
+
+    st.write(f"**Distance estimate:** {distance_miles:.2f} miles")
+    st.write(f"**Base fare:** {base_fare:,.0f} XOF")
+    st.write(f"**Discount:** {discount:,.0f} XOF")
+    st.write(f"**Final price:** {fare_after_promo:,.0f} XOF")
+
+    st.session_state["quote"] = {
+        "pickup_lat": pickup_lat,
+        "pickup_lon": pickup_lon,
+        "drop_lat": drop_lat,
+        "drop_lon": drop_lon,
+        "distance_miles": distance_miles,
+        "price_xof": fare_after_promo,
+        "price_before_discount_xof": base_fare,
+        "discount_xof": discount,
+        "promo_code": promo_code.upper() if promo_code else "",
+        "referral_code": referral_code.upper() if referral_code else "",
+        "city": pickup_city,
+        "pickup_neighborhood": pickup_neigh,
+        "drop_city": drop_city,
+        "drop_neighborhood": drop_neigh,
+        "route_summary": f"{pickup_city} {pickup_neigh or ''} → {drop_city} {drop_neigh or ''}",
+    }
 
-st.write(f"**Distance estimate:** {distance_miles:.2f} miles")
-st.write(f"**Base fare:** {base_fare:,.0f} XOF")
-st.write(f"**Discount:** {discount:,.0f} XOF")
-st.write(f"**Final price:** {fare_after_promo:,.0f} XOF")
 
 # ----------------------------
 # CONFIRM RIDE
 # ----------------------------
-if st.button("Confirm ride"):
-    if not chosen_username:
-        st.error("No driver selected.")
-    else:
-        # Compute weekly trips for dynamic commission
-        trips_history = load_trips_from_db()
-        df_trips_hist = pd.DataFrame(trips_history)
-        weekly_trips = 0
-        from core.shared import get_commission_pct
-        if not df_trips_hist.empty and "created_at" in df_trips_hist.columns and "driver_username" in df_trips_hist.columns:
-            df_trips_hist["created_at"] = pd.to_datetime(df_trips_hist["created_at"], errors="coerce")
-            now = pd.Timestamp.utcnow()
-            last_7 = now - pd.Timedelta(days=7)
-            mask = (
-                (df_trips_hist["driver_username"] == chosen_username)
-                & (df_trips_hist["created_at"] >= last_7)
-                & (df_trips_hist["created_at"] <= now)
-            )
-            weekly_trips = int(mask.sum())
+@st.fragment
+def confirm_section():
+    message = flash("booking_message")
+    if message:
+        st.success(message[0])
+        if message[1]:
+            st.info(message[1])
 
+    if st.button("Confirm ride"):
+        chosen_username = st.session_state.get("chosen_username")
+        if not chosen_username:
+            st.error("No driver selected.")
+            return
+
+        quote = st.session_state["quote"]
+        # Weekly trips for dynamic commission, from the driver index.
+        # Auto-assigned trips start on the base tier; the dispatcher re-prices
+        # them for the driver it picks.
+        weekly_trips = 0 if chosen_username == AUTO_ASSIGN else weekly_trip_count(chosen_username)
         commission_pct = get_commission_pct(weekly_trips + 1)
-        platform_commission = round(fare_after_promo * commission_pct / 100)
-        driver_earnings = fare_after_promo - platform_commission
+        platform_commission = round(quote["price_xof"] * commission_pct / 100)
+        driver_earnings = quote["price_xof"] - platform_commission
 
+        scheduled_for = datetime.combine(st.session_state["trip_date"], st.session_state["trip_time"])
         trip = {
-            "driver_username": chosen_username,
-            "pickup_lat": pickup_lat,
-            "pickup_lon": pickup_lon,
-            "drop_lat": drop_lat,
-            "drop_lon": drop_lon,
-            "distance_miles": distance_miles,
-            "price_xof": fare_after_promo,
-            "price_before_discount_xof": base_fare,
-            "discount_xof": discount,
-            "promo_code": promo_code.upper() if promo_code else "",
-            "referral_code": referral_code.upper() if referral_code else "",
+            **quote,
+            "driver_username": "" if chosen_username == AUTO_ASSIGN else chosen_username,
             "platform_commission_xof": platform_commission,
             "driver_earnings_xof": driver_earnings,
             "platform_pct": commission_pct,
             "driver_pct": 100 - commission_pct,
-            "city": pickup_city,
+            "transport_type": st.session_state.get("transport_type", ""),
             "routing_provider": "demo_haversine",
-            "created_at": pd.Timestamp.utcnow().isoformat(),
-            "route_summary": f"{pickup_city} {pickup_neigh or ''} → {drop_city} {drop_neigh or ''}",
+            "created_at": now_ms(),
             "client_app": "passenger_mobile_demo",
             "status": "scheduled",
-            "scheduled_for": scheduled_for.isoformat(),
+            "scheduled_for": to_epoch_ms(scheduled_for),
         }
         save_trip_to_db(trip)
-        st.success("Ride confirmed and stored. This will now appear in the admin & investor dashboards.")
+        flash("booking_message", (
+            "Ride confirmed and stored. This will now appear in the admin & investor dashboards.",
+            "" if trip["driver_username"] else "A driver will be assigned by the next batch dispatch run.",
+        ))
+        # Full rerun so "My scheduled trips" shows the new booking
+        st.rerun()
+
 
 # ----------------------------
 # MANAGE SCHEDULED TRIPS (DEMO VIEW)
 # ----------------------------
-st.markdown("---")
-st.subheader("🗓️ My scheduled trips (demo view)")
-
-all_trips = load_trips_from_db()
-df_my = pd.DataFrame(all_trips)
-
-if not df_my.empty:
-    if "status" not in df_my.columns:
-        df_my["status"] = "scheduled"
-
-    df_sched = df_my[df_my["status"].isin(["scheduled", "cancelled_by_passenger", "cancelled_by_driver"])].copy()
-    if not df_sched.empty:
-        st.dataframe(df_sched)
-
-        trip_indices = df_sched.index.tolist()
-        chosen_idx = st.selectbox("Select a scheduled trip to cancel", trip_indices)
-
-        if st.button("Cancel selected trip"):
-            now_utc = datetime.utcnow()
-            trips_list = all_trips
-            trip = trips_list[chosen_idx]
-
-            if passenger_can_cancel(trip, now_utc=now_utc):
-                trip["status"] = "cancelled_by_passenger"
-                trip["cancellation_reason"] = "free_passenger_cancel"
-                trip["cancellation_fee_xof"] = 0
-                trip["platform_commission_xof"] = 0
-                trip["driver_earnings_xof"] = 0
-                st.success("Trip cancelled with no fee (4+ hours in advance).")
-            else:
-                trip = apply_passenger_cancellation(trip)
-                st.warning(
-                    f"Trip cancelled less than 4 hours before. "
-                    f"A fee of {trip['cancellation_fee_xof']:,.0f} XOF applies."
-                )
-
-            trips_list[chosen_idx] = trip
-            _write_json(TRIPS_PATH, trips_list)
-    else:
+@st.fragment
+def my_trips_section():
+    st.markdown("---")
+    st.subheader("🗓️ My scheduled trips (demo view)")
+
+    message = flash("cancel_message")
+    if message:
+        getattr(st, message[0])(message[1])
+
+    df_sched, sched_by_id = scheduled_trips()
+    if df_sched.empty:
         st.info("No scheduled trips.")
-else:
-    st.info("No trips found.")
+        return
+
+    st.dataframe(with_datetimes(df_sched.copy()))
+
+    trip_ids = df_sched.index.tolist()
+    chosen_id = st.selectbox("Select a scheduled trip to cancel", trip_ids)
+
+    if st.button("Cancel selected trip"):
+        trip = sched_by_id[chosen_id]
+        if trip.get("status") != "scheduled":
+            flash("cancel_message", ("info", "This trip is already cancelled."))
+            rerun_section()
+
+        # The rewrite runs in the job worker when one is up (jobs.py)
+        job = submit("cancel_trip", {"trip_id": trip.get("trip_id"), "by": "passenger"})
+        if job["status"] == "failed":
+            flash("cancel_message", ("error", "The cancellation failed, please try again."))
+        elif job["status"] == "done":
+            fee = job["result"].get("cancellation_fee_xof") or 0
+            if fee:
+                flash("cancel_message", (
+                    "warning",
+                    f"Trip cancelled less than 4 hours before. A fee of {fee:,.0f} XOF applies.",
+                ))
+            else:
+                flash("cancel_message", ("success", "Trip cancelled with no fee (4+ hours in advance)."))
+        elif passenger_can_cancel(trip, now_utc=datetime.utcnow()):
+            flash("cancel_message", ("success", "Cancellation submitted: no fee (4+ hours in advance)."))
+        else:
+            fee = round(int(trip.get("price_xof") or 0) * PASSENGER_LATE_CANCEL_PCT)
+            flash("cancel_message", (
+                "warning",
+                f"Cancellation submitted less than 4 hours before. A fee of {fee:,.0f} XOF applies.",
+            ))
+        rerun_section()
+
+
+@st.fragment
+def rate_section():
+    st.markdown("---")
+    st.subheader("⭐ Rate your driver")
+
+    message = flash("rating_message")
+    if message:
+        getattr(st, message[0])(message[1])
+
+    to_rate = trips_to_rate()
+    if not to_rate:
+        st.info("No completed trips to rate.")
+        return
+
+    chosen_id = st.selectbox(
+        "Completed trip",
+        list(to_rate),
+        format_func=lambda trip_id: f"{trip_id[:8]} · {to_rate[trip_id].get('driver_username')} · "
+                                    f"{to_rate[trip_id].get('city')}",
+        key="rate_trip_id",
+    )
+    stars = st.slider("Stars", min_value=1, max_value=5, value=5, key="rate_stars")
+
+    if st.button("Submit rating"):
+        # the trip keeps the rating, so a second submit does not count twice
+        driver = rate_trip(chosen_id, stars)
+        if driver is None:
+            flash("rating_message", ("info", "This trip was already rated."))
+        else:
+            flash("rating_message", (
+                "success", f"Thank you! {driver['username']} is now rated {driver['rating']:.2f}.",
+            ))
+        rerun_section()
+
+
+quote_section()
+trip_time_section()
+driver_section()
+confirm_section()
+my_trips_section()
+rate_section()
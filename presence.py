@@ -0,0 +1,263 @@
+"""
+Driver presence: heartbeats, automatic Offline after a TTL, and live driver
+counters per status and city.
+
+- The driver app calls `heartbeat(username)` every HEARTBEAT_SECONDS while a
+  driver is logged in. Heartbeats are appended to data/heartbeats.log (not to
+  the event log, so they do not invalidate snapshots); an Offline driver
+  sending one comes back as Available.
+- `PresenceTracker` tails the heartbeat log and keeps a heap of
+  (expiry deadline, username). `sweep()` pops the expired entries and sets
+  those drivers to Offline in one batched update (update_drivers_in_db), so
+  the changes are normal `driver_status_changed` events. Sweeps run in the
+  job worker (`presence_sweep`, jobs.py), never on a dashboard request.
+- Counters per status and per (city, status) are updated from the driver
+  events in the log, so the dashboards read counters instead of scanning
+  the drivers.
+
+Without the job worker, expiry can run on its own:
+
+    python presence.py --loop
+"""
+import argparse
+import heapq
+import os
+import threading
+import time
+
+from core.shared import (
+    DATA_DIR,
+    read_events,
+    update_driver_in_db,
+    update_drivers_in_db,
+    find_driver,
+)
+from core.config import ensure_data_dir
+from core.schema import DRIVER_STATUSES, now_ms
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process demo, no locking
+    fcntl = None
+
+HEARTBEATS_PATH = os.path.join(DATA_DIR, "heartbeats.log")
+HEARTBEAT_SECONDS = 15
+PRESENCE_TTL_SECONDS = 60
+HEARTBEAT_LOG_MAX_BYTES = 4 << 20
+
+AVAILABLE, ON_TRIP, OFFLINE = DRIVER_STATUSES
+
+
+# ----------------------------
+# HEARTBEATS (driver side)
+# ----------------------------
+def heartbeat(username, status=None):
+    """
+    Records that `username` is online. `status` is the driver's current
+    status if the caller knows it (saves a lookup); Offline drivers are
+    switched back to Available.
+    """
+    ensure_data_dir()
+    try:
+        with open(HEARTBEATS_PATH, "a+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0, os.SEEK_END)
+            if f.tell() > HEARTBEAT_LOG_MAX_BYTES:
+                f.truncate(0)  # trackers notice the shrink and start over
+            f.write(f"{now_ms()} {username}\n".encode("utf-8"))
+    except OSError:
+        return
+    if status is None:
+        driver = find_driver(username)
+        status = driver.get("status") if driver else None
+    if status == OFFLINE:
+        update_driver_in_db(username, {"status": AVAILABLE})
+
+
+def read_heartbeats(offset=0):
+    """
+    [(ts_ms, username)] after byte `offset`, and the new offset.
+    """
+    if not os.path.exists(HEARTBEATS_PATH):
+        return [], 0
+    with open(HEARTBEATS_PATH, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() < offset:
+            offset = 0
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b"\n")
+    if end < 0:
+        return [], offset
+    beats = []
+    for line in chunk[:end].decode("utf-8", "ignore").splitlines():
+        ts, _, username = line.partition(" ")
+        if username:
+            beats.append((int(ts), username))
+    return beats, offset + end + 1
+
+
+# ----------------------------
+# TRACKER (dashboard side)
+# ----------------------------
+class PresenceTracker:
+    """
+    Live driver counters plus TTL-based expiry.
+
+    by_status:      {status: n}
+    by_city_status: {city: {status: n}}
+    """
+
+    def __init__(self, ttl_seconds=PRESENCE_TTL_SECONDS):
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.status = {}
+        self.city = {}
+        self.by_status = {}
+        self.by_city_status = {}
+        self.last_seen = {}
+        self._heap = []
+        self.event_offset = 0
+        self.heartbeat_offset = 0
+
+    @classmethod
+    def build(cls, ttl_seconds=PRESENCE_TTL_SECONDS):
+        """
+        Starts from the event-sourced driver state. Drivers that are online
+        but have not sent a heartbeat get one TTL of grace.
+        """
+        from driver_state import get_driver_state
+
+        tracker = cls(ttl_seconds)
+        state = get_driver_state()
+        tracker.event_offset = state.offset
+        _, tracker.heartbeat_offset = read_heartbeats(0)
+        deadline = now_ms() + tracker.ttl_ms
+        for username, driver in state.drivers.items():
+            tracker._set(username, driver.get("status") or AVAILABLE, driver.get("city", ""))
+            if tracker.status[username] != OFFLINE:
+                tracker.last_seen[username] = deadline - tracker.ttl_ms
+                heapq.heappush(tracker._heap, (deadline, username))
+        return tracker
+
+    def _count(self, status, city, delta):
+        self.by_status[status] = self.by_status.get(status, 0) + delta
+        per_city = self.by_city_status.setdefault(city, {})
+        per_city[status] = per_city.get(status, 0) + delta
+
+    def _set(self, username, status, city):
+        if username in self.status:
+            self._count(self.status[username], self.city[username], -1)
+        self.status[username] = status
+        self.city[username] = city
+        self._count(status, city, 1)
+
+    def apply(self, event):
+        kind = event.get("type", "")
+        if not kind.startswith("driver_"):
+            return
+        data = event.get("data", {})
+        username = data.get("username")
+        if kind == "driver_registered":
+            self._set(username, data.get("status") or AVAILABLE, data.get("city", ""))
+            status_changed = True
+        else:
+            after = data.get("after", {})
+            if username not in self.status or not ("status" in after or "city" in after):
+                return
+            self._set(
+                username,
+                after.get("status", self.status[username]),
+                after.get("city", self.city[username]),
+            )
+            status_changed = "status" in after
+        if status_changed and self.status[username] != OFFLINE:
+            # new or back online: one TTL of grace until the first heartbeat
+            self.seen(username, now_ms())
+
+    def seen(self, username, ts_ms):
+        if ts_ms <= self.last_seen.get(username, 0):
+            return
+        self.last_seen[username] = ts_ms
+        heapq.heappush(self._heap, (ts_ms + self.ttl_ms, username))
+
+    def refresh(self):
+        """
+        Applies new driver events and heartbeats.
+        """
+        events, self.event_offset = read_events(self.event_offset)
+        for event in events:
+            self.apply(event)
+        beats, self.heartbeat_offset = read_heartbeats(self.heartbeat_offset)
+        for ts, username in beats:
+            self.seen(username, ts)
+
+    def sweep(self, now=None):
+        """
+        Sets drivers whose last heartbeat is older than the TTL to Offline.
+        Only expired heap entries are looked at. Returns their usernames.
+        """
+        now = now or now_ms()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, username = heapq.heappop(self._heap)
+            if self.last_seen.get(username, 0) + self.ttl_ms != deadline:
+                continue  # superseded by a later heartbeat
+            if self.status.get(username) not in (None, OFFLINE):
+                expired.append(username)
+        if expired:
+            update_drivers_in_db({username: {"status": OFFLINE} for username in expired})
+            self.refresh()  # count the status changes just written
+        return expired
+
+    def counts(self, city=None):
+        counts = self.by_status if city is None else self.by_city_status.get(city, {})
+        return {s: counts.get(s, 0) for s in DRIVER_STATUSES}
+
+    def n_drivers(self):
+        return len(self.status)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_presence():
+    """
+    Process-wide tracker, refreshed on every call. Expiry is left to
+    sweep_presence() (the job worker).
+    """
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = PresenceTracker.build()
+        _tracker.refresh()
+        return _tracker
+
+
+def sweep_presence():
+    """
+    Expires the drivers of the process-wide tracker. Returns the tracker.
+    """
+    tracker = get_presence()
+    with _tracker_lock:
+        tracker.sweep()
+    return tracker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expire drivers without recent heartbeats.")
+    parser.add_argument("--loop", action="store_true", help="keep sweeping every few seconds")
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    while True:
+        tracker = sweep_presence()
+        print(" ".join(f"{s}={n}" for s, n in tracker.counts().items()), flush=True)
+        if not args.loop:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
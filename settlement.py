@@ -0,0 +1,249 @@
+"""
+Weekly driver settlement.
+
+A settlement run closes weeks (Monday 00:00 UTC to the next Monday, by trip
+created_at) and writes one statement file per week to
+data/settlements/<week start>.json. For every driver with trips in the week:
+
+- gross_xof: fares of the trips that were not cancelled
+- commission_pct / commission_xof: the tier reached with that many trips in
+  the week (get_commission_pct), applied to the gross
+- penalties_xof: driver cancellation penalties (cancellation_fee_xof of the
+  trips the driver cancelled)
+- net_payout_xof = gross - commission - penalties
+
+Every city shard is reduced to per-(week, driver) sums by one pandas groupby,
+in the aggregation process pool once the shards are big enough, for all the
+weeks of a run at once. Tiers and payouts are then computed for all drivers
+with numpy. Statement files are created once and never rewritten: weeks that
+already have one are skipped, and weeks that have not ended are not settled.
+
+    python settlement.py run                     # every ended week not settled yet
+    python settlement.py run --week 2026-10-05
+    python settlement.py show --driver amadou
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from core.shared import (
+    COMMISSION_TIERS,
+    DATA_DIR,
+    encode_records,
+    load_drivers_from_db,
+    read_shard,
+    _read_json,
+)
+from aggregation import map_shards, merge_partials
+from commission_sim import tier_pct
+from core.schema import WEEK_MS, from_epoch_ms, now_ms, to_epoch_ms, week_start_ms
+
+SETTLEMENTS_DIR = os.path.join(DATA_DIR, "settlements")
+
+SUM_FIELDS = ("trips", "cancelled_by_driver", "gross_xof", "penalties_xof")
+STATEMENT_COLUMNS = [
+    "week_start", "week_end", "trips", "cancelled_by_driver", "gross_xof",
+    "commission_pct", "commission_xof", "penalties_xof", "net_payout_xof",
+]
+
+
+def week_label(start_ms):
+    return from_epoch_ms(start_ms).date().isoformat()
+
+
+def statement_path(start_ms):
+    return os.path.join(SETTLEMENTS_DIR, f"{week_label(start_ms)}.json")
+
+
+# ----------------------------
+# PER-SHARD REDUCER (runs in workers)
+# ----------------------------
+def _shard_partial(path, start_ms, end_ms):
+    """
+    {week start ms: {driver: {field: sum}}} over the shard's assigned trips
+    created in [start_ms, end_ms).
+    """
+    df = pd.DataFrame.from_records(
+        read_shard(path),
+        columns=["driver_username", "created_at", "status", "price_xof", "cancellation_fee_xof"],
+    )
+    if df.empty:
+        return {}
+    created = df["created_at"].fillna(0).to_numpy(np.int64)
+    df = df[(df["driver_username"].fillna("") != "") & (created >= start_ms) & (created < end_ms)]
+    if df.empty:
+        return {}
+
+    status = df["status"].astype(str)
+    cancelled = status.str.startswith("cancelled").to_numpy()
+    by_driver = (status == "cancelled_by_driver").to_numpy()
+    sums = pd.DataFrame({
+        "week": week_start_ms(df["created_at"].to_numpy(np.int64)),
+        "driver": df["driver_username"].to_numpy(),
+        "trips": (~cancelled).astype(np.int64),
+        "cancelled_by_driver": by_driver.astype(np.int64),
+        "gross_xof": np.where(cancelled, 0, df["price_xof"].to_numpy(np.int64)),
+        "penalties_xof": np.where(by_driver, df["cancellation_fee_xof"].to_numpy(np.int64), 0),
+    }).groupby(["week", "driver"]).sum()
+
+    out = {}
+    for (week, driver), row in zip(sums.index, sums.to_dict("records")):
+        out.setdefault(int(week), {})[driver] = {k: int(v) for k, v in row.items()}
+    return out
+
+
+# ----------------------------
+# STATEMENTS
+# ----------------------------
+def build_statement(start_ms, per_driver, drivers=None, tiers=None):
+    """
+    Statement of one week from {driver: {field: sum}}: tiers, commission and
+    payouts for all drivers at once.
+    """
+    tiers = tiers or COMMISSION_TIERS
+    drivers = drivers or {}
+    usernames = sorted(per_driver)
+    cols = {f: np.array([per_driver[u].get(f, 0) for u in usernames], dtype=np.int64) for f in SUM_FIELDS}
+    pct = tier_pct(cols["trips"], tiers) if usernames else np.empty(0, np.int64)
+    commission = np.rint(cols["gross_xof"] * pct / 100).astype(np.int64)
+    net = cols["gross_xof"] - commission - cols["penalties_xof"]
+
+    statements = {}
+    for i, username in enumerate(usernames):
+        statements[username] = {
+            "city": drivers.get(username, {}).get("city", ""),
+            **{f: int(cols[f][i]) for f in SUM_FIELDS},
+            "commission_pct": int(pct[i]),
+            "commission_xof": int(commission[i]),
+            "net_payout_xof": int(net[i]),
+        }
+    return {
+        "week_start": week_label(start_ms),
+        "week_end": week_label(start_ms + WEEK_MS),
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "commission_tiers": [list(t) for t in tiers],
+        "totals": {
+            "drivers": len(usernames),
+            **{f: int(cols[f].sum()) for f in SUM_FIELDS},
+            "commission_xof": int(commission.sum()),
+            "net_payout_xof": int(net.sum()),
+        },
+        "drivers": statements,
+    }
+
+
+def _create_once(path, data):
+    """
+    Writes `data` to `path` unless it exists (atomically, also against a
+    concurrent run). Returns whether it was written.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode_records(data))
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp, path)
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        os.remove(tmp)
+
+
+def _first_trip_ms():
+    from snapshot import get_snapshot
+
+    min_date = get_snapshot().aggregates["facets"].get("min_date")
+    return to_epoch_ms(min_date) if min_date else None
+
+
+def settle(weeks=None, now=None):
+    """
+    Writes the statements of `weeks` (epoch ms within each week; default:
+    every ended week since the first trip) that are not settled yet. Returns the
+    paths written.
+    """
+    current = int(week_start_ms(now or now_ms()))
+    if weeks is None:
+        first = _first_trip_ms()
+        weeks = range(int(week_start_ms(first)), current, WEEK_MS) if first is not None else []
+    todo = sorted({int(week_start_ms(w)) for w in weeks})
+    todo = [w for w in todo if w < current and not os.path.exists(statement_path(w))]
+    if not todo:
+        return []
+
+    per_week = merge_partials(map_shards(_shard_partial, "trips", None, todo[0], todo[-1] + WEEK_MS))
+    drivers = {d.get("username"): d for d in load_drivers_from_db()}
+    written = []
+    for week in todo:
+        path = statement_path(week)
+        if _create_once(path, build_statement(week, per_week.get(week, {}), drivers)):
+            written.append(path)
+    return written
+
+
+# ----------------------------
+# READ
+# ----------------------------
+_statements = {}  # path -> statement; the files never change
+
+
+def settled_weeks():
+    """
+    Week start labels ("YYYY-MM-DD") with a statement file, newest first.
+    """
+    if not os.path.isdir(SETTLEMENTS_DIR):
+        return []
+    return sorted((f[:-5] for f in os.listdir(SETTLEMENTS_DIR) if f.endswith(".json")), reverse=True)
+
+
+def load_statement(label):
+    path = os.path.join(SETTLEMENTS_DIR, f"{label}.json")
+    statement = _statements.get(path)
+    if statement is None:
+        statement = _statements[path] = _read_json(path) or {}
+    return statement
+
+
+def driver_statements(username):
+    """
+    DataFrame of the driver's weekly statements, newest first.
+    """
+    rows = []
+    for label in settled_weeks():
+        statement = load_statement(label)
+        row = statement.get("drivers", {}).get(username)
+        if row is not None:
+            rows.append({"week_start": statement["week_start"], "week_end": statement["week_end"], **row})
+    return pd.DataFrame(rows, columns=STATEMENT_COLUMNS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Weekly driver settlement.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="settle ended weeks that have no statement yet")
+    run.add_argument("--week", action="append", default=[],
+                     help="a date in the week to settle, YYYY-MM-DD (repeatable)")
+    show = sub.add_parser("show", help="print a driver's statements")
+    show.add_argument("--driver", required=True)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        started = time.perf_counter()
+        written = settle([to_epoch_ms(w) for w in args.week] or None)
+        for path in written:
+            print(f"wrote {path}")
+        print(f"{len(written)} week(s) settled in {time.perf_counter() - started:.2f}s")
+    elif args.command == "show":
+        df = driver_statements(args.driver)
+        print(df.to_string(index=False) if not df.empty else f"no statements for {args.driver}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Shared, memory-mapped snapshot of typed trip columns and precomputed aggregates.
+
+The four apps run as separate processes. Instead of each of them parsing the
+JSON shards and recomputing the same aggregates, one process writes
+data/snapshot.bin whenever the trips change, and every app maps it read-only.
+Column arrays are zero-copy views into the mapping, so the pages are shared
+through the OS page cache and adding app instances does not add copies of the
+data.
+
+File layout:
+    MAGIC | uint64 header length | JSON header | padding | column blocks
+
+The header holds the trip version, the event log offset the snapshot was
+built at, the row count, each column's dtype / offset / length (and
+categories for dictionary-encoded string columns) and the precomputed
+aggregates.
+
+The version only moves with trip events: driver status changes and presence
+heartbeats do not make the snapshot stale. Event-sourced readers (live
+aggregates, leaderboard, ...) tail the log from `Snapshot.offset`, so they
+still see every driver event written since the build.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+import pandas as pd
+
+from core.config import ensure_data_dir
+from core.shared import DATA_DIR, EVENTS_PATH, _wal, iter_records, events_end_offset
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, last writer wins
+    fcntl = None
+
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "snapshot.bin")
+SNAPSHOT_LOCK_PATH = os.path.join(DATA_DIR, "snapshot.lock")
+
+MAGIC = b"MRSNAP4\0"  # bumped when the column set changes
+ALIGN = 64
+
+INT_COLUMNS = [
+    "created_at",
+    "scheduled_for",
+    "price_xof",
+    "price_before_discount_xof",
+    "discount_xof",
+    "platform_commission_xof",
+    "driver_earnings_xof",
+    "cancellation_fee_xof",
+    "platform_pct",
+]
+FLOAT_COLUMNS = ["pickup_lat", "pickup_lon", "drop_lat", "drop_lon", "distance_miles"]
+CATEGORY_COLUMNS = [
+    "city",
+    "pickup_neighborhood",
+    "status",
+    "driver_username",
+    "routing_provider",
+    "promo_code",
+    "referral_code",
+    "client_app",
+    "route_summary",
+]
+
+MISSING_INT = -1  # scheduled_for may be None
+
+
+_TRIP_EVENT = b'"type": "trip_'
+
+# (log offset scanned up to, end offset of the last trip event before it)
+_scanned = (0, 0)
+
+
+def _last_trip_event_end(chunk):
+    """
+    End offset, within `chunk` (complete lines), of its last trip event, or
+    None.
+    """
+    pos = len(chunk)
+    while True:
+        pos = chunk.rfind(_TRIP_EVENT, 0, pos)
+        if pos < 0:
+            return None
+        start = chunk.rfind(b"\n", 0, pos) + 1
+        end = chunk.find(b"\n", pos) + 1
+        try:
+            if json.loads(chunk[start:end]).get("type", "").startswith("trip_"):
+                return end
+        except ValueError:
+            pass
+        pos = start
+
+
+def store_version():
+    """
+    End offset of the last trip event in the log: the trip shards only
+    change together with one. Only the bytes appended since the last call
+    are scanned; a process starts from the offsets of the snapshot on disk.
+    """
+    global _scanned
+    scanned, version = _scanned
+    end = events_end_offset()
+    if scanned == 0 or end < scanned:
+        scanned, version = _read_offsets(SNAPSHOT_PATH) or (0, 0)
+        if end < scanned:  # log was truncated/rotated
+            scanned, version = 0, 0
+    if end > scanned:
+        with open(EVENTS_PATH, "rb") as f:
+            f.seek(scanned)
+            chunk = f.read(end - scanned)
+        chunk = chunk[:chunk.rfind(b"\n") + 1]  # an append may be in flight
+        last = _last_trip_event_end(chunk)
+        if last is not None:
+            version = scanned + last
+        scanned += len(chunk)
+    _scanned = (scanned, version)
+    return version
+
+
+# ----------------------------
+# BUILD
+# ----------------------------
+def _collect_columns():
+    ints = {c: [] for c in INT_COLUMNS}
+    floats = {c: [] for c in FLOAT_COLUMNS}
+    cats = {c: [] for c in CATEGORY_COLUMNS}
+    for chunk in iter_records("trips", chunk_size=50_000):
+        df = pd.DataFrame.from_records(chunk)
+        for c in INT_COLUMNS:
+            ints[c].append(df[c].fillna(MISSING_INT).to_numpy(np.int64))
+        for c in FLOAT_COLUMNS:
+            floats[c].append(df[c].to_numpy(np.float64, na_value=np.nan))
+        for c in CATEGORY_COLUMNS:
+            cats[c].append(df[c].to_numpy(object))
+
+    columns = {}
+    for c, parts in ints.items():
+        columns[c] = (np.concatenate(parts) if parts else np.empty(0, np.int64), None)
+    for c, parts in floats.items():
+        columns[c] = (np.concatenate(parts) if parts else np.empty(0, np.float64), None)
+    for c, parts in cats.items():
+        values = np.concatenate(parts) if parts else np.empty(0, object)
+        codes, categories = pd.factorize(values, sort=True)
+        columns[c] = (codes.astype(np.int32), [str(x) for x in categories])
+    return columns
+
+
+def _columns_frame(columns):
+    """
+    DataFrame over {name: (array, categories)} (categoricals for string
+    columns).
+    """
+    data = {}
+    for name, (arr, cats) in columns.items():
+        data[name] = pd.Categorical.from_codes(arr, cats) if cats is not None else arr
+    return pd.DataFrame(data)
+
+
+def build_snapshot(path=None):
+    """
+    Writes a fresh snapshot atomically (temp file + rename) and returns its
+    version.
+    """
+    path = path or SNAPSHOT_PATH
+    from aggregation import (driver_aggregates, finish_aggregates, frame_facets, frame_partial,
+                             make_filters, with_date_only)
+
+    while True:
+        offset = events_end_offset()
+        version = store_version()
+        columns = _collect_columns()
+        # a write logged after `offset` may already be in the columns, and
+        # readers tailing from `offset` would count it twice: read again
+        with _wal.settled():
+            if events_end_offset() == offset:
+                break
+    n_rows = len(next(iter(columns.values()))[0]) if columns else 0
+
+    # the aggregates come from the collected columns: the shards are parsed once
+    trips = {}
+    facets = {}
+    if n_rows:
+        df = with_date_only(_columns_frame(columns))
+        trips = finish_aggregates(frame_partial(df, make_filters()))
+        facets = frame_facets(df)
+
+    header = {
+        "version": version,
+        "offset": offset,
+        "n_rows": n_rows,
+        "aggregates": {
+            "trips": trips,
+            "facets": facets,
+            "drivers": driver_aggregates(),
+        },
+        "columns": {},
+    }
+    offset = 0
+    for name, (arr, categories) in columns.items():
+        header["columns"][name] = {
+            "dtype": arr.dtype.str,
+            "offset": offset,
+            "nbytes": arr.nbytes,
+            "categories": categories,
+        }
+        offset += -(-arr.nbytes // ALIGN) * ALIGN
+
+    header_bytes = json.dumps(header, ensure_ascii=False, default=str).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, (arr, _) in columns.items():
+            f.seek(data_start + header["columns"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+    return version
+
+
+# ----------------------------
+# READ
+# ----------------------------
+class Snapshot:
+    """
+    Read-only view of a snapshot file. Column arrays point into the mapping.
+    """
+
+    def __init__(self, path=None):
+        path = path or SNAPSHOT_PATH
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        (header_len,) = struct.unpack_from("<Q", self._mm, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mm[start:start + header_len].decode("utf-8"))
+        self._data_start = -(-(start + header_len) // ALIGN) * ALIGN
+        self.version = self.header["version"]
+        self.offset = self.header["offset"]
+        self.n_rows = self.header["n_rows"]
+        self.aggregates = self.header["aggregates"]
+
+    def column(self, name):
+        meta = self.header["columns"][name]
+        dtype = np.dtype(meta["dtype"])
+        return np.frombuffer(
+            self._mm, dtype=dtype, count=meta["nbytes"] // dtype.itemsize,
+            offset=self._data_start + meta["offset"],
+        )
+
+    def categories(self, name):
+        return self.header["columns"][name]["categories"]
+
+    def code_of(self, name, value):
+        """
+        Integer code of `value` in a dictionary-encoded column, or -1.
+        """
+        cats = self.categories(name)
+        try:
+            return cats.index(value)
+        except ValueError:
+            return -1
+
+    def frame(self, columns=None):
+        """
+        DataFrame over the mapped columns (categoricals for string columns).
+        """
+        names = columns or list(self.header["columns"])
+        return _columns_frame({name: (self.column(name), self.categories(name)) for name in names})
+
+
+_current = None
+
+
+_HEAD = re.compile(rb'^\{"version": (\d+), "offset": (\d+)')
+
+
+def _read_offsets(path):
+    """
+    (offset, version) from the header of the snapshot at `path`, or None.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                return None
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            # version and offset are the first keys of the header
+            m = _HEAD.match(f.read(min(header_len, 96)))
+    except (OSError, struct.error):
+        return None
+    return (int(m.group(2)), int(m.group(1))) if m else None
+
+
+def _read_version(path):
+    offsets = _read_offsets(path)
+    return offsets[1] if offsets else None
+
+
+def get_snapshot(stale_ok=False):
+    """
+    The snapshot for the current trip version. Only one process rebuilds a
+    stale snapshot (under a file lock); the others wait and map the result.
+
+    With `stale_ok`, a page does not wait for the rebuild while the job
+    worker is up: the rebuild is queued (jobs.py) and the last snapshot is
+    returned meanwhile. Event-sourced readers stay exact, since they replay
+    the log from the snapshot's own offset.
+    """
+    global _current
+    version = store_version()
+    if _current is not None and _current.version == version:
+        return _current
+
+    if stale_ok and _read_version(SNAPSHOT_PATH) not in (None, version):
+        from jobs import enqueue, worker_alive
+
+        if worker_alive():
+            enqueue("snapshot")
+            if _current is None or _current.version != _read_version(SNAPSHOT_PATH):
+                _current = Snapshot(SNAPSHOT_PATH)
+            return _current
+
+    if _read_version(SNAPSHOT_PATH) != version:
+        ensure_data_dir()
+        with open(SNAPSHOT_LOCK_PATH, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if _read_version(SNAPSHOT_PATH) != store_version():
+                build_snapshot()
+
+    _current = Snapshot(SNAPSHOT_PATH)
+    return _current
+
+
+def snapshot_trip_aggregates(cities=None, start_date=None, end_date=None, providers=None, stale_ok=False):
+    """
+    Same result as aggregation.trip_aggregates, computed from the mapped
+    columns (no JSON parsing). Unfiltered requests return the precomputed
+    aggregates directly.
+    """
+    from aggregation import make_filters, frame_partial, finish_aggregates, with_date_only
+
+    snap = get_snapshot(stale_ok)
+    filters = make_filters(cities, start_date, end_date, providers)
+    if not any(filters.values()):
+        return snap.aggregates["trips"]
+    if snap.n_rows == 0:
+        return {}
+    df = with_date_only(snap.frame())
+    return finish_aggregates(frame_partial(df, filters))
@@ -0,0 +1,72 @@
+"""
+The tests run against a temporary data directory (core.config), emptied
+before every test that takes the `store` fixture. Tests of modules built on
+numpy / pandas are skipped when those are not installed.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import configure  # noqa: E402
+
+DATA_DIR = tempfile.mkdtemp(prefix="mali_tests_")
+configure(DATA_DIR)
+
+# process-wide views built from the store, dropped with it
+SINGLETONS = {
+    "demand_grid": "_grid",
+    "driver_search": "_index",
+    "driver_state": "_state",
+    "leaderboard": "_leaderboard",
+    "presence": "_tracker",
+    "sketches": "_sketches",
+    "snapshot": "_current",
+}
+
+
+@pytest.fixture
+def store():
+    """
+    core.shared on an empty store.
+    """
+    from core import shared
+
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    os.makedirs(DATA_DIR)
+    shared._recovered = False
+    shared._schema_checked = False
+    shared._wal._cache = (None, 0, {})
+    shared._trip_shard_cache.clear()
+    for module, name in SINGLETONS.items():
+        if module in sys.modules:
+            setattr(sys.modules[module], name, None)
+    if "snapshot" in sys.modules:
+        sys.modules["snapshot"]._scanned = (0, 0)
+    yield shared
+
+
+def make_trip(**fields):
+    trip = {
+        "city": "Bamako",
+        "price_xof": 2000,
+        "platform_pct": 10,
+        "driver_pct": 90,
+        "platform_commission_xof": 200,
+        "driver_earnings_xof": 1800,
+        "status": "scheduled",
+        "created_at": 1_700_000_000_000,
+    }
+    trip.update(fields)
+    return trip
+
+
+def make_driver(username, **fields):
+    driver = {"username": username, "first_name": "Awa", "last_name": "Traoré", "city": "Bamako",
+              "transport_type": "Moto", "status": "Available"}
+    driver.update(fields)
+    return driver
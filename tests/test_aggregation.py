@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from conftest import make_driver, make_trip  # noqa: E402
+
+from aggregation import driver_aggregates, merge_partials, trip_aggregates, trip_facets  # noqa: E402
+
+T0 = 1_700_000_000_000  # 2023-11-14
+
+
+def test_merge_partials():
+    merged = merge_partials([
+        {"n": 1, "by_city": {"Bamako": {"trips": 2}}, "min_date": "2023-11-14", "max_date": "2023-11-14"},
+        {"n": 2, "by_city": {"Bamako": {"trips": 1}, "Kayes": {"trips": 4}}, "min_date": "2023-11-10",
+         "max_date": "2023-11-12", "skip": None},
+        None,
+    ])
+    assert merged == {
+        "n": 3,
+        "by_city": {"Bamako": {"trips": 3}, "Kayes": {"trips": 4}},
+        "min_date": "2023-11-10",
+        "max_date": "2023-11-14",
+    }
+
+
+def test_trip_aggregates_across_shards(store):
+    store.save_trip_to_db(make_trip(trip_id="a", promo_code="MALI10", discount_xof=200,
+                                    price_before_discount_xof=2200))
+    store.save_trip_to_db(make_trip(trip_id="b", city="Kayes", price_xof=3000, driver_username="drv1",
+                                    routing_provider="osrm", created_at=T0 + 86_400_000))
+    store.save_driver_to_db(make_driver("drv1"))
+
+    agg = trip_aggregates()
+    assert (agg["n_trips"], agg["gross_xof"]) == (2, 5000)
+    assert agg["by_city"]["Kayes"] == {"trips_count": 1, "total_revenue_xof": 3000, "avg_fare_xof": 3000}
+    assert agg["by_promo"]["MALI10"]["avg_discount_per_trip_xof"] == 200
+    assert list(agg["by_driver"]) == ["drv1"]
+    assert agg["by_day"]["2023-11-15"]["trips_count"] == 1
+
+    assert trip_aggregates(cities=["Bamako"])["n_trips"] == 1
+    assert trip_aggregates(providers=["osrm"])["gross_xof"] == 3000
+    assert trip_aggregates(start_date="2023-11-15")["by_city"].keys() == {"Kayes"}
+    assert trip_aggregates(cities=["Sikasso"]) == {}
+
+    facets = trip_facets()
+    assert facets["city"] == {"Bamako": 1, "Kayes": 1}
+    assert (facets["min_date"], facets["max_date"]) == ("2023-11-14", "2023-11-15")
+    assert driver_aggregates() == {"n_drivers": 1, "by_status": {"Available": 1}}
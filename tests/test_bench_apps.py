@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import bench_apps  # noqa: E402
+
+
+def test_failed_steps_make_the_run_fail(tmp_path, monkeypatch, capsys):
+    report = {"rev": "abc", "date": "2026-01-01T00:00:00", "python": "3", "results": [
+        {"app": "passenger", "trips": 1000, "peak_rss_mb": 100, "steps": [
+            {"step": "first run", "seconds": 0.1, "error": None},
+            {"step": "cancel trip", "seconds": 0.1, "error": "StreamlitAPIException: scope"},
+        ]},
+        {"app": "admin", "trips": 1000, "peak_rss_mb": None, "steps": [], "error": "ImportError: x"},
+    ]}
+    monkeypatch.setattr(bench_apps, "run_benchmarks", lambda sizes, apps, keep: report)
+
+    with pytest.raises(SystemExit) as e:
+        bench_apps.main(["--sizes", "1000", "--output", str(tmp_path / "r.json")])
+    assert e.value.code == 1
+    err = capsys.readouterr().err
+    assert "1,000 trips, passenger, cancel trip: StreamlitAPIException" in err
+    assert "1,000 trips, admin: ImportError" in err
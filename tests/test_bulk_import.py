@@ -0,0 +1,82 @@
+import json
+from importlib.util import find_spec
+
+import pytest
+
+from bulk_import import clean_trip, import_file
+from events import LiveAggregates
+
+CSV = (
+    "trip_id,created_at,city,price_xof,status,pickup_lat,pickup_lon\n"
+    "a,1700000000,Bamako,1 500 FCFA,done,,\n"
+    "b,1700000100,Bamako,2000,booked,,\n"
+)
+
+# blank city fields are filled by geofence.py, which needs numpy
+needs_numpy = pytest.mark.skipif(find_spec("numpy") is None, reason="numpy not installed")
+
+
+@pytest.fixture
+def trips_csv(tmp_path):
+    path = tmp_path / "trips.csv"
+    path.write_text(CSV, encoding="utf-8")
+    return path
+
+
+def test_clean_trip_fixes_export_quirks():
+    trip = clean_trip({"created_at": "1700000000", "price_xof": "1 500 FCFA", "status": "Canceled by rider"})
+    assert trip["created_at"] == 1_700_000_000_000
+    assert trip["price_xof"] == "1500"
+    assert trip["status"] == "cancelled_by_passenger"
+
+
+@needs_numpy
+def test_reimport_neither_duplicates_nor_double_counts(store, trips_csv):
+    live = LiveAggregates()
+    import_file("trips", str(trips_csv))
+    import_file("trips", str(trips_csv))
+    live.refresh()
+
+    assert sorted(t["trip_id"] for t in store.load_trips_from_db()) == ["a", "b"]
+    assert live.n_trips == 2
+    assert live.totals["gross_xof"] == 3500
+
+
+@needs_numpy
+def test_reimport_with_new_city_moves_and_logs(store, trips_csv, tmp_path):
+    import_file("trips", str(trips_csv))
+    moved = tmp_path / "moved.csv"
+    moved.write_text(CSV.replace("a,1700000000,Bamako", "a,1700000000,Kayes"), encoding="utf-8")
+    live = LiveAggregates()
+    live.refresh()
+    import_file("trips", str(moved))
+    live.refresh()
+
+    assert [t["trip_id"] for t in store.load_trips_from_db(cities=["Kayes"])] == ["a"]
+    assert [t["trip_id"] for t in store.load_trips_from_db(cities=["Bamako"])] == ["b"]
+    assert live.trips_by_city == {"Bamako": 1, "Kayes": 1}
+
+
+@needs_numpy
+def test_rejects_are_reported(store, tmp_path):
+    path = tmp_path / "trips.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"city": "Bamako", "price_xof": 1000}),  # no created_at
+        "not json",
+        json.dumps({"created_at": 1700000000, "city": "Bamako", "price_xof": 1000, "status": "weird"}),
+        json.dumps({"created_at": 1700000000, "city": "Bamako", "price_xof": 1000}),
+    ]), encoding="utf-8")
+    report = import_file("trips", str(path))
+
+    assert (report.read, report.imported, report.rejected) == (4, 1, 3)
+    with open(report.rejects_path, encoding="utf-8") as f:
+        assert [json.loads(line)["line"] for line in f] == [1, 2, 3]
+
+
+def test_duplicate_driver_usernames_are_rejected(store, tmp_path):
+    path = tmp_path / "drivers.jsonl"
+    rows = [{"username": "drv1", "first_name": "Awa"}, {"username": "drv1", "first_name": "Ali"}]
+    path.write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    report = import_file("drivers", str(path))
+    assert (report.imported, report.rejected) == (1, 1)
+    assert [d["first_name"] for d in store.load_drivers_from_db()] == ["Awa"]
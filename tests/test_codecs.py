@@ -0,0 +1,60 @@
+import zlib
+
+import pytest
+
+from conftest import make_trip
+
+RECORDS = [{"trip_id": "a", "city": "Ségou", "price_xof": 2000, "pickup_lat": 13.4, "scheduled_for": None}]
+
+
+@pytest.fixture
+def json_store(store, monkeypatch):
+    monkeypatch.setattr(store, "STORE_FORMAT", "json")
+    monkeypatch.setattr(store, "CODECS", dict(store.CODECS))
+    return store
+
+
+def test_json_round_trip_and_detection(json_store):
+    raw = json_store.encode_records(RECORDS, "json")
+    assert json_store.detect_format(raw) == "json"
+    assert json_store.decode_records(raw) == RECORDS
+
+
+def test_msgpack_round_trip(json_store):
+    pytest.importorskip("msgpack")
+    raw = json_store.encode_records(RECORDS, "msgpack")
+    assert raw.startswith(b"MRMP\x01")
+    assert json_store.detect_format(raw) == "msgpack"
+    assert json_store.decode_records(raw) == RECORDS
+
+
+def test_registered_codec_is_detected(json_store):
+    json_store.register_codec(
+        "zjson", b"MRZ\x01",
+        lambda data: zlib.compress(json_store._json_encode(data)),
+        lambda raw: json_store._json_decode(zlib.decompress(raw)),
+    )
+    raw = json_store.encode_records(RECORDS, "zjson")
+    assert json_store.detect_format(raw) == "zjson"
+    assert json_store.decode_records(raw) == RECORDS
+
+
+def test_unknown_format_is_refused(json_store):
+    with pytest.raises(ValueError, match="unknown store format"):
+        json_store.set_store_format("yaml")
+
+
+def test_convert_store_keeps_the_data(json_store):
+    pytest.importorskip("msgpack")
+    from core.schema import convert_store
+
+    json_store.save_trip_to_db(make_trip(trip_id="t1"))
+    json_store.save_trip_to_db(make_trip(trip_id="t2", city="Kayes"))
+    before = sorted(t["trip_id"] for t in json_store.load_trips_from_db())
+
+    assert convert_store("msgpack") == {"json": 2}
+    assert all(json_store.file_format(p) == "msgpack"
+               for _, p in json_store.shard_paths("trips") if json_store.shard_exists(p))
+    json_store.save_trip_to_db(make_trip(trip_id="t3"))
+    assert sorted(t["trip_id"] for t in json_store.load_trips_from_db()) == before + ["t3"]
+    assert convert_store("json") == {"msgpack": 2}
@@ -0,0 +1,55 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from core.schema import DAY_MS, WEEK_MS  # noqa: E402
+from commission_sim import check_tiers, parse_tiers, rolling_weekly_counts, simulate, tier_pct  # noqa: E402
+
+T0 = 1_700_000_000_000
+
+
+def _brute_force(drivers, created):
+    return [sum(1 for j in range(len(drivers))
+                if drivers[j] == drivers[i] and created[i] - WEEK_MS <= created[j] <= created[i]
+                and (created[j] < created[i] or j <= i))
+            for i in range(len(drivers))]
+
+
+def test_rolling_weekly_counts_window_and_drivers():
+    drivers = [0, 0, 1, 0, 0, 1, 0]
+    created = [T0, T0 + DAY_MS, T0, T0 + WEEK_MS, T0 + WEEK_MS + 1, T0 + 3 * DAY_MS, T0 + 2 * WEEK_MS]
+    # the trip exactly 7 days before is still in the window
+    assert rolling_weekly_counts(drivers, created).tolist() == [1, 2, 1, 3, 3, 2, 3]
+
+
+def test_rolling_weekly_counts_match_brute_force():
+    rng = np.random.default_rng(11)
+    drivers = rng.integers(0, 5, 300)
+    created = T0 + rng.integers(0, 30, 300) * DAY_MS // 2
+    assert rolling_weekly_counts(drivers, created).tolist() == _brute_force(drivers.tolist(), created.tolist())
+
+
+def test_tiers():
+    tiers = parse_tiers("0:14,20:12,60:8")
+    assert tiers == [(60, 8), (20, 12), (0, 14)]
+    assert tier_pct(np.array([1, 19, 20, 59, 60, 500]), tiers).tolist() == [14, 14, 12, 12, 8, 8]
+    with pytest.raises(ValueError):
+        check_tiers([(20, 12)])
+
+
+def test_simulate_keeps_cancelled_amounts_and_prices_unassigned_at_base():
+    history = {
+        "driver": np.array([0, 0, 1]),
+        "assigned": np.array([True, True, False]),
+        "created_at": np.array([T0, T0 + 1, T0 + 2]),
+        "fare": np.array([1000, 2000, 3000]),
+        "cancelled": np.array([False, True, False]),
+        "platform_xof": np.array([0, 1500, 0]),
+        "driver_xof": np.array([0, 0, 0]),
+    }
+    pct, platform, driver = simulate([(2, 10), (0, 20)], history)
+
+    assert pct.tolist() == [20, 10, 20]
+    assert platform.tolist() == [200, 1500, 600]
+    assert driver.tolist() == [800, 0, 2400]
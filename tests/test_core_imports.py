@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import DATA_DIR
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_import import HEADLESS, HEAVY, REPO_DIR, _PROBE  # noqa: E402
+
+PYTHONPATH = os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")]))
+
+
+@pytest.mark.parametrize("module", HEADLESS)
+def test_headless_module_loads_no_heavy_package(module):
+    env = dict(os.environ, MALI_RIDE_DATA_DIR=DATA_DIR, PYTHONPATH=PYTHONPATH)
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+        cwd=REPO_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    assert json.loads(out.strip().splitlines()[-1]) == []
+
+
+def test_importing_the_core_creates_nothing(tmp_path):
+    data_dir = tmp_path / "data"
+    env = dict(os.environ, MALI_RIDE_DATA_DIR=str(data_dir), PYTHONPATH=PYTHONPATH)
+    subprocess.run([sys.executable, "-c", "import core.shared, jobs"], cwd=REPO_DIR, env=env, check=True)
+    assert not data_dir.exists()
@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from conftest import make_trip  # noqa: E402
+
+from demand_grid import FINE_RESOLUTION, DemandGrid, cell_center, cell_of, hour_of_week  # noqa: E402
+from core.schema import to_epoch_ms  # noqa: E402
+
+BAMAKO = {"pickup_lat": 12.6392, "pickup_lon": -8.0029, "drop_lat": 12.6100, "drop_lon": -7.9800}
+
+
+def test_hour_of_week_starts_monday_utc():
+    assert hour_of_week(to_epoch_ms("2023-11-13T00:30:00")) == 0
+    assert hour_of_week(to_epoch_ms("2023-11-14T22:13:20")) == 24 + 22
+    assert hour_of_week(to_epoch_ms("2023-11-19T23:59:59")) == 167
+
+
+def test_cells_contain_their_points_and_roll_up():
+    y, x = cell_of(12.6392, -8.0029)
+    lat, lon = cell_center(y, x, FINE_RESOLUTION)
+    half = 0.5 / (1 << FINE_RESOLUTION)
+    assert abs(lat - 12.6392) <= half and abs(lon + 8.0029) <= half
+    assert cell_of(12.6392, -8.0029, FINE_RESOLUTION - 2) == (y >> 2, x >> 2)
+
+
+def test_refresh_matches_a_rebuild(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", **BAMAKO))
+    live = DemandGrid.build()
+    store.save_trip_to_db(make_trip(trip_id="t2", **BAMAKO))
+    store.save_trip_to_db(make_trip(trip_id="t3", pickup_lat=14.49, pickup_lon=-4.19))  # no drop
+    assert live.refresh() == 2
+
+    rebuilt = DemandGrid.build()
+    assert live.bins == rebuilt.bins and live.od == rebuilt.od
+    heat = live.heatmap("pickup")
+    assert heat["trips"].tolist() == [2, 1]
+    assert live.flows()["trips"].tolist() == [2]
+    assert int(live.by_hour_of_week("drop").values.sum()) == 2
@@ -0,0 +1,107 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+import dispatch  # noqa: E402
+
+
+def _full_greedy(cost):
+    """
+    Reference: cheapest pair first over the whole matrix.
+    """
+    order = np.argsort(cost, axis=None, kind="stable")
+    used_r, used_c, pairs = set(), set(), {}
+    for r, c in zip(*np.unravel_index(order, cost.shape)):
+        if r not in used_r and c not in used_c:
+            used_r.add(r)
+            used_c.add(c)
+            pairs[int(r)] = int(c)
+    return pairs
+
+
+@pytest.mark.parametrize("shape", [(5, 40), (40, 40), (60, 8), (1, 1)])
+def test_greedy_is_a_full_matching(shape):
+    rng = np.random.default_rng(7)
+    cost = rng.random(shape)
+    rows, cols = dispatch._greedy_assignment(cost, k=4)
+
+    assert len(rows) == min(shape)
+    assert len(set(rows.tolist())) == len(set(cols.tolist())) == len(rows)
+    # with every driver a candidate it is the plain cheapest-pair-first greedy
+    rows, cols = dispatch._greedy_assignment(cost, k=shape[1])
+    assert dict(zip(rows.tolist(), cols.tolist())) == _full_greedy(cost)
+
+
+def test_nearby_drivers_go_to_their_trips():
+    rng = np.random.default_rng(3)
+    trips, drivers = rng.random((30, 2)) * 50, rng.random((90, 2)) * 50
+    cost = np.hypot(*(trips[:, None, :] - drivers[None, :, :]).transpose(2, 0, 1))
+    rows, cols = dispatch._greedy_assignment(cost, k=8)
+
+    assert dict(zip(rows.tolist(), cols.tolist())) == _full_greedy(cost)
+
+
+def test_trips_whose_candidates_are_taken_get_another_round():
+    # every trip prefers the same two drivers: most need a second round
+    cost = np.full((6, 10), 50.0)
+    cost[:, :2] = 1.0
+    rows, cols = dispatch._greedy_assignment(cost, k=2)
+
+    assert sorted(rows.tolist()) == list(range(6))
+    assert len(set(cols.tolist())) == 6
+
+
+def test_solve_assignment_drops_infeasible_pairs(monkeypatch):
+    monkeypatch.setattr(dispatch, "linear_sum_assignment", None)
+    cost = np.array([[1.0, dispatch.INFEASIBLE], [dispatch.INFEASIBLE, dispatch.INFEASIBLE]])
+    rows, cols = dispatch.solve_assignment(cost)
+
+    assert rows.tolist() == [0] and cols.tolist() == [0]
+
+
+def _brute_force_matches(cost):
+    """
+    Largest number of feasible pairs any matching can make (tiny matrices).
+    """
+    from itertools import permutations
+
+    n_rows, n_cols = cost.shape
+    if n_rows > n_cols:
+        return _brute_force_matches(cost.T)
+    return max(sum(cost[r, c] < dispatch.INFEASIBLE for r, c in enumerate(perm))
+               for perm in permutations(range(n_cols), n_rows))
+
+
+def test_greedy_never_spends_drivers_on_infeasible_pairs():
+    inf = dispatch.INFEASIBLE
+    # trip 0 can only take driver 0; trip 1 prefers driver 0 but can take driver 1
+    cost = np.array([[1.0, inf, inf],
+                     [0.5, 2.0, inf],
+                     [inf, inf, inf]])
+    rows, cols = dispatch._greedy_assignment(cost, k=1)
+
+    assert all(cost[r, c] < inf for r, c in zip(rows.tolist(), cols.tolist()))
+    assert 2 not in rows.tolist()
+
+    rng = np.random.default_rng(11)
+    for _ in range(20):
+        cost = np.where(rng.random((5, 6)) < 0.5, inf, rng.random((5, 6)))
+        rows, cols = dispatch._greedy_assignment(cost, k=2)
+        feasible = int((cost[rows, cols] < inf).sum())
+        assert feasible == len(rows)
+        # greedy is a maximal matching: at least half the optimum
+        assert 2 * feasible >= _brute_force_matches(cost)
+
+
+def test_trip_is_not_given_the_wrong_vehicle():
+    now = 1_700_000_000_000
+    trip = {"trip_id": "t1", "city": "Bamako", "status": "scheduled", "driver_username": "",
+            "scheduled_for": now + 3_600_000, "created_at": now, "price_xof": 2000,
+            "pickup_lat": 12.64, "pickup_lon": -8.0, "transport_type": "Car"}
+    moto = {"username": "moto", "city": "Bamako", "transport_type": "Moto", "rating": 5.0,
+            "status": "Available", "lat": 12.64, "lon": -8.0}
+
+    assert dispatch.plan_dispatch([trip], [moto], now=now) == {}
+    car = dict(moto, username="car", transport_type="Car", lat=12.7, lon=-8.05)
+    assert list(dispatch.plan_dispatch([trip], [moto, car], now=now).values())[0]["driver_username"] == "car"
@@ -0,0 +1,58 @@
+import driver_search
+from driver_search import DriverSearch
+
+
+def _index(drivers):
+    index = DriverSearch()
+    for driver in drivers:
+        index.put(driver)
+    return index
+
+
+def _driver(username, first="Awa", last="Traoré", city="Bamako", status="Available", rating=5.0):
+    return {"username": username, "first_name": first, "last_name": last, "city": city,
+            "transport_type": "Moto", "status": status, "rating": rating}
+
+
+def _names(results):
+    return [d["username"] for d in results]
+
+
+def test_ranking_username_prefix_then_name_then_trigram():
+    index = _index([
+        _driver("kone1", first="Moussa", last="Diarra"),
+        _driver("amadou", first="Seydou", last="Keita"),
+        _driver("drv7", first="Fatou", last="Koné"),
+    ])
+    assert _names(index.search("ko")) == ["kone1", "drv7"]  # accent-folded name match second
+    assert _names(index.search("amd")) == []  # too far for a typo
+    assert _names(index.search("amadoo")) == ["amadou"]  # trigram fallback
+
+
+def test_filtered_typo_query_is_not_cut_by_the_candidate_cap(monkeypatch):
+    monkeypatch.setattr(driver_search, "MAX_TRIGRAM_CANDIDATES", 5)
+    drivers = [_driver(f"drv00042{i:03d}", city="Bamako") for i in range(50)]
+    drivers.append(_driver("drv00042x", city="Kayes"))
+    index = _index(drivers)
+
+    assert _names(index.search("dvr00042", city="Kayes")) == ["drv00042x"]
+
+
+def test_selective_filter_scans_its_slots_in_walk_order():
+    drivers = [_driver(f"drv{i:04d}", city="Kayes" if i % 97 == 0 else "Bamako",
+                       status="Offline" if i % 2 else "Available") for i in range(2_000)]
+    index = _index(drivers)
+    expected = sorted(d["username"] for d in drivers if d["city"] == "Kayes" and d["status"] == "Offline")
+
+    assert _names(index.search("", limit=100, city="Kayes", status="Offline")) == expected
+    assert _names(index.search("drv1", limit=3, city="Kayes")) == ["drv1067", "drv1164", "drv1261"]
+    # a broad filter takes the walk: same answer
+    assert _names(index.search("drv000", status="Available")) == [f"drv000{i}" for i in range(0, 10, 2)]
+
+
+def test_rating_range_and_reindex():
+    index = _index([_driver("a1", rating=4.2), _driver("a2", rating=3.1)])
+    assert _names(index.search("a", rating=(4.0, None))) == ["a1"]
+    index.put(_driver("a2", rating=4.5, city="Sikasso"))
+    assert _names(index.search("a", rating=(4.0, None), city="Sikasso")) == ["a2"]
+    assert _names(index.search("a", city="Bamako")) == ["a1"]
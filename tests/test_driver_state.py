@@ -0,0 +1,49 @@
+import os
+
+from conftest import make_driver, make_trip
+
+import driver_state
+from driver_state import audit, load_driver_state, rebuild_driver_state
+
+
+def test_replay_applies_the_business_rules(store):
+    store.save_driver_to_db(make_driver("drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="drv1"))
+    store.update_driver_in_db("drv1", {"status": "On trip"}, event_type="driver_status_changed")
+    store.cancel_trip("t1", "driver")
+
+    drivers = rebuild_driver_state().drivers
+    assert drivers["drv1"]["status"] == "On trip"
+    assert drivers["drv1"]["cancel_count"] == 1
+    assert audit() == []
+
+
+def test_cold_start_replays_only_the_tail(store, monkeypatch):
+    monkeypatch.setattr(driver_state, "SNAPSHOT_EVERY", 2)
+    state = load_driver_state()  # genesis: the empty store
+    store.save_driver_to_db(make_driver("drv1"))
+    store.save_driver_to_db(make_driver("drv2"))
+    state.refresh()  # 2 events: writes a snapshot
+    assert os.path.exists(driver_state.SNAPSHOT_PATH)
+    store.update_driver_in_db("drv2", {"status": "Offline"})
+
+    state = load_driver_state()
+    assert state.offset == store.events_end_offset()
+    assert state.drivers["drv2"]["status"] == "Offline"
+    assert len(state.history["drv2"]) == 2
+
+
+def test_genesis_keeps_drivers_older_than_the_log(store):
+    store.save_driver_to_db(make_driver("old"))
+    os.remove(store.EVENTS_PATH)  # written before the event log existed
+    store.save_driver_to_db(make_driver("new"))
+
+    assert set(rebuild_driver_state().drivers) == {"old", "new"}
+
+
+def test_audit_reports_drift(store):
+    store.save_driver_to_db(make_driver("drv1"))
+    rebuild_driver_state()  # genesis
+    store.emit_event("driver_rated", {"username": "drv1", "stars": 1})  # the shard never saw it
+
+    assert audit(rebuild_driver_state()) == [("drv1", "rating", 5.0, 1.0), ("drv1", "rating_count", 0, 1)]
@@ -0,0 +1,30 @@
+def test_read_events_offsets_and_sequence(store):
+    store.emit_events([("trip_booked", {"trip_id": "a"}), ("trip_booked", {"trip_id": "b"})])
+    events, offset = store.read_events(0)
+    assert [e["seq"] for e in events] == [1, 2]
+    assert offset == store.events_end_offset()
+
+    store.emit_event("driver_registered", {"username": "drv1"})
+    more, end = store.read_events(offset)
+    assert [(e["seq"], e["type"]) for e in more] == [(3, "driver_registered")]
+    assert store.read_events(end) == ([], end)
+
+
+def test_read_events_stops_before_a_partial_line(store):
+    store.emit_event("trip_booked", {"trip_id": "a"})
+    end = store.events_end_offset()
+    with open(store.EVENTS_PATH, "ab") as f:
+        f.write(b'{"seq": 2, "type": "trip_bo')  # an append in flight
+
+    events, offset = store.read_events(0)
+    assert len(events) == 1 and offset == end
+
+
+def test_read_events_restarts_after_truncation(store):
+    store.emit_events([("trip_booked", {"trip_id": str(i)}) for i in range(5)])
+    offset = store.events_end_offset()
+    open(store.EVENTS_PATH, "wb").close()
+    store.emit_event("trip_booked", {"trip_id": "new"})
+
+    events, _ = store.read_events(offset)
+    assert [e["data"]["trip_id"] for e in events] == ["new"]
@@ -0,0 +1,33 @@
+from conftest import make_trip
+
+from events import LiveAggregates
+
+
+def test_live_aggregates_follow_updates_moves_and_cancellations(store):
+    live = LiveAggregates()
+    store.save_trip_to_db(make_trip(trip_id="t1", city="Bamako", price_xof=2000, scheduled_for=None))
+    store.save_trip_to_db(make_trip(trip_id="t2", city="Bamako", price_xof=1500))
+    store.update_trips_in_db({"t2": {"city": "Kayes"}})
+    store.cancel_trip("t1", "passenger")
+    live.refresh()
+
+    assert live.n_trips == 2
+    assert live.trips_by_city == {"Bamako": 1, "Kayes": 1}
+    assert live.trips_by_status == {"scheduled": 1, "cancelled_by_passenger": 1}
+    assert live.totals["gross_xof"] == 3500
+
+
+def test_refresh_reads_only_new_events(store):
+    live = LiveAggregates()
+    store.save_trip_to_db(make_trip())
+    assert live.refresh() == 1
+    assert live.refresh() == 0
+    assert live.offset == store.events_end_offset()
+
+
+def test_failed_event_write_is_logged(store, monkeypatch, caplog, tmp_path):
+    monkeypatch.setattr(store, "EVENTS_PATH", str(tmp_path))  # a directory: open() fails
+    store.save_trip_to_db(make_trip(trip_id="t1"))
+
+    assert store.find_trip("t1") is not None  # the write itself stands
+    assert "1 event(s) lost: trip_booked t1" in caplog.text
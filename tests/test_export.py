@@ -0,0 +1,40 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from conftest import make_driver, make_trip  # noqa: E402
+
+from export import DRIVER_COLUMNS, TRIP_COLUMNS, export_drivers, export_trips  # noqa: E402
+
+T0 = 1_700_000_000_000  # 2023-11-14
+
+
+def _fill(store):
+    store.save_trip_to_db(make_trip(trip_id="a", routing_provider="osrm"))
+    store.save_trip_to_db(make_trip(trip_id="b", city="Kayes", created_at=T0 + 86_400_000))
+    store.save_trip_to_db(make_trip(trip_id="c", scheduled_for=None))
+
+
+def test_trips_in_chunks_with_filters(store, tmp_path):
+    _fill(store)
+    path = tmp_path / "trips.csv"
+
+    assert export_trips(str(path), chunk_size=1) == 3
+    df = pd.read_csv(path)
+    assert list(df.columns) == list(TRIP_COLUMNS)
+    assert sorted(df["trip_id"]) == ["a", "b", "c"]
+    assert df["created_at"].min() == T0
+
+    assert export_trips(str(path), cities=["Kayes"]) == 1
+    assert export_trips(str(path), start_date="2023-11-14", end_date="2023-11-14", providers=["osrm"]) == 1
+    assert pd.read_csv(path)["trip_id"].tolist() == ["a"]  # the file is replaced, not appended to
+
+
+def test_empty_export_still_has_a_header(store, tmp_path):
+    path = tmp_path / "drivers.csv"
+    assert export_drivers(str(path)) == 0
+    assert list(pd.read_csv(path).columns) == list(DRIVER_COLUMNS)
+
+    store.save_driver_to_db(make_driver("drv1", age=31))
+    assert export_drivers(str(path)) == 1
+    assert pd.read_csv(path)["age"].tolist() == [31]
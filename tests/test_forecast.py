@@ -0,0 +1,53 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from conftest import make_trip  # noqa: E402
+
+import forecast  # noqa: E402
+from core.schema import DAY_MS, to_epoch_ms  # noqa: E402
+
+MONDAY = to_epoch_ms("2023-11-13T00:00:00") // DAY_MS
+HOUR_MS = 3_600_000
+
+
+@pytest.fixture
+def history(store, monkeypatch):
+    monkeypatch.setattr(forecast, "_loaded", (None, None))
+    for day in range(MONDAY, MONDAY + 21):
+        for i in range(2):
+            store.save_trip_to_db(make_trip(trip_id=f"{day}-{i}", pickup_neighborhood="ACI 2000",
+                                            created_at=day * DAY_MS + 8 * HOUR_MS + i))
+    return store
+
+
+def _values(city=None, neighborhood=None):
+    return forecast.forecast_frame(city, neighborhood, by="hour")["forecast_trips"].to_numpy()
+
+
+def test_forecast_follows_the_daily_pattern(history):
+    assert forecast.fit(now=(MONDAY + 21) * DAY_MS) == 21
+
+    hourly = _values("Bamako", "ACI 2000").reshape(-1, 24)
+    assert hourly.shape == (forecast.HORIZON_DAYS, 24)
+    assert np.allclose(hourly[:, 8], 2, atol=0.1)
+    assert np.allclose(np.delete(hourly, 8, axis=1), 0, atol=0.1)
+    assert np.allclose(_values(), _values("Bamako"))
+    assert forecast.forecast_frame("Kayes").empty
+
+
+def test_incremental_fit_equals_a_full_fit(history):
+    forecast.fit(now=(MONDAY + 14) * DAY_MS)
+    assert forecast.fit(now=(MONDAY + 14) * DAY_MS) == 0  # nothing new
+    assert forecast.fit(now=(MONDAY + 21) * DAY_MS) == 7
+    incremental = _values("Bamako")
+
+    forecast.fit(full=True, now=(MONDAY + 21) * DAY_MS)
+    assert np.allclose(incremental, _values("Bamako"))
+
+
+def test_trips_added_to_fitted_days_refit_from_the_start(history):
+    forecast.fit(now=(MONDAY + 21) * DAY_MS)
+    history.save_trip_to_db(make_trip(trip_id="late", created_at=(MONDAY + 3) * DAY_MS))
+    assert forecast.fit(now=(MONDAY + 21) * DAY_MS) == 21
@@ -0,0 +1,62 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from conftest import make_trip  # noqa: E402
+from geofence import GeofenceIndex, _rings_inside, _rings_inside_vec, label_trips  # noqa: E402
+
+SQUARE = [(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 10.0)]
+HOLE = [(4.0, 4.0), (6.0, 4.0), (6.0, 6.0), (4.0, 6.0)]
+
+
+@pytest.mark.parametrize("lat, lon, inside", [
+    (1.0, 1.0, True),    # in the outer ring
+    (5.0, 5.0, False),   # in the hole
+    (11.0, 5.0, False),  # outside
+    (5.0, 3.0, True),    # between hole and edge
+])
+def test_even_odd_rule_with_hole(lat, lon, inside):
+    rings = [SQUARE, HOLE]
+    assert _rings_inside(rings, lat, lon) is inside
+    vec = _rings_inside_vec([np.array(r) for r in rings], np.array([lat]), np.array([lon]))
+    assert bool(vec[0]) is inside
+
+
+def test_lookup_city_centers():
+    index = GeofenceIndex.load()
+    assert index.lookup(14.4469, -11.4456)[0] == "Kayes"
+    assert index.lookup(0.0, 0.0) == ("", "")
+
+
+def test_label_trips_moves_and_logs(store):
+    kayes = {"pickup_lat": 14.4469, "pickup_lon": -11.4456, "drop_lat": 14.4469, "drop_lon": -11.4456}
+    store.save_trip_to_db(make_trip(trip_id="t1", city="Bamako", **kayes))
+    offset = store.events_end_offset()
+
+    assert label_trips() == 1
+    assert [t["trip_id"] for t in store.load_trips_from_db(cities=["Kayes"])] == ["t1"]
+    events, _ = store.read_events(offset)
+    assert events[0]["type"] == "trip_updated"
+    assert events[0]["data"]["before"]["city"] == "Bamako"
+    assert label_trips() == 0
+
+
+def test_label_skips_trips_whose_coordinates_changed(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", city="Bamako", pickup_lat=14.4469, pickup_lon=-11.4456))
+    from geofence import _if_not_moved
+
+    update = _if_not_moved(store.find_trip("t1"), {"city": "Kayes"})
+    store.update_trips_in_db({"t1": {"pickup_lat": 12.6392, "pickup_lon": -8.0029}})
+    store.update_trips_in_db({"t1": update})
+    assert store.find_trip("t1")["city"] == "Bamako"
+
+
+def test_label_keeps_stored_fields_outside_every_polygon(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", city="Bamako", pickup_neighborhood="Hamdallaye",
+                                    drop_city="Bamako", drop_neighborhood="Niarela",
+                                    pickup_lat=0.0, pickup_lon=0.0, drop_lat=0.0, drop_lon=0.0))
+
+    assert label_trips() == 0
+    trip = store.find_trip("t1")
+    assert (trip["pickup_neighborhood"], trip["drop_city"], trip["drop_neighborhood"]) == \
+        ("Hamdallaye", "Bamako", "Niarela")
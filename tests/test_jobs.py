@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "EXPORTS_DIR", str(tmp_path / "exports"))
+    monkeypatch.setattr(jobs, "_local", threading.local())
+    return jobs
+
+
+def test_enqueue_deduplicates_active_jobs(queue):
+    first = queue.enqueue("checkpoint")
+    assert queue.enqueue("checkpoint") == first
+    assert queue.enqueue("settle", {"weeks": 1}) != first
+
+
+def test_worker_stays_alive_during_a_long_job(queue, monkeypatch):
+    monkeypatch.setattr(queue, "WORKER_TTL_SECONDS", 0.3)
+    monkeypatch.setattr(queue, "HEARTBEAT_SECONDS", 0.05)
+    seen = []
+
+    def slow():
+        for _ in range(8):
+            time.sleep(0.1)
+            seen.append(queue.worker_alive())
+        return {}
+    monkeypatch.setitem(queue.JOBS, "slow", (slow, 60))
+
+    queue.enqueue("slow")
+    queue.run_worker(once=True, periodic=False)
+    assert all(seen)
+    assert not queue.worker_alive()  # deregistered on exit
+
+
+def test_purge_is_periodic_and_drops_old_runs(queue):
+    assert "purge" in queue.PERIODIC
+    old = queue.enqueue("checkpoint")
+    queue._db().execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                        (queue.DONE, time.time() - 30 * 86400, old))
+    recent = queue.enqueue("checkpoint")
+    queue._db().execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                        (queue.DONE, time.time(), recent))
+
+    assert queue.JOBS["purge"][0]() == {"deleted": 1}
+    assert queue.get_job(old) is None
+    assert queue.get_job(recent) is not None
+
+
+def test_purge_deletes_export_files(queue):
+    os.makedirs(queue.EXPORTS_DIR)
+
+    def export_file(name, age_days):
+        path = os.path.join(queue.EXPORTS_DIR, name)
+        with open(path, "w") as f:
+            f.write("trip_id\n")
+        stamp = time.time() - age_days * 86400
+        os.utime(path, (stamp, stamp))
+        return path
+
+    purged = queue.enqueue("export", {"kind": "trips"})
+    path = export_file(f"mali_ride_trips_{purged}.csv", 0)  # rewritten since, still the job's
+    queue._db().execute("UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE id = ?",
+                        (queue.DONE, time.time() - 30 * 86400, json.dumps({"path": path, "rows": 0}), purged))
+    orphan = export_file("mali_ride_trips_999.csv", 30)  # its job is long gone
+    kept = export_file("mali_ride_drivers_1000.csv", 0)
+
+    assert queue.purge() == 1
+    assert sorted(os.listdir(queue.EXPORTS_DIR)) == [os.path.basename(kept)]
+    assert not os.path.exists(orphan)
@@ -0,0 +1,56 @@
+import pytest
+
+import lazy_views
+
+
+@pytest.fixture(autouse=True)
+def small_cache(monkeypatch):
+    monkeypatch.setattr(lazy_views, "_cache", lazy_views.OrderedDict())
+    monkeypatch.setattr(lazy_views, "_cache_bytes", 0)
+    monkeypatch.setattr(lazy_views, "CACHE_BYTES", 10_000)
+    monkeypatch.setattr(lazy_views, "MAX_ENTRY_BYTES", 5_000)
+
+
+def test_cached_per_version_and_params():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return [1, 2, 3]
+    assert lazy_views.cached("x", 1, fn, {"city": "Bamako"}) == [1, 2, 3]
+    lazy_views.cached("x", 1, fn, {"city": "Bamako"})
+    lazy_views.cached("x", 2, fn, {"city": "Bamako"})
+    lazy_views.cached("x", 2, fn, {"city": "Kayes"})
+    assert len(calls) == 3
+
+
+def test_bounded_by_bytes_least_recently_used_first():
+    for i in range(20):
+        lazy_views.cached("blob", i, lambda: b"x" * 1_000)
+    assert lazy_views._cache_bytes <= lazy_views.CACHE_BYTES
+    versions = [key[1] for key in lazy_views._cache]
+    assert versions == sorted(versions) and versions[-1] == 19 and 0 not in versions
+
+
+def test_oversized_values_are_not_cached():
+    lazy_views.cached("big", 1, lambda: b"x" * 6_000)
+    assert not lazy_views._cache
+
+
+def test_dataframes_are_measured_deep():
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"name": ["a" * 100] * 10})
+    assert lazy_views.nbytes(df) >= 1_000
+
+
+def test_independent_misses_run_in_the_process_pool():
+    pytest.importorskip("pandas")
+    import os
+
+    out = lazy_views.compute({"a": (os.getpid,), "b": (os.getpid,), "here": os.getpid}, 1)
+    assert out["here"] == os.getpid()
+    assert os.getpid() not in (out["a"], out["b"])
+    assert list(out) == ["a", "b", "here"]
+    # a single pooled miss is not worth a round trip to the pool
+    assert lazy_views.compute({"c": (os.getpid,)}, 1)["c"] == os.getpid()
+    assert lazy_views.compute({"a": (os.getpid,), "b": (os.getpid,)}, 1) == {"a": out["a"], "b": out["b"]}
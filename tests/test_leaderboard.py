@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from conftest import make_driver, make_trip  # noqa: E402
+
+from leaderboard import Board, Leaderboard, period_key  # noqa: E402
+from core.schema import to_epoch_ms  # noqa: E402
+
+T0 = 1_700_000_000_000  # Tuesday 2023-11-14
+
+
+def _top(board, **kwargs):
+    df = board.top(at_ms=T0, **kwargs)
+    return list(zip(df["driver_username"], df[kwargs.get("metric", "driver_earnings_xof")]))
+
+
+def test_period_keys():
+    assert period_key("all", T0) == 0
+    assert period_key("week", T0) == period_key("week", to_epoch_ms("2023-11-13T00:00:00"))
+    assert period_key("week", T0) != period_key("week", to_epoch_ms("2023-11-12T23:59:59"))
+    assert period_key("month", T0) == period_key("month", to_epoch_ms("2023-11-01T00:00:00"))
+
+
+def test_board_ranks_and_moves():
+    board = Board()
+    board.add("a", {"trips_count": 1, "driver_earnings_xof": 100})
+    board.add("b", {"trips_count": 1, "driver_earnings_xof": 300})
+    assert [u for u, _ in board.top("driver_earnings_xof", 5)] == ["b", "a"]
+    board.add("a", {"trips_count": 1, "driver_earnings_xof": 250})
+    assert [u for u, _ in board.top("driver_earnings_xof", 1)] == ["a"]
+    board.add("b", {"trips_count": -1, "driver_earnings_xof": -300})  # its only trip left
+    assert [u for u, _ in board.top("driver_earnings_xof", 5)] == ["a"]
+
+
+def test_follows_bookings_reassignments_and_ratings(store):
+    store.save_driver_to_db(make_driver("drv1", first_name="Awa"))
+    store.save_driver_to_db(make_driver("drv2", first_name="Oumar", city="Kayes"))
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="drv1", driver_earnings_xof=1800))
+    live = Leaderboard.build()
+
+    store.save_trip_to_db(make_trip(trip_id="t2", driver_username="drv2", driver_earnings_xof=900))
+    store.save_trip_to_db(make_trip(trip_id="t3", driver_username="drv2", driver_earnings_xof=900,
+                                    created_at=T0 - 40 * 86_400_000))
+    store.update_trips_in_db({"t1": {"driver_username": "drv2"}})
+    store.update_driver_in_db("drv1", {"rating": 4.1})
+    live.refresh()
+
+    assert _top(live) == [("drv2", 3600)]
+    assert _top(live, period="month") == [("drv2", 2700)]
+    assert _top(live, city="Kayes") == []  # trips are counted in the trip's city
+    assert _top(live, metric="rating") == [("drv2", 5.0), ("drv1", 4.1)]
+    assert live.top(at_ms=T0)["driver_name"].tolist() == ["Oumar Traoré"]
+
+    rebuilt = Leaderboard.build()
+    for kwargs in ({}, {"period": "week"}, {"metric": "trips_count", "city": "Bamako"}):
+        assert _top(live, **kwargs) == _top(rebuilt, **kwargs)
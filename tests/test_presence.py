@@ -0,0 +1,31 @@
+from conftest import make_driver
+
+import presence
+from presence import OFFLINE, PresenceTracker
+
+
+def test_sweep_expires_in_one_commit(store, monkeypatch):
+    for i in range(20):
+        store.save_driver_to_db(make_driver(f"drv{i:02d}"))
+    tracker = PresenceTracker.build(ttl_seconds=60)
+    tracker.seen("drv00", 10**15)  # keeps beating
+    commits = []
+    real_commit = store._commit
+    monkeypatch.setattr(store, "_commit", lambda kind, ops: (commits.append(len(ops)), real_commit(kind, ops)))
+    offset = store.events_end_offset()
+
+    expired = tracker.sweep(now=10**14)
+
+    assert len(expired) == 19 and "drv00" not in expired
+    assert commits == [19]
+    events, _ = store.read_events(offset)
+    assert {e["data"]["username"] for e in events if e["type"] == "driver_status_changed"} == set(expired)
+    assert tracker.counts()[OFFLINE] == 19
+    assert {d["username"] for d in store.load_drivers_from_db() if d["status"] == OFFLINE} == set(expired)
+
+
+def test_get_presence_does_not_sweep(store, monkeypatch):
+    store.save_driver_to_db(make_driver("drv1"))
+    monkeypatch.setattr(presence, "_tracker", PresenceTracker.build(ttl_seconds=0))
+    monkeypatch.setattr(PresenceTracker, "sweep", lambda self, now=None: (_ for _ in ()).throw(AssertionError))
+    assert presence.get_presence().counts()["Available"] == 1
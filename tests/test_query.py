@@ -0,0 +1,54 @@
+from conftest import make_trip
+
+from core.schema import DAY_MS
+
+T0 = 1_700_000_000_000  # 2023-11-14 22:13:20 UTC
+
+
+def _fill(store):
+    trips = [
+        make_trip(trip_id="a", driver_username="drv1", routing_provider="osrm"),
+        make_trip(trip_id="b", driver_username="drv1", status="completed", created_at=T0 + DAY_MS),
+        make_trip(trip_id="c", driver_username="drv2", city="Kayes", price_xof=3000),
+        make_trip(trip_id="d", city="Timbuktu", created_at=T0 - 2 * DAY_MS),  # not a Mali shard city
+    ]
+    for trip in trips:
+        store.save_trip_to_db(trip)
+
+
+def _ids(query):
+    return sorted(t["trip_id"] for t in query)
+
+
+def test_filters_combine(store):
+    _fill(store)
+    q = store.query_trips
+
+    assert _ids(q()) == ["a", "b", "c", "d"]
+    assert _ids(q(city="Bamako")) == ["a", "b"]
+    assert _ids(q(city="Timbuktu")) == ["d"]
+    assert _ids(q(driver=["drv1", "drv2"], status="scheduled")) == ["a", "c"]
+    assert _ids(q(provider="osrm")) == ["a"]
+    assert _ids(q(date_range=("2023-11-15", None))) == ["b"]
+    assert _ids(q(created_range=(T0, T0 + 1))) == ["a", "c"]
+    assert _ids(q(date_range=("2023-11-14", "2023-11-15"), created_range=(T0 + 1, None))) == ["b"]
+
+
+def test_count_sum_columns_and_plan(store):
+    _fill(store)
+    query = store.query_trips(city=["Bamako", "Kayes"], status="scheduled", columns=["trip_id", "price_xof"])
+
+    assert query.count() == 2 and len(query) == 2
+    assert query.sum("price_xof") == 5000
+    assert sorted(query.records(), key=lambda t: t["trip_id"]) == [
+        {"trip_id": "a", "price_xof": 2000}, {"trip_id": "c", "price_xof": 3000},
+    ]
+    assert query.explain()[1] == "index: status"
+    assert store.query_trips(provider="osrm").explain()[1:] == ["scan", "filter: routing_provider"]
+
+
+def test_indexes_follow_writes(store):
+    _fill(store)
+    assert _ids(store.query_trips(status="completed")) == ["b"]
+    store.update_trips_in_db({"a": {"status": "completed"}})
+    assert _ids(store.query_trips(status="completed")) == ["a", "b"]
@@ -0,0 +1,56 @@
+from conftest import make_driver, make_trip
+
+from core.pricing import DRIVER_RATING_CANCEL_PENALTY, DRIVER_RATING_START, apply_rating
+
+
+def test_first_rating_replaces_the_placeholder():
+    assert apply_rating(DRIVER_RATING_START, 0, 3) == (3.0, 1)
+    assert apply_rating(None, None, 4) == (4.0, 1)
+
+
+def test_first_rating_keeps_cancellation_penalties():
+    penalized = DRIVER_RATING_START - 2 * DRIVER_RATING_CANCEL_PENALTY
+    rating, count = apply_rating(penalized, 0, 5)
+    assert count == 1
+    assert rating == round(5 - 2 * DRIVER_RATING_CANCEL_PENALTY, 2)
+    assert apply_rating(1.0, 0, 1) == (1.0, 1)  # never below the minimum
+
+
+def test_later_ratings_average():
+    assert apply_rating(4.0, 1, 5) == (4.5, 2)
+    assert apply_rating(4.5, 2, 9) == (4.67, 3)  # stars are clamped to 1-5
+
+
+def test_rate_trip_once(store):
+    store.save_driver_to_db(make_driver("drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t1", status="completed", driver_username="drv1"))
+
+    driver = store.rate_trip("t1", 4)
+    assert (driver["rating"], driver["rating_count"]) == (4.0, 1)
+    assert store.find_trip("t1")["passenger_rating"] == 4
+    assert store.rate_trip("t1", 1) is None
+    assert store.find_driver("drv1")["rating_count"] == 1
+
+
+def test_only_completed_trips_with_a_driver_are_rated(store):
+    store.save_driver_to_db(make_driver("drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t2", status="completed"))
+
+    assert store.rate_trip("t1", 5) is None
+    assert store.rate_trip("t2", 5) is None
+    assert store.rate_trip("missing", 5) is None
+    assert store.find_driver("drv1")["rating_count"] == 0
+
+
+def test_penalty_then_rating_replays_the_same(store):
+    from driver_state import audit, rebuild_driver_state
+
+    store.save_driver_to_db(make_driver("drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="drv1"))
+    store.save_trip_to_db(make_trip(trip_id="t2", status="completed", driver_username="drv1"))
+    store.cancel_trip("t1", "driver")
+    stored = store.rate_trip("t2", 5)
+
+    assert stored["rating"] < 5.0
+    assert audit(rebuild_driver_state()) == []
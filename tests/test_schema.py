@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from core.schema import (
+    SchemaError,
+    from_epoch_ms,
+    normalize_driver,
+    normalize_trip,
+    normalize_updates,
+    to_epoch_ms,
+    week_start_ms,
+)
+
+
+def test_timestamps_become_utc_epoch_ms():
+    ms = 1_700_000_000_000
+    assert to_epoch_ms("2023-11-14T22:13:20") == ms
+    assert to_epoch_ms("2023-11-14T22:13:20Z") == ms
+    assert to_epoch_ms("2023-11-14T23:13:20+01:00") == ms
+    assert to_epoch_ms(datetime(2023, 11, 14, 22, 13, 20)) == ms
+    assert to_epoch_ms(ms) == ms
+    assert to_epoch_ms("") is None
+    assert from_epoch_ms(ms) == datetime(2023, 11, 14, 22, 13, 20)
+    with pytest.raises(SchemaError):
+        to_epoch_ms(True)
+
+
+def test_week_starts_on_monday():
+    tuesday = to_epoch_ms("2023-11-14T22:13:20")
+    assert from_epoch_ms(week_start_ms(tuesday)) == datetime(2023, 11, 13)
+    assert week_start_ms(week_start_ms(tuesday)) == week_start_ms(tuesday)
+
+
+def test_normalize_trip_types_and_defaults():
+    trip = normalize_trip({
+        "trip_id": 7,
+        "created_at": "2023-11-14T22:13:20",
+        "price_xof": "2500.4",
+        "pickup_lat": "12.6",
+        "promo_code": " welcome50 ",
+        "extra": {"kept": True},
+    })
+    assert trip["created_at"] == 1_700_000_000_000
+    assert trip["scheduled_for"] is None
+    assert trip["status"] == "scheduled"
+    assert trip["price_xof"] == 2500 and trip["discount_xof"] == 0
+    assert trip["pickup_lat"] == 12.6 and trip["drop_lat"] is None
+    assert trip["trip_id"] == "7" and trip["driver_username"] == ""
+    assert trip["promo_code"] == "WELCOME50"
+    assert trip["extra"] == {"kept": True}
+
+
+@pytest.mark.parametrize("trip, field", [
+    ({"status": "lost"}, "status"),
+    ({"price_xof": "cheap"}, "price_xof"),
+    ({"pickup_lat": "north"}, "pickup_lat"),
+])
+def test_normalize_trip_rejects(trip, field):
+    with pytest.raises(SchemaError, match=field):
+        normalize_trip(trip)
+
+
+def test_normalize_driver():
+    driver = normalize_driver({"username": " awa ", "rating": "4.567", "age": "31"})
+    assert driver["username"] == "awa"
+    assert driver["status"] == "Available"
+    assert driver["rating"] == 4.57 and driver["age"] == 31 and driver["cancel_count"] == 0
+    assert normalize_driver({"username": "b"})["rating"] == 5.0
+    with pytest.raises(SchemaError, match="username"):
+        normalize_driver({"username": "  "})
+
+
+def test_normalize_updates_keeps_only_updated_fields():
+    trip = normalize_trip({"trip_id": "t1", "price_xof": 1000})
+    assert normalize_updates("trips", trip, {"price_xof": "1500", "status": "completed"}) == {
+        "price_xof": 1500, "status": "completed",
+    }
+
+
+def test_migration_stops_at_a_corrupt_shard(store):
+    import os
+
+    from conftest import make_trip
+    from core.schema import migrate_store
+
+    store.save_trip_to_db(make_trip(trip_id="t1"))
+    store.checkpoint()
+    path = store.shard_path("trips", "Bamako")
+    with open(path, "wb") as f:
+        f.write(b'[{"trip_id": "t1", "cit')
+    if os.path.exists(store.SCHEMA_VERSION_PATH):
+        os.remove(store.SCHEMA_VERSION_PATH)
+
+    with pytest.raises(ValueError, match="corrupt store file"):
+        migrate_store()
+    with open(path, "rb") as f:
+        assert f.read() == b'[{"trip_id": "t1", "cit'
+    assert not os.path.exists(store.SCHEMA_VERSION_PATH)
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from conftest import make_driver, make_trip  # noqa: E402
+
+import settlement  # noqa: E402
+from core.schema import WEEK_MS  # noqa: E402
+
+T0 = 1_700_000_000_000  # Tuesday 2023-11-14; its week starts on Monday 2023-11-13
+
+
+@pytest.fixture
+def week(store, monkeypatch):
+    monkeypatch.setattr(settlement, "_statements", {})
+    store.save_driver_to_db(make_driver("drv1", city="Kayes"))
+    for i, fields in enumerate([
+        {"driver_username": "drv1"},
+        {"driver_username": "drv1", "status": "completed"},
+        {"driver_username": "drv1", "status": "completed"},
+        {"driver_username": "drv1", "status": "cancelled_by_driver", "cancellation_fee_xof": 700},
+        {"driver_username": "drv2", "price_xof": 5000},
+        {"driver_username": "drv2", "status": "cancelled_by_passenger", "cancellation_fee_xof": 1500},
+        {"driver_username": ""},
+        {"driver_username": "drv1", "created_at": T0 + WEEK_MS},  # next week
+    ]):
+        store.save_trip_to_db(make_trip(trip_id=f"t{i}", **{"created_at": T0 + i, **fields}))
+    return store
+
+
+def test_statement_totals(week):
+    [path] = settlement.settle([T0], now=T0 + 3 * WEEK_MS)
+    statement = settlement.load_statement("2023-11-13")
+
+    assert path.endswith("2023-11-13.json")
+    assert statement["week_end"] == "2023-11-20"
+    drv1, drv2 = statement["drivers"]["drv1"], statement["drivers"]["drv2"]
+    assert (drv1["trips"], drv1["cancelled_by_driver"], drv1["gross_xof"]) == (3, 1, 6000)
+    assert (drv1["commission_pct"], drv1["commission_xof"], drv1["penalties_xof"]) == (14, 840, 700)
+    assert drv1["net_payout_xof"] == 6000 - 840 - 700
+    assert drv1["city"] == "Kayes"
+    assert (drv2["trips"], drv2["gross_xof"], drv2["net_payout_xof"]) == (1, 5000, 4300)
+    assert statement["totals"] == {
+        "drivers": 2, "trips": 4, "cancelled_by_driver": 1, "gross_xof": 11000,
+        "penalties_xof": 700, "commission_xof": 1540, "net_payout_xof": 8760,
+    }
+
+
+def test_statements_are_written_once_and_only_for_ended_weeks(week):
+    assert len(settlement.settle([T0, T0 + WEEK_MS], now=T0 + WEEK_MS)) == 1  # the second week is running
+    path = settlement.statement_path(settlement.week_start_ms(T0))
+    first = week._read_json(path)
+    week.save_trip_to_db(make_trip(trip_id="late", driver_username="drv1", created_at=T0 + 10))
+
+    assert settlement.settle([T0], now=T0 + 3 * WEEK_MS) == []
+    assert week._read_json(path) == first
+    assert settlement.driver_statements("drv1")["gross_xof"].tolist() == [6000]
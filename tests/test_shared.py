@@ -0,0 +1,105 @@
+import threading
+
+from conftest import make_driver, make_trip
+
+
+def _ids(trips):
+    return [t["trip_id"] for t in trips]
+
+
+def test_update_by_trip_id_survives_bookings_into_earlier_shards(store):
+    store.save_trip_to_db(make_trip(city="Kayes", trip_id="kayes-1"))
+    store.save_trip_to_db(make_trip(city="Kayes", trip_id="kayes-2"))
+    # a booking in Bamako (an earlier shard) between reading and writing
+    store.save_trip_to_db(make_trip(city="Bamako", trip_id="bko-1"))
+    store.update_trips_in_db({"kayes-2": {"driver_username": "drv1"}})
+
+    by_id = {t["trip_id"]: t for t in store.load_trips_from_db()}
+    assert by_id["kayes-2"]["driver_username"] == "drv1"
+    assert by_id["kayes-1"]["driver_username"] == ""
+    assert by_id["bko-1"]["driver_username"] == ""
+
+
+def test_update_unknown_trip_is_ignored(store):
+    store.save_trip_to_db(make_trip(trip_id="t1"))
+    assert store.update_trips_in_db({"nope": {"price_xof": 1}}) == {}
+    assert store.find_trip("t1")["price_xof"] == 2000
+
+
+def test_callable_update_sees_current_trip(store):
+    store.save_trip_to_db(make_trip(trip_id="t1"))
+    store.update_trips_in_db({"t1": {"status": "completed"}})
+    found = store.update_trips_in_db({"t1": lambda trip: {"price_xof": 1} if trip["status"] == "scheduled" else None})
+    assert found["t1"]["price_xof"] == 2000
+
+
+def test_concurrent_cancellations_charge_once(store):
+    store.save_driver_to_db(make_driver("drv1", rating=4.0))
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="drv1"))
+    threads = [threading.Thread(target=store.cancel_trip, args=("t1", "driver")) for _ in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    assert store.find_trip("t1")["status"] == "cancelled_by_driver"
+    penalties = [e for e in store.read_events(0)[0] if e["type"] == "driver_cancellation_penalty"]
+    assert len(penalties) == 1
+
+
+def test_cancel_trip_twice_returns_trip_unchanged(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", scheduled_for=None))
+    first = store.cancel_trip("t1", "passenger")
+    second = store.cancel_trip("t1", "passenger")
+    assert first["status"] == second["status"] == "cancelled_by_passenger"
+    assert store.cancel_trip("missing", "passenger") is None
+
+
+def test_city_move_is_logged(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", city="Bamako"))
+    offset = store.events_end_offset()
+    store.update_trips_in_db({"t1": {"city": "Kayes"}})
+
+    assert [t["trip_id"] for t in store.load_trips_from_db(cities=["Kayes"])] == ["t1"]
+    assert store.load_trips_from_db(cities=["Bamako"]) == []
+    events, _ = store.read_events(offset)
+    assert [(e["type"], e["data"]["before"], e["data"]["after"]) for e in events] == [
+        ("trip_updated", {"city": "Bamako"}, {"city": "Kayes"}),
+    ]
+
+
+def test_checkpoint_refuses_to_overwrite_a_corrupt_shard(store):
+    import pytest
+
+    store.save_trip_to_db(make_trip(trip_id="t1"))
+    store.checkpoint()
+    path = store.shard_path("trips", "Bamako")
+    with open(path, "wb") as f:
+        f.write(b'[{"trip_id": "t1", "cit')
+    store.save_trip_to_db(make_trip(trip_id="t2"))
+
+    with pytest.raises(ValueError, match="corrupt store file"):
+        store.checkpoint()
+    with open(path, "rb") as f:
+        assert f.read() == b'[{"trip_id": "t1", "cit'  # left for repair
+    assert [op["rec"]["trip_id"] for op in store._wal.pending("trips", "Bamako")] == ["t2"]
+
+
+def test_shards_with_pending_records_are_streamed(store, monkeypatch):
+    for i in range(4):
+        store.save_trip_to_db(make_trip(trip_id=f"t{i}"))
+    store.checkpoint()
+    store.update_trips_in_db({"t1": {"price_xof": 2500}, "t2": {"city": "Kayes"}})
+    store.save_trip_to_db(make_trip(trip_id="t4"))
+    expected = store.load_trips_from_db()
+
+    def read_whole(path):
+        raise AssertionError(f"{path} read whole")
+
+    monkeypatch.setattr(store, "read_shard", read_whole)
+    streamed = [t for chunk in store.iter_records("trips", chunk_size=2) for t in chunk]
+
+    assert streamed == expected
+    assert _ids(streamed) == ["t0", "t1", "t3", "t4", "t2"]
+    assert streamed[1]["price_xof"] == 2500
+    assert store.trip_shards() == {"t0": "Bamako", "t1": "Bamako", "t3": "Bamako", "t4": "Bamako", "t2": "Kayes"}
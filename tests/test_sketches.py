@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("pandas")
+
+from conftest import make_trip  # noqa: E402
+
+from sketches import QuantileSketch, TripSketches  # noqa: E402
+
+DAY = "2023-11-14"  # created_at of make_trip()
+
+
+def test_quantiles_within_relative_accuracy():
+    sketch = QuantileSketch()
+    sketch.add_many(list(range(1, 1001)))
+    assert sketch.quantile(0.5) == pytest.approx(500, rel=0.01)
+    assert sketch.quantile(0.99) == pytest.approx(990, rel=0.01)
+
+
+def test_remove_takes_back_an_add():
+    sketch = QuantileSketch()
+    for value in (0, 10, 10, 2000):
+        sketch.add(value)
+    sketch.remove(10)
+    sketch.remove(0)
+    sketch.remove(5)  # never added: ignored
+    assert sketch.count == 2
+    assert sketch.quantile(0) == pytest.approx(10, rel=0.01)
+
+
+def test_refresh_follows_updates_moves_and_reassignments(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", price_xof=1000, distance_miles=2.0))
+    store.save_trip_to_db(make_trip(trip_id="t2", price_xof=3000, distance_miles=6.0))
+    sketches = TripSketches()
+    sketches.refresh()
+
+    store.update_trips_in_db({"t1": {"price_xof": 5000}})
+    store.update_trips_in_db({"t2": {"city": "Kayes", "driver_username": "drv1"}})
+    store.cancel_trip("t1", "passenger")
+    sketches.refresh()
+
+    bamako = sketches.summary(cities=["Bamako"], start_date=DAY, end_date=DAY)
+    kayes = sketches.summary(cities=["Kayes"], start_date=DAY, end_date=DAY)
+    assert bamako["price_xof_p50"] == pytest.approx(5000, rel=0.01)
+    assert bamako["distance_miles_p50"] == pytest.approx(2.0, rel=0.01)
+    assert kayes["price_xof_p50"] == pytest.approx(3000, rel=0.01)
+    assert kayes["distance_miles_p50"] == pytest.approx(6.0, rel=0.01)
+    assert kayes["distinct_drivers"] == 1
+    assert sketches.merged()["price_xof"].count == 2
+
+
+def test_build_and_refresh_agree(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", price_xof=1000))
+    store.save_trip_to_db(make_trip(trip_id="t2", price_xof=3000))
+    live = TripSketches.build()
+    store.update_trips_in_db({"t2": {"city": "Kayes", "price_xof": 4000}})
+    live.refresh()
+
+    rebuilt = TripSketches.build()
+    for cities in (["Bamako"], ["Kayes"]):
+        assert live.summary(cities=cities) == rebuilt.summary(cities=cities)
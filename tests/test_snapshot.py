@@ -0,0 +1,81 @@
+import pytest
+
+pytest.importorskip("pandas")
+
+from conftest import make_driver, make_trip  # noqa: E402
+
+import snapshot  # noqa: E402
+from aggregation import trip_aggregates, trip_facets  # noqa: E402
+from events import LiveAggregates  # noqa: E402
+
+
+def _fill(store):
+    store.save_trip_to_db(make_trip(trip_id="t1", driver_username="awa", promo_code="TABASKI"))
+    store.save_trip_to_db(make_trip(trip_id="t2", city="Kayes", price_xof=3500, routing_provider="osrm"))
+    store.save_trip_to_db(make_trip(trip_id="t3", created_at=1_700_100_000_000, client_app="ios"))
+    store.save_driver_to_db(make_driver("awa"))
+
+
+def test_aggregates_match_the_shards(store):
+    _fill(store)
+    snap = snapshot.get_snapshot()
+
+    assert snap.n_rows == 3
+    assert snap.aggregates["trips"] == trip_aggregates()
+    assert snap.aggregates["facets"] == trip_facets()
+    assert snap.aggregates["drivers"]["n_drivers"] == 1
+
+
+def test_version_follows_trip_events_only(store):
+    _fill(store)
+    version = snapshot.get_snapshot().version
+
+    store.update_driver_in_db("awa", {"status": "Offline"})
+    assert snapshot.store_version() == version
+    assert snapshot.get_snapshot().version == version
+
+    store.update_trips_in_db({"t1": {"price_xof": 2500}})
+    assert snapshot.store_version() > version
+    assert snapshot.get_snapshot().aggregates["trips"]["gross_xof"] == 2500 + 3500 + 2000
+
+
+def test_version_survives_a_new_process(store):
+    _fill(store)
+    version = snapshot.get_snapshot().version
+    store.update_driver_in_db("awa", {"status": "Offline"})
+
+    snapshot._scanned = (0, 0)  # starts from the offsets in the snapshot header
+    assert snapshot.store_version() == version
+
+
+def test_readers_tail_driver_events_written_after_the_build(store):
+    _fill(store)
+    snapshot.get_snapshot()
+    store.update_driver_in_db("awa", {"status": "Offline"})
+
+    live = LiveAggregates.build()
+    live.refresh()
+    assert live.n_drivers == 1
+    assert {k: v for k, v in live.drivers_by_status.items() if v} == {"Offline": 1}
+
+
+def test_trip_booked_during_the_build_is_counted_once(store, monkeypatch):
+    _fill(store)
+    collect = snapshot._collect_columns
+    booked = []
+
+    def collect_after_a_booking():
+        if not booked:
+            booked.append(True)
+            store.save_trip_to_db(make_trip(trip_id="t4"))
+        return collect()
+
+    monkeypatch.setattr(snapshot, "_collect_columns", collect_after_a_booking)
+    snapshot.build_snapshot()
+    snap = snapshot.Snapshot(snapshot.SNAPSHOT_PATH)
+    # what a reader mapping this snapshot replays on top of it
+    events, _ = store.read_events(snap.offset)
+
+    assert snap.n_rows == 4
+    assert not [e for e in events if e["type"] == "trip_booked"]
+    assert snap.version == snapshot.store_version()
@@ -0,0 +1,78 @@
+import os
+import random
+
+import pytest
+
+from core.wal import WriteAheadLog, apply_ops, iter_applied
+
+
+def test_apply_ops_put_set_del():
+    records = [{"id": "a", "x": 1}, {"id": "b", "x": 2}]
+    ops = [
+        {"op": "set", "key": "a", "fields": {"x": 10}},
+        {"op": "put", "rec": {"id": "c", "x": 3}},
+        {"op": "del", "key": "b"},
+        {"op": "put", "rec": {"id": "a", "x": 11}},
+        {"op": "set", "key": "missing", "fields": {"x": 0}},
+    ]
+    assert apply_ops(records, ops, "id") == [{"id": "a", "x": 11}, {"id": "c", "x": 3}]
+    assert records == [{"id": "a", "x": 1}, {"id": "b", "x": 2}]  # input untouched
+
+
+def test_replaying_ops_is_idempotent():
+    ops = [{"op": "put", "rec": {"id": "a", "x": 1}}, {"op": "set", "key": "a", "fields": {"x": 2}}]
+    once = apply_ops([], ops, "id")
+    assert apply_ops(once, ops, "id") == once
+
+
+def test_iter_applied_matches_apply_ops():
+    rng = random.Random(5)
+    keys = "abcdef"
+    for _ in range(300):
+        records = [{"id": k, "x": 0} for k in rng.sample(keys, 3)]
+        ops = []
+        for i in range(rng.randint(0, 8)):
+            key = rng.choice(keys)
+            ops.append(rng.choice([
+                {"op": "put", "rec": {"id": key, "x": i}},
+                {"op": "set", "key": key, "fields": {"x": i, "y": i}},
+                {"op": "del", "key": key},
+            ]))
+        assert list(iter_applied(iter(records), ops, "id")) == apply_ops(records, ops, "id")
+
+
+def _log(tmp_path, folded):
+    def fold(ops):
+        for key, records in ops.items():
+            folded.setdefault(key, []).extend(records)
+    return WriteAheadLog(str(tmp_path / "store.wal"), fold)
+
+
+def test_commit_pending_and_checkpoint(tmp_path):
+    folded = {}
+    wal = _log(tmp_path, folded)
+    wal.commit([{"kind": "trips", "shard": "Bamako", "op": "put", "rec": {"trip_id": "t1"}}])
+    assert [r["rec"]["trip_id"] for r in wal.pending("trips", "Bamako")] == ["t1"]
+
+    assert wal.checkpoint()
+    assert list(folded) == [("trips", "Bamako")]
+    assert wal.pending("trips", "Bamako") == []
+
+
+def test_recovery_drops_torn_tail(tmp_path):
+    path = tmp_path / "store.wal"
+    path.write_bytes(b'{"kind": "trips", "shard": "Kayes", "op": "del", "key": "t1"}\n{"kind": "tr')
+    folded = {}
+    _log(tmp_path, folded).recover()
+    assert [r["key"] for r in folded[("trips", "Kayes")]] == ["t1"]
+    assert os.path.getsize(path) == 0
+
+
+def test_failed_fold_keeps_the_log(tmp_path):
+    def fold(ops):
+        raise ValueError("corrupt")
+    wal = WriteAheadLog(str(tmp_path / "store.wal"), fold)
+    wal.commit([{"kind": "trips", "shard": "Bamako", "op": "put", "rec": {"trip_id": "t1"}}])
+    with pytest.raises(ValueError):
+        wal.checkpoint()
+    assert len(wal.pending("trips", "Bamako")) == 1